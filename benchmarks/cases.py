@@ -0,0 +1,325 @@
+"""
+Cas de benchmark: préparation des données synthétiques et étapes mesurées.
+
+Chaque cas a une préparation (non mesurée) et une partie mesurée qui
+retourne le nombre d'éléments traités (lignes, interactions, requêtes…),
+pour calculer un débit comparable d'une échelle à l'autre.
+
+Les données de chaque échelle sont générées une fois par
+generate_synthetic_listens.py puis passées dans le pipeline (parse →
+agrégation → matrice → split → modèle), et mises en cache dans
+benchmarks/.cache/<échelle>/.
+"""
+import contextlib
+import io
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Callable, Dict, NamedTuple
+
+import numpy as np
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT / "scripts"))
+sys.path.insert(0, str(ROOT / "src"))
+
+# tqdm lit ses variables TQDM_* à l'import: à fixer avant tout import des scripts
+os.environ.setdefault('TQDM_DISABLE', '1')
+
+CACHE_DIR = Path(__file__).parent / ".cache"
+
+# Écoutes générées par échelle
+SCALES = {
+    'small': 20_000,
+    'medium': 200_000,
+    'large': 2_000_000,
+}
+
+N_QUERIES = 1_000
+SEED = 42
+
+
+@contextlib.contextmanager
+def quiet():
+    """Coupe les print des fonctions mesurées."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+# ──────────────────────────────────────────────
+# Données par échelle
+# ──────────────────────────────────────────────
+
+def prepare_scale(scale: str, cache_dir: Path = CACHE_DIR) -> Path:
+    """
+    Génère (si absent) le jeu de données d'une échelle et ses dérivés:
+    dumps, listens_raw, listens + mappings, matrice, split, modèle.
+    """
+    from aggregate_data import aggregate_listens
+    from build_matrix import build_sparse_matrix, create_train_test_split
+    from generate_synthetic_listens import generate_dataset
+    from models.als_model import ALSRecommender
+    from parse_listens import parse_all_listens
+    from scipy import sparse
+
+    data_dir = cache_dir / scale
+    done = data_dir / "prepared.json"
+    if done.exists():
+        return data_dir
+
+    with quiet():
+        generate_dataset(data_dir / "dumps", n_listens=SCALES[scale], fmt='files', seed=SEED)
+        parse_all_listens(data_dir / "dumps", data_dir)
+        aggregate_listens(data_dir / "listens_raw.parquet", data_dir / "listens.parquet",
+                          id_dicts_dir=None)
+        matrix = build_sparse_matrix(data_dir / "listens.parquet", data_dir / "user_item_matrix.npz",
+                                     id_dicts_dir=None)
+        train, test = create_train_test_split(matrix)
+        sparse.save_npz(data_dir / "train_matrix.npz", train)
+        sparse.save_npz(data_dir / "test_matrix.npz", test)
+        model = ALSRecommender(factors=64, iterations=10)
+        model.fit(train, show_progress=False)
+        model.load_mappings(data_dir / "user_mapping.json", data_dir / "item_mapping.json")
+        model.save(data_dir / "als_model.pkl")
+
+    with open(done, 'w', encoding='utf-8') as f:
+        json.dump({'listens': SCALES[scale], 'seed': SEED,
+                   'users': int(matrix.shape[0]), 'items': int(matrix.shape[1]),
+                   'nnz': int(matrix.nnz)}, f)
+    return data_dir
+
+
+def _listen_lines(data_dir: Path) -> list:
+    lines = []
+    for path in sorted((data_dir / "dumps").rglob("*.listens")):
+        with open(path, encoding='utf-8') as f:
+            lines.extend(f)
+    return lines
+
+
+def _track_keys(data_dir: Path) -> list:
+    with open(data_dir / "mappings.json", encoding='utf-8') as f:
+        track_to_id = json.load(f)['track_to_id']
+    return sorted(track_to_id, key=track_to_id.get)
+
+
+def _model(data_dir: Path):
+    from models.als_model import ALSRecommender
+    from scipy import sparse
+
+    train = sparse.load_npz(data_dir / "train_matrix.npz").tocsr()
+    with quiet():
+        model = ALSRecommender.load(data_dir / "als_model.pkl", user_item_matrix=train)
+    return model, train
+
+
+def _sample(n: int, size: int = N_QUERIES) -> list:
+    rng = np.random.default_rng(SEED)
+    return rng.choice(n, size=min(size, n), replace=False).tolist()
+
+
+# ──────────────────────────────────────────────
+# Cas mesurés: setup(data_dir, tmp_dir) → run() → éléments traités
+# ──────────────────────────────────────────────
+
+def parse_listen_line(data_dir: Path, tmp_dir: Path):
+    from parse_listens import parse_listen_line as parse
+
+    lines = _listen_lines(data_dir)
+
+    def run():
+        for line in lines:
+            parse(line)
+        return len(lines)
+    return run
+
+
+def deduplicate_tracks(data_dir: Path, tmp_dir: Path):
+    from deduplicate_tracks import deduplicate_tracks as dedup
+
+    keys = _track_keys(data_dir)
+
+    def run():
+        dedup(output_file=tmp_dir / "track_dedup_map.json", track_keys=keys)
+        return len(keys)
+    return run
+
+
+def aggregate_listens(data_dir: Path, tmp_dir: Path):
+    from aggregate_data import aggregate_listens as aggregate
+
+    manifest = json.loads((data_dir / "listens_raw.parquet" / "_manifest.json").read_text())
+
+    def run():
+        aggregate(data_dir / "listens_raw.parquet", tmp_dir / "listens.parquet", id_dicts_dir=None)
+        return manifest['rows']
+    return run
+
+
+def build_sparse_matrix(data_dir: Path, tmp_dir: Path):
+    from build_matrix import build_sparse_matrix as build
+
+    def run():
+        return build(data_dir / "listens.parquet", tmp_dir / "matrix.npz", id_dicts_dir=None).nnz
+    return run
+
+
+def create_train_test_split(data_dir: Path, tmp_dir: Path):
+    from build_matrix import create_train_test_split as split
+    from scipy import sparse
+
+    matrix = sparse.load_npz(data_dir / "user_item_matrix.npz").tocsr()
+
+    def run():
+        split(matrix)
+        return matrix.nnz
+    return run
+
+
+def als_fit(data_dir: Path, tmp_dir: Path):
+    from models.als_model import ALSRecommender
+    from scipy import sparse
+
+    train = sparse.load_npz(data_dir / "train_matrix.npz").tocsr()
+
+    def run():
+        ALSRecommender(factors=64, iterations=10).fit(train, show_progress=False)
+        return train.nnz
+    return run
+
+
+def recommend(data_dir: Path, tmp_dir: Path):
+    model, train = _model(data_dir)
+    users = _sample(train.shape[0])
+
+    def run():
+        for user_id in users:
+            model.recommend(user_id, n=20)
+        return len(users)
+    return run
+
+
+def recommend_batch(data_dir: Path, tmp_dir: Path):
+    model, train = _model(data_dir)
+    users = _sample(train.shape[0])
+
+    def run():
+        model.recommend_batch(users, n=20)
+        return len(users)
+    return run
+
+
+def similar_items(data_dir: Path, tmp_dir: Path):
+    model, train = _model(data_dir)
+    items = _sample(train.shape[1])
+
+    def run():
+        for item_id in items:
+            model.similar_items(item_id, n=20)
+        return len(items)
+    return run
+
+
+def _response_inputs(data_dir: Path, n: int = 100):
+    """Tableaux (item_ids, scores) top-n des utilisateurs échantillonnés et table des tracks."""
+    from api.tracks import TrackTable
+
+    model, train = _model(data_dir)
+    users = _sample(train.shape[0])
+    item_ids, scores = model.recommend_arrays(users, n)
+    tracks = TrackTable.from_item_mapping(model.item_mapping, train.shape[1])
+    return users, item_ids, scores, tracks
+
+
+def response_pydantic(data_dir: Path, tmp_dir: Path):
+    """
+    Chemin d'avant l'encodage direct: dicts → TrackRecommendation(**r) →
+    revalidation du response_model et encodage par FastAPI (TypeAdapter +
+    JSONResponse, comme serialize_response).
+    """
+    from fastapi.responses import JSONResponse
+    from pydantic import TypeAdapter
+    from api.responses import track_records
+    with quiet():
+        from api.main import RecommendationResponse, TrackRecommendation
+
+    users, item_ids, scores, tracks = _response_inputs(data_dir)
+    adapter = TypeAdapter(RecommendationResponse)
+
+    def run():
+        for i, user_id in enumerate(users):
+            records = track_records(tracks, item_ids[i], scores[i])
+            response = RecommendationResponse(
+                user_id=str(user_id), recommendations=[TrackRecommendation(**r) for r in records])
+            value = adapter.validate_python(response, from_attributes=True)
+            JSONResponse(adapter.dump_python(value, mode="json")).body
+        return len(users)
+    return run
+
+
+def response_fast(data_dir: Path, tmp_dir: Path):
+    """Encodage direct des tableaux en JSON (responses.recommendation_json)."""
+    from api.responses import recommendation_json
+
+    users, item_ids, scores, tracks = _response_inputs(data_dir)
+
+    def run():
+        for i, user_id in enumerate(users):
+            recommendation_json(str(user_id), tracks, item_ids[i], scores[i])
+        return len(users)
+    return run
+
+
+def catalog_search(data_dir: Path, tmp_dir: Path):
+    from api.catalog import CatalogService
+
+    keys = _track_keys(data_dir)
+    catalog = CatalogService()
+    catalog._build_catalog({k: k for k in keys}, {k: i for i, k in enumerate(keys)})
+    rng = np.random.default_rng(SEED)
+    queries = []
+    for i in rng.choice(len(keys), size=min(200, len(keys)), replace=False):
+        words = keys[i].split(' - ', 1)[-1].split()
+        queries.append(words[0][:4] if words else keys[i][:4])
+
+    def run():
+        for query in queries:
+            catalog.search(query)
+        return len(queries)
+    return run
+
+
+def evaluate_model(data_dir: Path, tmp_dir: Path):
+    from evaluate import evaluate_model as evaluate
+    from scipy import sparse
+
+    model, train = _model(data_dir)
+    test = sparse.load_npz(data_dir / "test_matrix.npz").tocsr()
+
+    def run():
+        evaluate(model, train, test, n_users_sample=N_QUERIES)
+        return min(N_QUERIES, int((np.diff(test.indptr) > 0).sum()))
+    return run
+
+
+class Case(NamedTuple):
+    setup: Callable
+    unit: str
+
+
+CASES: Dict[str, Case] = {
+    'parse_listen_line': Case(parse_listen_line, 'lignes'),
+    'deduplicate_tracks': Case(deduplicate_tracks, 'titres'),
+    'aggregate_listens': Case(aggregate_listens, 'écoutes'),
+    'build_sparse_matrix': Case(build_sparse_matrix, 'interactions'),
+    'create_train_test_split': Case(create_train_test_split, 'interactions'),
+    'als_fit': Case(als_fit, 'interactions'),
+    'recommend': Case(recommend, 'utilisateurs'),
+    'recommend_batch': Case(recommend_batch, 'utilisateurs'),
+    'similar_items': Case(similar_items, 'items'),
+    'catalog_search': Case(catalog_search, 'requêtes'),
+    'response_pydantic': Case(response_pydantic, 'réponses'),
+    'response_fast': Case(response_fast, 'réponses'),
+    'evaluate_model': Case(evaluate_model, 'utilisateurs'),
+}
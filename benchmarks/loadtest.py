@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+Test de charge HTTP de l'API de recommandation (src/api/main.py).
+
+Démarre l'API en local (uvicorn) sur un modèle synthétique (voir cases.py),
+puis rejoue un mélange réaliste de requêtes (/recommend, /similar, /history,
+/catalog/search, /catalog/tracks, bibliothèque) avec un pool de clients httpx
+asynchrones, à plusieurs niveaux de concurrence.
+
+Pour chaque endpoint et chaque niveau: débit (req/s), latences p50/p95/p99/max,
+taux d'erreurs et histogramme des latences; pour le serveur: RSS au repos et
+pic de RSS pendant la charge. Le rapport complet peut être écrit en JSON
+(--output) pour comparer deux réglages.
+
+/catalog/cover est exclu du mélange (appels Deezer/iTunes externes).
+
+Usage:
+  python benchmarks/loadtest.py
+  python benchmarks/loadtest.py --scale medium --concurrency 1 16 64 --duration 30
+  python benchmarks/loadtest.py --url http://localhost:8000 --concurrency 8   # serveur déjà lancé
+  python benchmarks/loadtest.py --output /tmp/loadtest.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import httpx
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent))
+from cases import CACHE_DIR, ROOT, SCALES, SEED, prepare_scale  # noqa: E402
+
+DEFAULT_CONCURRENCY = [1, 8, 32]
+DURATION = 15.0
+WARMUP = 2.0
+STARTUP_TIMEOUT = 120.0
+RSS_INTERVAL = 0.2
+
+# Bornes supérieures des classes de l'histogramme (ms)
+HIST_BOUNDS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, float('inf')]
+
+
+# ──────────────────────────────────────────────
+# Mélange de requêtes
+# ──────────────────────────────────────────────
+
+class Workload:
+    """Identifiants réels du modèle servi, pour construire des requêtes valides."""
+
+    def __init__(self, mappings_path: Path, n_library_users: int = 50):
+        with open(mappings_path, encoding='utf-8') as f:
+            mappings = json.load(f)
+        self.users = list(mappings['user_to_id'])
+        self.tracks = list(mappings['track_to_id'].items())
+        self.n_items = len(self.tracks)
+        self.library_users = [f"loadtest-{i}" for i in range(n_library_users)]
+        words = {w.lower() for name, _ in self.tracks[:5000] for w in name.split() if len(w) >= 4}
+        self.queries = sorted(w[:4] for w in words) or ["a"]
+
+
+class Request(NamedTuple):
+    method: str
+    url: str
+    json: Optional[dict] = None
+
+
+def _track_payload(rng: random.Random, w: Workload) -> dict:
+    name, item_id = rng.choice(w.tracks)
+    artist, _, title = name.partition(" - ")
+    return {"item_id": item_id, "artist": artist, "title": title or name, "canonical_name": name}
+
+
+def req_recommend(rng, w):
+    return Request("GET", f"/recommend/{rng.choice(w.users)}?n={rng.choice([10, 20, 50])}")
+
+
+def req_similar(rng, w):
+    return Request("GET", f"/similar/{rng.randrange(w.n_items)}?n={rng.choice([10, 20])}")
+
+
+def req_history(rng, w):
+    return Request("GET", f"/history/{rng.choice(w.users)}?n=20")
+
+
+def req_catalog_search(rng, w):
+    return Request("GET", f"/catalog/search?q={rng.choice(w.queries)}&limit=24")
+
+
+def req_catalog_tracks(rng, w):
+    return Request("GET", f"/catalog/tracks?page={rng.randrange(20)}&size=48")
+
+
+def req_library_read(rng, w):
+    user = rng.choice(w.library_users)
+    return Request("GET", f"/library/{user}/{rng.choice(['likes', 'playlists'])}")
+
+
+def req_library_like(rng, w):
+    return Request("POST", f"/library/{rng.choice(w.library_users)}/likes", _track_payload(rng, w))
+
+
+# endpoint → (poids dans le mélange, constructeur de requête)
+MIX: Dict[str, tuple] = {
+    'recommend': (30, req_recommend),
+    'similar': (20, req_similar),
+    'history': (15, req_history),
+    'catalog_search': (12, req_catalog_search),
+    'catalog_tracks': (8, req_catalog_tracks),
+    'library_read': (10, req_library_read),
+    'library_like': (5, req_library_like),
+}
+
+
+# ──────────────────────────────────────────────
+# Serveur local
+# ──────────────────────────────────────────────
+
+def process_rss_mb(pid: int) -> Optional[float]:
+    """RSS courant d'un process (Linux, /proc); None si indisponible."""
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class LocalServer:
+    """API lancée avec uvicorn sur les fichiers d'une échelle synthétique."""
+
+    def __init__(self, data_dir: Path, work_dir: Path):
+        self.data_dir = data_dir
+        self.work_dir = work_dir
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.log_path = work_dir / "server.log"
+        self.process: Optional[subprocess.Popen] = None
+
+    def __enter__(self) -> "LocalServer":
+        env = dict(
+            os.environ,
+            S3_BUCKET_MODEL="",
+            MODEL_PATH=str(self.data_dir / "als_model.pkl"),
+            MATRIX_PATH=str(self.data_dir / "user_item_matrix.npz"),
+            MAPPINGS_PATH=str(self.data_dir / "mappings.json"),
+            CATALOG_PATH=str(self.data_dir / "track_dedup_map.json"),
+            LIBRARY_PATH=str(self.work_dir / "library.json"),
+        )
+        cmd = [sys.executable, "-m", "uvicorn", "api.main:app", "--app-dir", str(ROOT / "src"),
+               "--host", "127.0.0.1", "--port", str(self.port),
+               "--log-level", "warning", "--no-access-log"]
+        self.log = open(self.log_path, 'w', encoding='utf-8')
+        self.process = subprocess.Popen(cmd, env=env, stdout=self.log, stderr=subprocess.STDOUT,
+                                        cwd=self.work_dir)
+        try:
+            self._wait_ready()
+        except Exception:
+            self.__exit__(None, None, None)
+            raise
+        return self
+
+    def _wait_ready(self):
+        deadline = time.time() + STARTUP_TIMEOUT
+        with httpx.Client(base_url=self.url, timeout=5.0) as client:
+            while True:
+                if self.process.poll() is not None:
+                    raise RuntimeError(f"Le serveur s'est arrêté au démarrage:\n{self.log_path.read_text()[-2000:]}")
+                try:
+                    client.get("/health")
+                    break
+                except httpx.TransportError:
+                    if time.time() > deadline:
+                        raise TimeoutError(f"Serveur non prêt après {STARTUP_TIMEOUT:.0f}s")
+                    time.sleep(0.2)
+            # startup_event ne charge pas le modèle: /reload comme en production
+            client.post("/reload", timeout=STARTUP_TIMEOUT).raise_for_status()
+            health = client.get("/health").json()
+            if not health.get("model_loaded"):
+                raise RuntimeError(f"Modèle non chargé: {health}")
+
+    def rss_mb(self) -> Optional[float]:
+        return process_rss_mb(self.process.pid)
+
+    def __exit__(self, *exc):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.log.close()
+
+
+# ──────────────────────────────────────────────
+# Génération de charge
+# ──────────────────────────────────────────────
+
+async def sample_rss(rss: Callable[[], Optional[float]], samples: List[float], stop: asyncio.Event):
+    while not stop.is_set():
+        value = rss()
+        if value is not None:
+            samples.append(value)
+        try:
+            await asyncio.wait_for(stop.wait(), RSS_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_level(
+    url: str,
+    workload: Workload,
+    concurrency: int,
+    duration: float = DURATION,
+    warmup: float = WARMUP,
+    rss: Optional[Callable[[], Optional[float]]] = None,
+    seed: int = SEED
+) -> dict:
+    """
+    Lance `concurrency` clients en boucle fermée pendant warmup + duration secondes.
+    Seules les requêtes terminées après le warmup sont comptées.
+    """
+    names = list(MIX)
+    weights = [MIX[name][0] for name in names]
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    start = time.perf_counter()
+    measure_from = start + warmup
+    deadline = measure_from + duration
+
+    async def client_loop(client: httpx.AsyncClient, index: int):
+        rng = random.Random(seed * 1000 + index)
+        while True:
+            name = rng.choices(names, weights)[0]
+            request = MIX[name][1](rng, workload)
+            t0 = time.perf_counter()
+            if t0 >= deadline:
+                return
+            try:
+                resp = await client.request(request.method, request.url, json=request.json)
+                error = str(resp.status_code) if resp.status_code >= 400 else None
+            except httpx.HTTPError as e:
+                error = type(e).__name__
+            t1 = time.perf_counter()
+            if t0 >= measure_from:
+                latencies[name].append(t1 - t0)
+                if error:
+                    errors[name][error] += 1
+
+    samples: List[float] = []
+    stop = asyncio.Event()
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30.0) as client:
+        sampler = asyncio.create_task(sample_rss(rss, samples, stop)) if rss else None
+        await asyncio.gather(*(client_loop(client, i) for i in range(concurrency)))
+        stop.set()
+        if sampler:
+            await sampler
+    elapsed = time.perf_counter() - measure_from
+
+    endpoints = {name: summarize(latencies[name], errors[name], elapsed) for name in names if latencies[name]}
+    everything = [x for values in latencies.values() for x in values]
+    all_errors = defaultdict(int)
+    for counts in errors.values():
+        for code, count in counts.items():
+            all_errors[code] += count
+    return {
+        'concurrency': concurrency,
+        'duration': round(elapsed, 2),
+        'total': summarize(everything, all_errors, elapsed),
+        'endpoints': endpoints,
+        'server_rss_peak_mb': round(max(samples), 1) if samples else None,
+        'server_rss_end_mb': round(rss(), 1) if rss and rss() is not None else None,
+    }
+
+
+def summarize(latencies: List[float], errors: Dict[str, int], elapsed: float) -> dict:
+    ms = np.asarray(latencies) * 1000
+    n_errors = sum(errors.values())
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99]) if len(ms) else (0.0, 0.0, 0.0)
+    counts = np.histogram(ms, bins=[0] + HIST_BOUNDS_MS)[0] if len(ms) else np.zeros(len(HIST_BOUNDS_MS))
+    return {
+        'requests': len(ms),
+        'qps': round(len(ms) / elapsed, 1) if elapsed > 0 else 0.0,
+        'p50_ms': round(float(p50), 2),
+        'p95_ms': round(float(p95), 2),
+        'p99_ms': round(float(p99), 2),
+        'max_ms': round(float(ms.max()), 2) if len(ms) else 0.0,
+        'errors': n_errors,
+        'error_rate': round(n_errors / len(ms), 4) if len(ms) else 0.0,
+        'error_codes': dict(errors),
+        'histogram_ms': {('inf' if b == float('inf') else str(b)): int(c)
+                         for b, c in zip(HIST_BOUNDS_MS, counts)},
+    }
+
+
+def print_level(level: dict):
+    rss = ""
+    if level['server_rss_peak_mb'] is not None:
+        rss = f" | RSS serveur pic {level['server_rss_peak_mb']:.0f} MB, fin {level['server_rss_end_mb']:.0f} MB"
+    print(f"\nConcurrence {level['concurrency']} ({level['duration']:.1f}s){rss}")
+    print(f"  {'endpoint':16} {'req':>7} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'erreurs':>8}")
+    rows = list(level['endpoints'].items()) + [('TOTAL', level['total'])]
+    for name, s in rows:
+        print(f"  {name:16} {s['requests']:>7,} {s['qps']:>8.1f} {s['p50_ms']:>6.1f}ms {s['p95_ms']:>6.1f}ms "
+              f"{s['p99_ms']:>6.1f}ms {s['max_ms']:>6.0f}ms {s['error_rate'] * 100:>7.2f}%")
+
+    total = level['total']['histogram_ms']
+    peak = max(total.values()) or 1
+    print("  Histogramme (toutes requêtes):")
+    for bound, count in total.items():
+        if count:
+            label = f"> {HIST_BOUNDS_MS[-2]}" if bound == 'inf' else f"≤ {bound}"
+            print(f"    {label:>8} ms {'█' * max(1, round(40 * count / peak)):40} {count:,}")
+
+
+async def run_levels(url: str, workload: Workload, levels: List[int], duration: float,
+                     warmup: float, rss: Optional[Callable[[], Optional[float]]]) -> List[dict]:
+    results = []
+    for concurrency in levels:
+        level = await run_level(url, workload, concurrency, duration, warmup, rss)
+        print_level(level)
+        results.append(level)
+    return results
+
+
+def load_test(
+    scale: str = 'small',
+    levels: Optional[List[int]] = None,
+    duration: float = DURATION,
+    warmup: float = WARMUP,
+    url: Optional[str] = None,
+    output: Optional[Path] = None,
+    cache_dir: Path = CACHE_DIR
+) -> dict:
+    """Démarre (si besoin) le serveur local et mesure chaque niveau de concurrence."""
+    levels = levels or DEFAULT_CONCURRENCY
+    print("=" * 60)
+    print("TEST DE CHARGE DE L'API")
+    print("=" * 60)
+
+    data_dir = prepare_scale(scale, cache_dir)
+    workload = Workload(data_dir / "mappings.json")
+    mix = ', '.join(f"{name} {weight}" for name, (weight, _) in MIX.items())
+    print(f"Données: {scale} ({SCALES[scale]:,} écoutes), {len(workload.users):,} users, {workload.n_items:,} items")
+    print(f"Mélange (poids): {mix}")
+    print(f"Concurrence: {levels} | durée {duration:.0f}s + warmup {warmup:.0f}s par niveau")
+
+    report = {'scale': scale, 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'mix': {name: weight for name, (weight, _) in MIX.items()}}
+    if url:
+        print(f"Serveur: {url} (externe, RSS non mesuré)")
+        report['levels'] = asyncio.run(run_levels(url, workload, levels, duration, warmup, None))
+    else:
+        with tempfile.TemporaryDirectory(prefix="loadtest-") as work_dir, \
+                LocalServer(data_dir, Path(work_dir)) as server:
+            idle = server.rss_mb()
+            print(f"Serveur: {server.url} (uvicorn), RSS au repos "
+                  f"{idle:.0f} MB" if idle is not None else f"Serveur: {server.url}")
+            report['server_rss_idle_mb'] = round(idle, 1) if idle is not None else None
+            report['levels'] = asyncio.run(
+                run_levels(server.url, workload, levels, duration, warmup, server.rss_mb))
+
+    if output:
+        output.parent.mkdir(parents=True, exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nRapport écrit dans {output}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test de charge de l'API de recommandation")
+    parser.add_argument("--scale", choices=list(SCALES), default='small',
+                        help="Échelle du modèle synthétique servi")
+    parser.add_argument("--concurrency", type=int, nargs='+', default=DEFAULT_CONCURRENCY,
+                        help="Niveaux de concurrence (clients simultanés)")
+    parser.add_argument("--duration", type=float, default=DURATION,
+                        help="Durée mesurée par niveau (s)")
+    parser.add_argument("--warmup", type=float, default=WARMUP,
+                        help="Warmup non mesuré par niveau (s)")
+    parser.add_argument("--url", default=None,
+                        help="Cibler un serveur déjà lancé au lieu d'en démarrer un")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="Rapport JSON (latences, histogrammes, RSS)")
+    parser.add_argument("--cache", type=Path, default=CACHE_DIR,
+                        help="Cache des données synthétiques")
+
+    args = parser.parse_args()
+    load_test(args.scale, args.concurrency, args.duration, args.warmup, args.url,
+              args.output, args.cache)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Suite de benchmarks de bout en bout, avec historique et détection de régressions.
+
+Mesure, sur des données synthétiques à plusieurs échelles (voir cases.py):
+parse_listen_line, deduplicate_tracks, aggregate_listens, build_sparse_matrix,
+create_train_test_split, ALSRecommender.fit, recommend, recommend_batch,
+similar_items, CatalogService.search et evaluate_model.
+
+Chaque cas tourne dans un process neuf (spawn): le pic de mémoire (RSS) est
+celui du cas seul. Les résultats (temps médian et minimal, pic RSS, débit)
+sont ajoutés à benchmarks/history.jsonl avec le commit courant.
+
+Usage:
+  python benchmarks/run.py run
+  python benchmarks/run.py run --scales small medium --only als_fit recommend_batch --repeat 5
+  python benchmarks/run.py compare                 # deux derniers commits de l'historique
+  python benchmarks/run.py compare a1b2c3d HEAD --threshold 0.10
+  python benchmarks/run.py list
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).parent))
+from cases import CACHE_DIR, CASES, SCALES, prepare_scale, quiet  # noqa: E402
+
+HISTORY_FILE = Path(__file__).parent / "history.jsonl"
+DEFAULT_THRESHOLD = 0.10
+
+
+def git(*args: str) -> Optional[str]:
+    try:
+        return subprocess.run(['git', *args], cwd=Path(__file__).parent, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return None
+
+
+def peak_rss_mb() -> float:
+    """
+    Pic de RSS du process courant.
+
+    Sous Linux, VmHWM est remis à zéro par exec, contrairement à ru_maxrss
+    qui garderait le pic du process parent dans un fils spawn.
+    """
+    status = Path('/proc/self/status')
+    if status.exists():
+        for line in status.read_text().splitlines():
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+    # ru_maxrss: Ko sous Linux, octets sous macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024**2 if sys.platform == 'darwin' else peak / 1024
+
+
+def run_case(name: str, data_dir: str, repeat: int) -> dict:
+    """Process fils: prépare puis mesure un cas `repeat` fois."""
+    case = CASES[name]
+    with tempfile.TemporaryDirectory(prefix=f"bench-{name}-") as tmp_dir, quiet():
+        run = case.setup(Path(data_dir), Path(tmp_dir))
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            items = run()
+            timings.append(time.perf_counter() - start)
+
+    median = statistics.median(timings)
+    return {
+        'seconds': round(median, 6),
+        'seconds_min': round(min(timings), 6),
+        'repeat': repeat,
+        'items': items,
+        'unit': case.unit,
+        'throughput': round(items / median, 2) if median else None,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+
+def run_benchmarks(
+    scales: List[str],
+    names: List[str],
+    repeat: int = 3,
+    history_file: Path = HISTORY_FILE,
+    cache_dir: Path = CACHE_DIR
+) -> dict:
+    """Exécute les cas demandés à chaque échelle et ajoute le run à l'historique."""
+    print("=" * 60)
+    print("BENCHMARKS")
+    print("=" * 60)
+
+    commit = git('rev-parse', '--short', 'HEAD')
+    dirty = bool(git('status', '--porcelain', '--untracked-files=no'))
+    print(f"Commit: {commit}{' (modifié)' if dirty else ''} | répétitions: {repeat}")
+
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for scale in scales:
+        print(f"\n[{scale}] préparation des données ({SCALES[scale]:,} écoutes)...")
+        start = time.time()
+        data_dir = prepare_scale(scale, cache_dir)
+        print(f"[{scale}] données prêtes ({time.time() - start:.1f}s): {data_dir}")
+
+        for name in names:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(run_case, name, str(data_dir), repeat).result()
+            result.update({'benchmark': name, 'scale': scale})
+            results.append(result)
+            print(f"  {name:25} {result['seconds']:>9.4f}s  "
+                  f"{result['throughput']:>14,.0f} {result['unit']}/s  "
+                  f"pic RSS {result['peak_rss_mb']:>8.1f} MB")
+
+    run = {
+        'commit': commit,
+        'dirty': dirty,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'machine': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'results': results,
+    }
+    history_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(history_file, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(run) + '\n')
+    print(f"\nRésultats ajoutés à {history_file}")
+    return run
+
+
+# ──────────────────────────────────────────────
+# Comparaison
+# ──────────────────────────────────────────────
+
+def load_history(history_file: Path = HISTORY_FILE) -> List[dict]:
+    if not history_file.exists():
+        return []
+    with open(history_file, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def results_for(history: List[dict], commit: str) -> Dict[tuple, dict]:
+    """Derniers résultats enregistrés pour un commit (préfixe ou révision git)."""
+    resolved = git('rev-parse', '--short', commit) or commit
+    selected = {}
+    for run in history:
+        if run['commit'] and (run['commit'].startswith(commit) or run['commit'] == resolved):
+            for result in run['results']:
+                selected[(result['benchmark'], result['scale'])] = result
+    return selected
+
+
+def compare(
+    base: Optional[str] = None,
+    head: Optional[str] = None,
+    threshold: float = DEFAULT_THRESHOLD,
+    history_file: Path = HISTORY_FILE
+) -> bool:
+    """
+    Compare deux commits de l'historique (défaut: les deux derniers distincts).
+
+    Returns:
+        True si aucune régression (temps ou pic RSS) au-delà du seuil
+    """
+    history = load_history(history_file)
+    commits = list(dict.fromkeys(run['commit'] for run in history))
+    if base is None or head is None:
+        if len(commits) < 2:
+            raise SystemExit("Il faut au moins deux commits dans l'historique pour comparer")
+        base, head = base or commits[-2], head or commits[-1]
+
+    before, after = results_for(history, base), results_for(history, head)
+    if not before or not after:
+        raise SystemExit(f"Pas de résultats pour {base if not before else head} dans {history_file}")
+
+    print(f"Comparaison {base} → {head} (seuil {threshold * 100:.0f}%)")
+    print(f"  {'benchmark':25} {'échelle':8} {'temps':>10} {'Δ temps':>9} {'pic RSS':>10} {'Δ RSS':>8}")
+    regressions = []
+    for key in sorted(set(before) & set(after)):
+        old, new = before[key], after[key]
+        time_delta = new['seconds'] / old['seconds'] - 1 if old['seconds'] else 0.0
+        rss_delta = new['peak_rss_mb'] / old['peak_rss_mb'] - 1 if old['peak_rss_mb'] else 0.0
+        flags = []
+        if time_delta > threshold:
+            flags.append('temps')
+        if rss_delta > threshold:
+            flags.append('mémoire')
+        if flags:
+            regressions.append((key, flags))
+        marker = f"  ← RÉGRESSION ({', '.join(flags)})" if flags else ""
+        print(f"  {key[0]:25} {key[1]:8} {new['seconds']:>9.4f}s {time_delta * 100:>+8.1f}% "
+              f"{new['peak_rss_mb']:>8.1f}MB {rss_delta * 100:>+7.1f}%{marker}")
+
+    missing = sorted(set(before) ^ set(after))
+    if missing:
+        print(f"\nNon comparables (absents d'un des deux commits): {len(missing)}")
+
+    print(f"\n{len(regressions)} régression(s)")
+    return not regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de bout en bout")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="Exécuter les benchmarks")
+    run_parser.add_argument("--scales", nargs='+', choices=list(SCALES), default=['small'],
+                            help="Échelles à mesurer")
+    run_parser.add_argument("--only", nargs='+', choices=list(CASES), default=list(CASES),
+                            help="Cas à mesurer (défaut: tous)")
+    run_parser.add_argument("--repeat", type=int, default=3,
+                            help="Répétitions par cas (temps médian retenu)")
+    run_parser.add_argument("--history", type=Path, default=HISTORY_FILE,
+                            help="Fichier d'historique JSON lines")
+    run_parser.add_argument("--cache", type=Path, default=CACHE_DIR,
+                            help="Cache des données synthétiques")
+    run_parser.add_argument("--clear-cache", action="store_true",
+                            help="Regénérer les données synthétiques")
+
+    compare_parser = subparsers.add_parser('compare', help="Comparer deux commits de l'historique")
+    compare_parser.add_argument("base", nargs='?', help="Commit de référence (défaut: avant-dernier)")
+    compare_parser.add_argument("head", nargs='?', help="Commit comparé (défaut: dernier)")
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                                help="Hausse relative tolérée (0.10 = 10%%)")
+    compare_parser.add_argument("--history", type=Path, default=HISTORY_FILE,
+                                help="Fichier d'historique JSON lines")
+
+    subparsers.add_parser('list', help="Lister les cas et les échelles")
+
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        if args.clear_cache:
+            shutil.rmtree(args.cache, ignore_errors=True)
+        run_benchmarks(args.scales, args.only, args.repeat, args.history, args.cache)
+    elif args.command == 'compare':
+        ok = compare(args.base, args.head, args.threshold, args.history)
+        sys.exit(0 if ok else 1)
+    else:
+        print("Cas:", ', '.join(CASES))
+        print("Échelles:", ', '.join(f"{name} ({n:,} écoutes)" for name, n in SCALES.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,43 +1,91 @@
 #!/usr/bin/env python3
 """
 Script pour agréger les données d'écoutes en un dataset final.
-Crée le fichier listens.parquet avec les colonnes:
-user_id, track_id, artist_id, timestamp, play_count
+Crée le dataset listens.parquet (partitionné month=/user_bucket=) avec les colonnes:
+user_id, track_id, artist_id, first_listen, last_listen, play_count
+(une ligne par utilisateur, track et mois d'écoute)
 """
 import os
 from pathlib import Path
-from typing import Tuple
+from typing import Optional, Tuple
 
 import json
 
 import pandas as pd
 import numpy as np
+import pyarrow as pa
 from tqdm import tqdm
 
+from id_dictionary import ID_DICTS_DIR, IdDictionary, load_id_dicts, save_id_dicts
+from listen_dataset import DEFAULT_USER_BUCKETS, bucket_keys, read_listens, write_partitioned
+
 # Configuration
 PROCESSED_DIR = Path(__file__).parent.parent / "data" / "processed"
 INPUT_FILE = PROCESSED_DIR / "listens_raw.parquet"
 OUTPUT_FILE = PROCESSED_DIR / "listens.parquet"
 
+RAW_COLUMNS = ['user_name', 'listened_at', 'track_name', 'artist_name']
+
 
-def create_id_mapping(series: pd.Series, prefix: str = "") -> Tuple[dict, dict]:
+def create_id_mapping(
+    series: pd.Series,
+    prefix: str = "",
+    dictionary: Optional[IdDictionary] = None
+) -> Tuple[dict, dict]:
     """
     Crée un mapping bidirectionnel entre les valeurs et des IDs numériques.
 
+    Sans dictionnaire, les IDs suivent l'ordre d'apparition et changent d'un
+    run à l'autre. Avec un IdDictionary, les IDs existants sont conservés et
+    les nouvelles valeurs ajoutées en fin (le mapping couvre tout le dictionnaire).
+
     Returns:
         (value_to_id, id_to_value)
     """
     unique_values = series.dropna().unique()
-    value_to_id = {v: i for i, v in enumerate(unique_values)}
+    if dictionary is not None:
+        dictionary.add(unique_values)
+        value_to_id = dictionary.to_dict()
+    else:
+        value_to_id = {v: i for i, v in enumerate(unique_values)}
     id_to_value = {i: v for v, i in value_to_id.items()}
     return value_to_id, id_to_value
 
 
+def save_mappings(
+    user_to_id: dict,
+    track_to_id: dict,
+    artist_to_id: dict,
+    mappings_file: Path
+) -> Path:
+    """
+    Sauvegarde les mappings bidirectionnels au format attendu par
+    build_matrix.py, deduplicate_tracks.py et l'API (clés int en str pour JSON).
+    """
+    mappings_json = {
+        'user_to_id': user_to_id,
+        'id_to_user': {str(i): v for v, i in user_to_id.items()},
+        'track_to_id': track_to_id,
+        'id_to_track': {str(i): v for v, i in track_to_id.items()},
+        'artist_to_id': artist_to_id,
+        'id_to_artist': {str(i): v for v, i in artist_to_id.items()}
+    }
+
+    mappings_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(mappings_file, 'w', encoding='utf-8') as f:
+        json.dump(mappings_json, f, ensure_ascii=False)
+
+    return mappings_file
+
+
 def aggregate_listens(
     input_file: Path = INPUT_FILE,
     output_file: Path = OUTPUT_FILE,
     min_user_listens: int = 5,
-    min_track_listens: int = 3
+    min_track_listens: int = 3,
+    id_dicts_dir: Optional[Path] = ID_DICTS_DIR,
+    start_month: Optional[str] = None,
+    end_month: Optional[str] = None
 ) -> Tuple[pd.DataFrame, dict, dict, dict]:
     """
     Agrège les écoutes et crée le dataset final.
@@ -47,6 +95,9 @@ def aggregate_listens(
         output_file: Fichier parquet de sortie
         min_user_listens: Minimum d'écoutes par utilisateur
         min_track_listens: Minimum d'écoutes par track
+        id_dicts_dir: Dossier des dictionnaires d'IDs persistants (None = IDs non stables)
+        start_month: Premier mois agrégé ('YYYY-MM', None = depuis le début)
+        end_month: Dernier mois agrégé inclus (None = jusqu'à la fin)
 
     Returns:
         (DataFrame agrégé, user_mapping, track_mapping, artist_mapping)
@@ -55,9 +106,11 @@ def aggregate_listens(
     print("Agrégation des données d'écoutes")
     print("=" * 60)
 
-    # Charger les données
+    # Charger les données (colonnes utiles, mois de la fenêtre seulement)
     print(f"\nChargement de {input_file}...")
-    df = pd.read_parquet(input_file)
+    if start_month or end_month:
+        print(f"Fenêtre: {start_month or 'début'} → {end_month or 'fin'}")
+    df = read_listens(input_file, columns=RAW_COLUMNS, start_month=start_month, end_month=end_month)
     print(f"Écoutes chargées: {len(df):,}")
 
     # Nettoyer les données
@@ -69,9 +122,12 @@ def aggregate_listens(
 
     # Créer une clé unique pour les tracks (artist + track)
     df['track_key'] = df['artist_name'].fillna('Unknown') + ' - ' + df['track_name']
+    if not pd.api.types.is_datetime64_any_dtype(df['listened_at']):
+        df['listened_at'] = pd.to_datetime(df['listened_at'], unit='s', errors='coerce')
+    df['month'] = df['listened_at'].dt.strftime('%Y-%m')
 
     # Appliquer le mapping de déduplication si disponible
-    dedup_file = PROCESSED_DIR / "track_dedup_map.json"
+    dedup_file = output_file.parent / "track_dedup_map.json"
     if dedup_file.exists():
         print(f"\nChargement du mapping de déduplication...")
         with open(dedup_file, encoding='utf-8') as f:
@@ -101,30 +157,34 @@ def aggregate_listens(
 
     # Créer les mappings
     print("\nCréation des mappings ID...")
-    user_to_id, id_to_user = create_id_mapping(df['user_name'])
-    track_to_id, id_to_track = create_id_mapping(df['track_key'])
-    artist_to_id, id_to_artist = create_id_mapping(df['artist_name'])
+    id_dicts = load_id_dicts(id_dicts_dir) if id_dicts_dir else {}
+    user_to_id, id_to_user = create_id_mapping(df['user_name'], dictionary=id_dicts.get('users'))
+    track_to_id, id_to_track = create_id_mapping(df['track_key'], dictionary=id_dicts.get('tracks'))
+    artist_to_id, id_to_artist = create_id_mapping(df['artist_name'], dictionary=id_dicts.get('artists'))
+    if id_dicts:
+        print(f"Dictionnaires d'IDs ({id_dicts_dir}):")
+        save_id_dicts(id_dicts)
 
     # Appliquer les mappings
     df['user_id'] = df['user_name'].map(user_to_id)
     df['track_id'] = df['track_key'].map(track_to_id)
     df['artist_id'] = df['artist_name'].map(artist_to_id)
 
-    # Agréger: compter les écoutes par (user, track)
+    # Agréger: compter les écoutes par (user, track, mois)
     print("\nAgrégation des play counts...")
-    agg_df = df.groupby(['user_id', 'track_id', 'artist_id']).agg({
+    agg_df = df.groupby(['user_id', 'track_id', 'artist_id', 'month']).agg({
         'listened_at': ['min', 'max', 'count']
     }).reset_index()
 
     # Aplatir les colonnes multi-index
-    agg_df.columns = ['user_id', 'track_id', 'artist_id',
+    agg_df.columns = ['user_id', 'track_id', 'artist_id', 'month',
                       'first_listen', 'last_listen', 'play_count']
 
     # Statistiques finales
     print(f"\n{'=' * 60}")
     print("STATISTIQUES FINALES")
     print(f"{'=' * 60}")
-    print(f"Interactions (user, track): {len(agg_df):,}")
+    print(f"Interactions (user, track, mois): {len(agg_df):,}")
     print(f"Utilisateurs uniques: {agg_df['user_id'].nunique():,}")
     print(f"Tracks uniques: {agg_df['track_id'].nunique():,}")
     print(f"Artistes uniques: {agg_df['artist_id'].nunique():,}")
@@ -135,12 +195,16 @@ def aggregate_listens(
     # Sparsité de la matrice
     n_users = agg_df['user_id'].nunique()
     n_tracks = agg_df['track_id'].nunique()
-    sparsity = 1 - (len(agg_df) / (n_users * n_tracks))
+    n_pairs = len(agg_df.drop_duplicates(['user_id', 'track_id']))
+    sparsity = 1 - (n_pairs / (n_users * n_tracks))
     print(f"Sparsité de la matrice: {sparsity*100:.4f}%")
 
-    # Sauvegarder le dataset
+    # Sauvegarder le dataset partitionné (user_bucket calculé sur user_name)
     print(f"\nSauvegarde vers {output_file}...")
-    agg_df.to_parquet(output_file, index=False)
+    user_names = agg_df['user_id'].map(id_to_user).values
+    table = pa.Table.from_pandas(agg_df, preserve_index=False)
+    table = table.append_column('user_bucket', bucket_keys(user_names, DEFAULT_USER_BUCKETS))
+    manifest = write_partitioned([table], output_file, table.schema, DEFAULT_USER_BUCKETS)
 
     # Sauvegarder les mappings
     mappings = {
@@ -149,26 +213,12 @@ def aggregate_listens(
         'artist': {'to_id': artist_to_id, 'to_name': id_to_artist}
     }
 
-    import json
-    mappings_file = PROCESSED_DIR / "mappings.json"
-
-    # Convertir les clés int en str pour JSON
-    mappings_json = {
-        'user_to_id': user_to_id,
-        'id_to_user': {str(k): v for k, v in id_to_user.items()},
-        'track_to_id': track_to_id,
-        'id_to_track': {str(k): v for k, v in id_to_track.items()},
-        'artist_to_id': artist_to_id,
-        'id_to_artist': {str(k): v for k, v in id_to_artist.items()}
-    }
-
-    with open(mappings_file, 'w', encoding='utf-8') as f:
-        json.dump(mappings_json, f, ensure_ascii=False)
-
+    mappings_file = output_file.parent / "mappings.json"
+    save_mappings(user_to_id, track_to_id, artist_to_id, mappings_file)
     print(f"Mappings sauvegardés: {mappings_file}")
 
-    file_size_mb = output_file.stat().st_size / (1024 * 1024)
-    print(f"Taille du fichier: {file_size_mb:.1f} MB")
+    print(f"Taille du dataset: {manifest['bytes'] / (1024 * 1024):.1f} MB "
+          f"({len(manifest['partitions'])} partitions)")
 
     return agg_df, mappings
 
@@ -178,13 +228,19 @@ def main():
 
     parser = argparse.ArgumentParser(description="Agréger les données d'écoutes")
     parser.add_argument("--input", type=Path, default=INPUT_FILE,
-                       help="Fichier parquet d'entrée")
+                       help="Fichier ou dataset parquet d'entrée")
     parser.add_argument("--output", type=Path, default=OUTPUT_FILE,
-                       help="Fichier parquet de sortie")
+                       help="Dataset parquet de sortie")
     parser.add_argument("--min-user-listens", type=int, default=5,
                        help="Minimum d'écoutes par utilisateur")
     parser.add_argument("--min-track-listens", type=int, default=3,
                        help="Minimum d'écoutes par track")
+    parser.add_argument("--id-dicts", type=Path, default=ID_DICTS_DIR,
+                       help="Dossier des dictionnaires d'IDs persistants")
+    parser.add_argument("--no-id-dicts", action="store_true",
+                       help="Réattribuer les IDs à chaque run (ancien comportement)")
+    parser.add_argument("--start-month", help="Premier mois agrégé (YYYY-MM)")
+    parser.add_argument("--end-month", help="Dernier mois agrégé, inclus (YYYY-MM)")
 
     args = parser.parse_args()
 
@@ -192,7 +248,10 @@ def main():
         input_file=args.input,
         output_file=args.output,
         min_user_listens=args.min_user_listens,
-        min_track_listens=args.min_track_listens
+        min_track_listens=args.min_track_listens,
+        id_dicts_dir=None if args.no_id_dicts else args.id_dicts,
+        start_month=args.start_month,
+        end_month=args.end_month
     )
 
 
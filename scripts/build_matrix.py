@@ -5,13 +5,16 @@ Applique la normalisation log(1 + play_count) pour les implicit feedbacks.
 """
 import json
 from pathlib import Path
-from typing import Tuple
+from typing import Optional, Tuple
 
 import numpy as np
 import pandas as pd
 from scipy import sparse
 from tqdm import tqdm
 
+from id_dictionary import ID_DICTS_DIR, load_id_dicts
+from listen_dataset import read_listens
+
 # Configuration
 PROCESSED_DIR = Path(__file__).parent.parent / "data" / "processed"
 INPUT_FILE = PROCESSED_DIR / "listens.parquet"
@@ -32,11 +35,54 @@ def load_mappings(mappings_file: Path) -> Tuple[dict, dict]:
     return id_to_user, id_to_track
 
 
+def load_play_counts(
+    input_file: Path = INPUT_FILE,
+    start_month: Optional[str] = None,
+    end_month: Optional[str] = None
+) -> pd.DataFrame:
+    """
+    Play counts par (user_id, track_id), sommés sur les mois de la fenêtre.
+    Seules les partitions de la fenêtre et les 3 colonnes utiles sont lues.
+    """
+    df = read_listens(
+        input_file,
+        columns=['user_id', 'track_id', 'play_count'],
+        start_month=start_month,
+        end_month=end_month,
+        time_column='last_listen'
+    )
+    return df.groupby(['user_id', 'track_id'], sort=False, as_index=False)['play_count'].sum()
+
+
+def confidence_matrix(
+    counts: pd.DataFrame,
+    shape: Tuple[int, int],
+    confidence_scaling: float = 40.0,
+    use_log_transform: bool = True
+) -> sparse.csr_matrix:
+    """Matrice CSR des confidences depuis des play counts (user_id, track_id)."""
+    if use_log_transform:
+        # Transformation log pour les implicit feedbacks
+        # Référence: "Collaborative Filtering for Implicit Feedback Datasets" (Hu et al., 2008)
+        values = 1 + confidence_scaling * np.log1p(counts['play_count'].values)
+    else:
+        values = counts['play_count'].values.astype(np.float32)
+
+    return sparse.csr_matrix(
+        (values, (counts['user_id'].values, counts['track_id'].values)),
+        shape=shape,
+        dtype=np.float32
+    )
+
+
 def build_sparse_matrix(
     input_file: Path = INPUT_FILE,
     output_matrix: Path = OUTPUT_MATRIX,
     confidence_scaling: float = 40.0,
-    use_log_transform: bool = True
+    use_log_transform: bool = True,
+    id_dicts_dir: Optional[Path] = ID_DICTS_DIR,
+    start_month: Optional[str] = None,
+    end_month: Optional[str] = None
 ) -> Tuple[sparse.csr_matrix, dict, dict]:
     """
     Construit la matrice sparse user-item au format CSR.
@@ -49,6 +95,11 @@ def build_sparse_matrix(
         output_matrix: Chemin de sortie pour la matrice .npz
         confidence_scaling: Facteur alpha pour le scaling des confidences
         use_log_transform: Si True, utilise log(1 + count) pour la transformation
+        id_dicts_dir: Dictionnaires d'IDs persistants. S'ils existent, la matrice
+            a une ligne par ID utilisateur et une colonne par ID track connus,
+            même absents de ce run: les indices restent stables entre runs.
+        start_month: Premier mois pris en compte ('YYYY-MM', None = depuis le début)
+        end_month: Dernier mois pris en compte, inclus (None = jusqu'à la fin)
 
     Returns:
         (matrice CSR, user_mapping, item_mapping)
@@ -59,30 +110,27 @@ def build_sparse_matrix(
 
     # Charger les données
     print(f"\nChargement de {input_file}...")
-    df = pd.read_parquet(input_file)
+    if start_month or end_month:
+        print(f"Fenêtre: {start_month or 'début'} → {end_month or 'fin'}")
+    df = load_play_counts(input_file, start_month, end_month)
     print(f"Interactions chargées: {len(df):,}")
+    if df.empty:
+        raise ValueError(f"Aucune écoute dans la fenêtre {start_month or 'début'} → {end_month or 'fin'} "
+                         f"({input_file})")
 
     # Dimensions de la matrice
     n_users = df['user_id'].max() + 1
     n_items = df['track_id'].max() + 1
+    if id_dicts_dir and (id_dicts_dir / "tracks.arrow").exists():
+        id_dicts = load_id_dicts(id_dicts_dir)
+        n_users = max(n_users, len(id_dicts['users']))
+        n_items = max(n_items, len(id_dicts['tracks']))
+        print(f"Dimensions fixées par les dictionnaires d'IDs ({id_dicts_dir})")
     print(f"Dimensions: {n_users:,} users × {n_items:,} items")
 
-    # Calculer les valeurs de confidence
-    print("\nCalcul des confidence weights...")
-    if use_log_transform:
-        # Transformation log pour les implicit feedbacks
-        # Référence: "Collaborative Filtering for Implicit Feedback Datasets" (Hu et al., 2008)
-        values = 1 + confidence_scaling * np.log1p(df['play_count'].values)
-    else:
-        values = df['play_count'].values.astype(np.float32)
-
-    # Construire la matrice sparse
-    print("Construction de la matrice CSR...")
-    user_item_matrix = sparse.csr_matrix(
-        (values, (df['user_id'].values, df['track_id'].values)),
-        shape=(n_users, n_items),
-        dtype=np.float32
-    )
+    # Construire la matrice sparse des confidence weights
+    print("\nConstruction de la matrice CSR...")
+    user_item_matrix = confidence_matrix(df, (n_users, n_items), confidence_scaling, use_log_transform)
 
     # Statistiques
     nnz = user_item_matrix.nnz
@@ -112,21 +160,23 @@ def build_sparse_matrix(
     print(f"\nSauvegarde vers {output_matrix}...")
     sparse.save_npz(output_matrix, user_item_matrix)
 
-    # Charger et sauvegarder les mappings séparément
-    mappings_file = PROCESSED_DIR / "mappings.json"
+    # Charger et sauvegarder les mappings séparément (à côté de la matrice)
+    mappings_file = output_matrix.parent / "mappings.json"
     if mappings_file.exists():
         id_to_user, id_to_track = load_mappings(mappings_file)
+        user_mapping_file = output_matrix.parent / OUTPUT_USER_MAPPING.name
+        item_mapping_file = output_matrix.parent / OUTPUT_ITEM_MAPPING.name
 
         # Sauvegarder les mappings individuels pour l'API
-        with open(OUTPUT_USER_MAPPING, 'w', encoding='utf-8') as f:
+        with open(user_mapping_file, 'w', encoding='utf-8') as f:
             json.dump(id_to_user, f, ensure_ascii=False)
 
-        with open(OUTPUT_ITEM_MAPPING, 'w', encoding='utf-8') as f:
+        with open(item_mapping_file, 'w', encoding='utf-8') as f:
             json.dump(id_to_track, f, ensure_ascii=False)
 
         print(f"Mappings sauvegardés:")
-        print(f"  - {OUTPUT_USER_MAPPING}")
-        print(f"  - {OUTPUT_ITEM_MAPPING}")
+        print(f"  - {user_mapping_file}")
+        print(f"  - {item_mapping_file}")
 
     file_size_mb = output_matrix.stat().st_size / (1024 * 1024)
     print(f"\nTaille du fichier matrice: {file_size_mb:.1f} MB")
@@ -192,7 +242,7 @@ def main():
 
     parser = argparse.ArgumentParser(description="Construire la matrice user-item")
     parser.add_argument("--input", type=Path, default=INPUT_FILE,
-                       help="Fichier parquet d'entrée")
+                       help="Fichier ou dataset parquet d'entrée")
     parser.add_argument("--output", type=Path, default=OUTPUT_MATRIX,
                        help="Fichier .npz de sortie")
     parser.add_argument("--alpha", type=float, default=40.0,
@@ -203,6 +253,10 @@ def main():
                        help="Créer aussi un split train/test")
     parser.add_argument("--test-ratio", type=float, default=0.2,
                        help="Ratio pour le test set")
+    parser.add_argument("--id-dicts", type=Path, default=ID_DICTS_DIR,
+                       help="Dossier des dictionnaires d'IDs persistants")
+    parser.add_argument("--start-month", help="Premier mois pris en compte (YYYY-MM)")
+    parser.add_argument("--end-month", help="Dernier mois pris en compte, inclus (YYYY-MM)")
 
     args = parser.parse_args()
 
@@ -210,7 +264,10 @@ def main():
         input_file=args.input,
         output_matrix=args.output,
         confidence_scaling=args.alpha,
-        use_log_transform=not args.no_log
+        use_log_transform=not args.no_log,
+        id_dicts_dir=args.id_dicts,
+        start_month=args.start_month,
+        end_month=args.end_month
     )
 
     if args.split:
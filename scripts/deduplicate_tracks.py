@@ -184,8 +184,16 @@ def deduplicate_tracks(
     output_file:   Path = OUTPUT_FILE,
     threshold:     int  = DEFAULT_THRESHOLD,
     max_block_size: int = DEFAULT_MAX_BLOCK,
+    track_keys:    list[str] | None = None,
 ) -> dict[str, str]:
+    """
+    Calcule le mapping track_key → canonical_key et le sauvegarde en JSON.
 
+    Les tracks viennent de mappings.json (triées par ID), ou de `track_keys`
+    si fourni (ex: clés distinctes triées par fréquence décroissante, calculées
+    directement depuis listens_raw.parquet par le pipeline): le premier
+    élément d'un cluster devient la clé canonique.
+    """
     print("=" * 60)
     print("DÉDUPLICATION DES TRACKS")
     print("=" * 60)
@@ -193,13 +201,14 @@ def deduplicate_tracks(
     print(f"Taille max de bloc  : {max_block_size}")
 
     # ── 1. Charger les tracks ──────────────────
-    print(f"\nChargement de {mappings_file}...")
-    with open(mappings_file, encoding='utf-8') as f:
-        mappings = json.load(f)
-
-    # Trier par ID pour que le canonical soit la version "la plus ancienne"
-    track_to_id: dict[str, int] = mappings['track_to_id']
-    track_keys = sorted(track_to_id, key=lambda k: track_to_id[k])
+    if track_keys is None:
+        print(f"\nChargement de {mappings_file}...")
+        with open(mappings_file, encoding='utf-8') as f:
+            mappings = json.load(f)
+
+        # Trier par ID pour que le canonical soit la version "la plus ancienne"
+        track_to_id: dict[str, int] = mappings['track_to_id']
+        track_keys = sorted(track_to_id, key=lambda k: track_to_id[k])
     print(f"Tracks à traiter : {len(track_keys):,}")
 
     uf = UnionFind()
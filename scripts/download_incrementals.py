@@ -5,20 +5,28 @@ Télécharge les dumps incrémentaux ListenBrainz manquants vers S3.
 - Scrape automatiquement la page ListenBrainz pour trouver tous les dumps disponibles
 - Compare avec les fichiers déjà présents dans S3
 - Télécharge uniquement les nouveaux (streaming direct vers S3, sans stockage local)
+- Upload des parts en parallèle du téléchargement, reprise après interruption
+  (uploads en cours dans upload_manifest.json)
 
 Usage:
     python scripts/download_incrementals.py
     python scripts/download_incrementals.py --dry-run   # voir ce qui serait téléchargé
     python scripts/download_incrementals.py --limit 5   # télécharger max 5 nouveaux dumps
 """
+import io
+import json
 import os
+import queue
 import re
 import sys
 import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import boto3
 import requests
+from botocore.exceptions import ClientError
 from tqdm import tqdm
 
 # ── Configuration ──────────────────────────────────────────
@@ -26,7 +34,9 @@ BASE_URL  = "https://data.metabrainz.org/pub/musicbrainz/listenbrainz/incrementa
 S3_BUCKET = os.getenv("S3_BUCKET_NAME", "brainz-data")
 S3_PREFIX = "raw/listenbrainz/incrementals/"
 AWS_REGION = os.getenv("AWS_REGION", "eu-north-1")
-CHUNK_SIZE = 8 * 1024 * 1024  # 8 MB par chunk pour le streaming S3
+CHUNK_SIZE = 8 * 1024 * 1024  # 8 MB par part pour le streaming S3
+UPLOAD_WORKERS = 4            # parts uploadées en parallèle
+UPLOAD_MANIFEST = Path(__file__).parent.parent / "data" / "raw" / "listenbrainz" / "upload_manifest.json"
 
 
 # ── Découverte des dumps disponibles ───────────────────────
@@ -83,10 +93,123 @@ def list_s3_files(s3_client, bucket: str, prefix: str) -> set[str]:
 
 # ── Téléchargement streaming vers S3 ──────────────────────
 
-def stream_to_s3(s3_client, url: str, bucket: str, s3_key: str, filename: str):
+class PartReader(io.RawIOBase):
+    """
+    Vue fichier (lecture + seek) sur une part du ring, sans copie: boto3 peut
+    la relire pour le checksum ou un retry.
+    """
+
+    def __init__(self, view: memoryview):
+        self._view = view
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        n = min(len(b), len(self._view) - self._pos)
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+        self._pos = max(0, min(base + offset, len(self._view)))
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+
+class UploadManifest:
+    """
+    Uploads multipart en cours, persistés pour reprendre un transfert
+    interrompu: {clé S3: {upload_id, url, part_size, parts: {n°: ETag}}}.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        if path.exists():
+            with open(path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(tmp, self.path)
+
+    def get(self, s3_key: str) -> dict | None:
+        return self.entries.get(s3_key)
+
+    def start(self, s3_key: str, upload_id: str, url: str, part_size: int):
+        with self.lock:
+            self.entries[s3_key] = {"upload_id": upload_id, "url": url,
+                                    "part_size": part_size, "parts": {}}
+            self._save()
+
+    def record_part(self, s3_key: str, part_number: int, etag: str):
+        with self.lock:
+            self.entries[s3_key]["parts"][str(part_number)] = etag
+            self._save()
+
+    def finish(self, s3_key: str):
+        with self.lock:
+            self.entries.pop(s3_key, None)
+            self._save()
+
+
+def list_uploaded_parts(s3_client, bucket: str, s3_key: str, upload_id: str) -> dict[int, str]:
+    """Parts déjà reçues par S3 pour un upload multipart: {n°: ETag}."""
+    parts = {}
+    marker = 0
+    while True:
+        resp = s3_client.list_parts(Bucket=bucket, Key=s3_key, UploadId=upload_id,
+                                    PartNumberMarker=marker)
+        for part in resp.get("Parts", []):
+            parts[part["PartNumber"]] = part["ETag"]
+        if not resp.get("IsTruncated"):
+            return parts
+        marker = resp["NextPartNumberMarker"]
+
+
+def fill(raw, view: memoryview) -> int:
+    """Remplit une part depuis le flux HTTP. Retourne le nombre d'octets lus (< len(view) en fin de flux)."""
+    size = 0
+    while size < len(view):
+        n = raw.readinto(view[size:])
+        if not n:
+            break
+        size += n
+    return size
+
+
+def stream_to_s3(
+    s3_client,
+    url: str,
+    bucket: str,
+    s3_key: str,
+    filename: str,
+    manifest: UploadManifest | None = None,
+    upload_workers: int = UPLOAD_WORKERS,
+    part_size: int = CHUNK_SIZE
+):
     """
     Télécharge un fichier depuis une URL et l'upload directement vers S3
     en streaming (multipart upload) — aucun stockage local.
+
+    Les parts sont lues dans un ring de buffers préalloués (upload_workers + 1
+    parts de part_size) et uploadées par un pool de threads pendant que le
+    téléchargement continue; le ring plein bloque la lecture (mémoire bornée).
+
+    Avec un manifest, un transfert interrompu reprend à la première part
+    manquante (requête HTTP Range) au lieu de recommencer.
     """
     # HEAD request pour avoir la taille
     head = requests.head(url, timeout=30)
@@ -95,56 +218,113 @@ def stream_to_s3(s3_client, url: str, bucket: str, s3_key: str, filename: str):
 
     print(f"  Taille : {size_mb:.0f} MB")
 
-    # Multipart upload S3
-    mpu = s3_client.create_multipart_upload(Bucket=bucket, Key=s3_key)
-    upload_id = mpu["UploadId"]
-    parts = []
-    part_number = 1
+    # Reprise d'un upload interrompu: parts contiguës déjà présentes dans S3
+    parts = {}
+    entry = manifest.get(s3_key) if manifest else None
+    if entry and entry["url"] == url and entry["part_size"] == part_size:
+        upload_id = entry["upload_id"]
+        try:
+            parts = list_uploaded_parts(s3_client, bucket, s3_key, upload_id)
+        except ClientError:
+            entry = None
+    else:
+        entry = None
+
+    if entry is None:
+        mpu = s3_client.create_multipart_upload(Bucket=bucket, Key=s3_key)
+        upload_id = mpu["UploadId"]
+        if manifest:
+            manifest.start(s3_key, upload_id, url, part_size)
+
+    n_done = 0
+    while n_done + 1 in parts:
+        n_done += 1
+    parts = {n: parts[n] for n in range(1, n_done + 1)}
+    offset = n_done * part_size
+    if offset:
+        print(f"  Reprise : {n_done} parts déjà uploadées ({offset / 1024 / 1024:.0f} MB)")
+
+    ring = [bytearray(part_size) for _ in range(upload_workers + 1)]
+    free_slots = queue.Queue()
+    for slot in range(len(ring)):
+        free_slots.put(slot)
+    errors = []
+
+    def upload(part_number: int, view: memoryview) -> str:
+        resp = s3_client.upload_part(
+            Bucket=bucket, Key=s3_key,
+            UploadId=upload_id, PartNumber=part_number,
+            Body=PartReader(view), ContentLength=len(view)
+        )
+        if manifest:
+            manifest.record_part(s3_key, part_number, resp["ETag"])
+        return resp["ETag"]
+
+    def release(future, slot: int):
+        if future.exception() is not None:
+            errors.append(future.exception())
+        free_slots.put(slot)
 
     try:
-        with requests.get(url, stream=True, timeout=120) as r:
-            r.raise_for_status()
-
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        with requests.get(url, headers=headers, stream=True, timeout=120) as r, \
+                ThreadPoolExecutor(max_workers=upload_workers) as pool:
+            # 416 sur une reprise: toutes les parts sont déjà uploadées, rien à relire
+            complete = bool(offset) and r.status_code == 416
+            if not complete:
+                r.raise_for_status()
+            r.raw.decode_content = True
+            if offset and not complete and r.status_code != 206:
+                # Range ignoré par le serveur: on saute les octets déjà uploadés
+                skip = memoryview(ring[0])
+                remaining = offset
+                while remaining:
+                    remaining -= fill(r.raw, skip[:min(remaining, part_size)]) or remaining
+
+            futures = {}
             with tqdm(
-                total=total_size,
+                total=total_size, initial=offset,
                 unit="B", unit_scale=True,
                 desc=f"  {filename[:50]}",
                 leave=False
             ) as pbar:
-                buffer = b""
-                for chunk in r.iter_content(chunk_size=1024 * 1024):
-                    buffer += chunk
-                    pbar.update(len(chunk))
-
-                    if len(buffer) >= CHUNK_SIZE:
-                        resp = s3_client.upload_part(
-                            Bucket=bucket, Key=s3_key,
-                            UploadId=upload_id, PartNumber=part_number,
-                            Body=buffer
-                        )
-                        parts.append({"PartNumber": part_number, "ETag": resp["ETag"]})
-                        part_number += 1
-                        buffer = b""
-
-                # Dernier chunk
-                if buffer:
-                    resp = s3_client.upload_part(
-                        Bucket=bucket, Key=s3_key,
-                        UploadId=upload_id, PartNumber=part_number,
-                        Body=buffer
-                    )
-                    parts.append({"PartNumber": part_number, "ETag": resp["ETag"]})
-
-        s3_client.complete_multipart_upload(
-            Bucket=bucket, Key=s3_key,
-            MultipartUpload={"Parts": parts},
-            UploadId=upload_id,
-        )
+                part_number = n_done + 1
+                while not errors and not complete:
+                    slot = free_slots.get()
+                    view = memoryview(ring[slot])
+                    size = fill(r.raw, view)
+                    if size == 0:
+                        free_slots.put(slot)
+                        break
+                    future = pool.submit(upload, part_number, view[:size])
+                    future.add_done_callback(lambda f, s=slot: release(f, s))
+                    futures[part_number] = future
+                    pbar.update(size)
+                    part_number += 1
+                    if size < part_size:
+                        break
+
+            for number, future in futures.items():
+                parts[number] = future.result()
+
+        if parts:
+            s3_client.complete_multipart_upload(
+                Bucket=bucket, Key=s3_key,
+                MultipartUpload={"Parts": [{"PartNumber": n, "ETag": parts[n]} for n in sorted(parts)]},
+                UploadId=upload_id,
+            )
+        else:
+            # Corps vide: S3 refuse un multipart sans part, on écrit un objet vide
+            s3_client.abort_multipart_upload(Bucket=bucket, Key=s3_key, UploadId=upload_id)
+            s3_client.put_object(Bucket=bucket, Key=s3_key, Body=b"")
+        if manifest:
+            manifest.finish(s3_key)
 
     except Exception as e:
-        s3_client.abort_multipart_upload(
-            Bucket=bucket, Key=s3_key, UploadId=upload_id
-        )
+        if manifest is None:
+            s3_client.abort_multipart_upload(
+                Bucket=bucket, Key=s3_key, UploadId=upload_id
+            )
         raise e
 
 
@@ -158,9 +338,16 @@ def main():
                         help="Nombre maximum de nouveaux dumps à télécharger")
     parser.add_argument("--bucket", default=S3_BUCKET,
                         help=f"Bucket S3 (défaut: {S3_BUCKET})")
+    parser.add_argument("--upload-workers", type=int, default=UPLOAD_WORKERS,
+                        help="Parts uploadées en parallèle")
+    parser.add_argument("--manifest", type=Path, default=UPLOAD_MANIFEST,
+                        help="Fichier des uploads en cours (reprise)")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="Annuler les uploads en échec au lieu de les garder pour reprise")
     args = parser.parse_args()
 
     s3_client = boto3.client("s3", region_name=AWS_REGION)
+    manifest = None if args.no_resume else UploadManifest(args.manifest)
 
     # 1. Dumps disponibles sur ListenBrainz
     available = list_available_dumps()
@@ -204,7 +391,8 @@ def main():
         print(f"\n[{i}/{len(missing)}] {dump['filename']}")
         s3_key = S3_PREFIX + dump["filename"]
         try:
-            stream_to_s3(s3_client, dump["url"], args.bucket, s3_key, dump["filename"])
+            stream_to_s3(s3_client, dump["url"], args.bucket, s3_key, dump["filename"],
+                         manifest=manifest, upload_workers=args.upload_workers)
             print(f"  ✓ Uploadé : s3://{args.bucket}/{s3_key}")
             success += 1
         except Exception as e:
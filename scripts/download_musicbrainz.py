@@ -1,127 +1,280 @@
 #!/usr/bin/env python3
 """
 Script pour télécharger les données MusicBrainz
+
+- Plusieurs tables téléchargées en parallèle (--workers)
+- Reprise des téléchargements interrompus (requêtes HTTP Range sur le .part)
+- SHA256 calculé pendant l'écriture: pas de seconde lecture des archives
+- Fichiers déjà vérifiés sautés sans relecture (hash enregistré dans
+  .download_state.json, valide tant que taille et mtime sont inchangées)
+
+Usage:
+    python scripts/download_musicbrainz.py
+    python scripts/download_musicbrainz.py --tables recording artist --workers 2
 """
 
+import argparse
+import hashlib
+import json
 import os
 import sys
-import subprocess
-import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import Dict, List, Optional
+
+import requests
+from tqdm import tqdm
 
 # Configuration
 MUSICBRAINZ_BASE_URL = "https://data.metabrainz.org/pub/musicbrainz/data/json-dumps/"
 MB_TABLES = ["artist", "recording", "release", "release-group"]
 OUTPUT_DIR = Path("data/raw/musicbrainz")
+STATE_FILE = ".download_state.json"
 
-def download_file(url, output_path):
-    """Télécharge un fichier avec wget"""
-    print(f"📥 Téléchargement: {url}")
-    try:
-        subprocess.run(['wget', '-c', '-O', str(output_path), url], check=True)
-        print(f"✅ Téléchargé: {output_path}")
-        return True
-    except subprocess.CalledProcessError as e:
-        print(f"❌ Erreur lors du téléchargement: {e}")
-        return False
-    except FileNotFoundError:
-        print("❌ wget n'est pas installé. Installez-le avec: brew install wget")
-        return False
-
-def verify_checksum(file_path, checksum_file):
-    """Vérifie l'intégrité du fichier téléchargé"""
-    print(f"🔍 Vérification du checksum pour {file_path.name}...")
+CHUNK_SIZE = 1024 * 1024
+MAX_RETRIES = 5
+
+
+class DownloadState:
+    """
+    Hashs des fichiers déjà téléchargés et vérifiés (accès thread-safe).
+
+    Une entrée n'est valable que si la taille et le mtime du fichier n'ont pas
+    changé depuis son enregistrement.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        if path.exists():
+            with open(path, encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def verified_hash(self, file_path: Path) -> Optional[str]:
+        """Hash enregistré pour ce fichier, None s'il est absent ou modifié depuis."""
+        entry = self.entries.get(file_path.name)
+        if entry is None or not file_path.exists():
+            return None
+        stat = file_path.stat()
+        if entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+            return None
+        return entry['sha256']
+
+    def record(self, file_path: Path, sha256: str):
+        stat = file_path.stat()
+        with self.lock:
+            self.entries[file_path.name] = {
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'sha256': sha256,
+            }
+            tmp = self.path.with_suffix('.tmp')
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, indent=2)
+            os.replace(tmp, self.path)
+
+
+def parse_checksums(text: str) -> Dict[str, str]:
+    """Contenu d'un fichier SHA256SUMS → {nom de fichier: sha256}."""
+    checksums = {}
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) >= 2:
+            checksums[parts[-1].lstrip('*')] = parts[0].lower()
+    return checksums
+
+
+def fetch_checksums(session: requests.Session, base_url: str) -> Dict[str, str]:
+    """Télécharge SHA256SUMS. Dictionnaire vide si indisponible."""
     try:
-        with open(checksum_file, 'r') as f:
-            checksums = f.read()
-
-        # Trouver le checksum pour ce fichier
-        for line in checksums.split('\n'):
-            if file_path.name in line:
-                expected_hash = line.split()[0]
-
-                # Calculer le hash du fichier
-                sha256_hash = hashlib.sha256()
-                with open(file_path, "rb") as f:
-                    for byte_block in iter(lambda: f.read(4096), b""):
-                        sha256_hash.update(byte_block)
-
-                actual_hash = sha256_hash.hexdigest()
-
-                if actual_hash == expected_hash:
-                    print(f"✅ Checksum valide pour {file_path.name}")
-                    return True
-                else:
-                    print(f"❌ Checksum invalide pour {file_path.name}")
-                    return False
-
-        print(f"⚠️  Checksum non trouvé pour {file_path.name}")
-        return False
-    except Exception as e:
-        print(f"⚠️  Impossible de vérifier le checksum: {e}")
-        return False
-
-def download_musicbrainz_dumps():
+        resp = session.get(f"{base_url}SHA256SUMS", timeout=30)
+        resp.raise_for_status()
+        return parse_checksums(resp.text)
+    except requests.RequestException as e:
+        print(f"⚠️  Impossible de télécharger les checksums ({e}), continuation sans vérification")
+        return {}
+
+
+def file_sha256(file_path: Path) -> str:
+    """SHA256 d'un fichier existant (lecture par blocs)."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def download_file(
+    session: requests.Session,
+    url: str,
+    output_path: Path,
+    expected_sha256: Optional[str] = None,
+    position: int = 0,
+    max_retries: int = MAX_RETRIES
+) -> str:
+    """
+    Télécharge un fichier dans output_path.part puis le renomme.
+
+    Le SHA256 est calculé au fil de l'écriture. Un .part existant est repris
+    avec un en-tête Range (seul ce préfixe est relu, pour initialiser le hash);
+    une coupure réseau relance la requête à partir de l'octet reçu.
+
+    Returns:
+        SHA256 du fichier
+
+    Raises:
+        ValueError: si le hash ne correspond pas à expected_sha256
+    """
+    part_path = output_path.with_name(output_path.name + '.part')
+    digest = hashlib.sha256()
+    offset = 0
+    if part_path.exists():
+        with open(part_path, 'rb') as f:
+            for block in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(block)
+                offset += len(block)
+
+    attempt = 0
+    with tqdm(total=None, initial=offset, unit='B', unit_scale=True,
+              desc=f"  {output_path.name}", position=position, leave=False) as pbar:
+        while True:
+            headers = {'Range': f'bytes={offset}-'} if offset else {}
+            try:
+                with session.get(url, headers=headers, stream=True, timeout=60) as resp:
+                    if resp.status_code == 416:
+                        # Le .part contient déjà tout le fichier
+                        break
+                    resp.raise_for_status()
+                    if offset and resp.status_code != 206:
+                        # Range ignoré par le serveur: on repart de zéro
+                        digest, offset = hashlib.sha256(), 0
+                        pbar.reset()
+                    length = resp.headers.get('content-length')
+                    if length is not None:
+                        pbar.total = offset + int(length)
+
+                    with open(part_path, 'r+b' if offset else 'wb') as f:
+                        f.seek(offset)
+                        f.truncate()
+                        for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+                            f.write(chunk)
+                            digest.update(chunk)
+                            offset += len(chunk)
+                            pbar.update(len(chunk))
+                break
+            except (requests.ConnectionError, requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError) as e:
+                attempt += 1
+                if attempt > max_retries:
+                    raise
+                tqdm.write(f"🔄 {output_path.name}: reprise à {offset / 1024**2:.1f} MB ({e})")
+                time.sleep(min(2 ** attempt, 30))
+
+    actual = digest.hexdigest()
+    if expected_sha256 and actual != expected_sha256:
+        part_path.unlink()
+        raise ValueError(f"Checksum invalide pour {output_path.name}: {actual} != {expected_sha256}")
+    os.replace(part_path, output_path)
+    return actual
+
+
+def download_table(
+    session: requests.Session,
+    table: str,
+    base_url: str,
+    output_dir: Path,
+    checksums: Dict[str, str],
+    state: DownloadState,
+    position: int = 0
+) -> str:
+    """Télécharge une table si nécessaire. Retourne le statut affiché."""
+    filename = f"{table}.tar.xz"
+    output_path = output_dir / filename
+    expected = checksums.get(filename)
+
+    recorded = state.verified_hash(output_path)
+    if recorded and (expected is None or recorded == expected):
+        return "⏭️  déjà vérifié"
+
+    # Fichier complet sans entrée dans l'état (ex: téléchargé par l'ancien script):
+    # vérifié une fois contre SHA256SUMS plutôt que retéléchargé
+    if recorded is None and expected and output_path.exists():
+        if file_sha256(output_path) == expected:
+            state.record(output_path, expected)
+            return "⏭️  déjà vérifié"
+        tqdm.write(f"🔄 {filename}: checksum invalide, nouveau téléchargement")
+
+    sha256 = download_file(session, f"{base_url}{filename}", output_path, expected, position)
+    state.record(output_path, sha256)
+    size_mb = output_path.stat().st_size / (1024 * 1024)
+    verified = "checksum valide" if expected else "non vérifié (checksum absent)"
+    return f"✅ {size_mb:.2f} MB, {verified}"
+
+
+def download_musicbrainz_dumps(
+    tables: Optional[List[str]] = None,
+    output_dir: Path = OUTPUT_DIR,
+    base_url: str = MUSICBRAINZ_BASE_URL,
+    workers: int = 4
+):
     """Télécharge tous les dumps MusicBrainz"""
-    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    tables = tables or MB_TABLES
+    output_dir.mkdir(parents=True, exist_ok=True)
 
     print("=" * 60)
     print("🎵 Téléchargement des données MusicBrainz")
     print("=" * 60)
-    print(f"Tables à télécharger: {', '.join(MB_TABLES)}")
-    print(f"Destination: {OUTPUT_DIR}")
+    print(f"Tables à télécharger: {', '.join(tables)}")
+    print(f"Destination: {output_dir}")
+    print(f"Téléchargements parallèles: {min(workers, len(tables))}")
     print()
 
-    # Télécharger le fichier de checksums
-    checksum_url = f"{MUSICBRAINZ_BASE_URL}SHA256SUMS"
-    checksum_file = OUTPUT_DIR / "SHA256SUMS"
+    session = requests.Session()
+    checksums = fetch_checksums(session, base_url)
+    state = DownloadState(output_dir / STATE_FILE)
 
-    print("📥 Téléchargement du fichier de checksums...")
-    if not download_file(checksum_url, checksum_file):
-        print("⚠️  Impossible de télécharger les checksums, continuation sans vérification")
-        checksum_file = None
-
-    print()
-
-    # Télécharger chaque table
     success_count = 0
-    for i, table in enumerate(MB_TABLES, 1):
-        print(f"\n[{i}/{len(MB_TABLES)}] Table: {table}")
-        print("-" * 60)
-
-        url = f"{MUSICBRAINZ_BASE_URL}{table}.tar.xz"
-        output_path = OUTPUT_DIR / f"{table}.tar.xz"
-
-        # Vérifier si déjà téléchargé
-        if output_path.exists():
-            print(f"⏭️  Fichier déjà présent: {output_path}")
-            if checksum_file and verify_checksum(output_path, checksum_file):
-                success_count += 1
-                continue
-            else:
-                print("🔄 Re-téléchargement du fichier...")
-
-        # Télécharger
-        if download_file(url, output_path):
-            # Vérifier le checksum si disponible
-            if checksum_file:
-                if verify_checksum(output_path, checksum_file):
-                    success_count += 1
-                else:
-                    print("⚠️  Fichier téléchargé mais checksum invalide")
-            else:
+    with ThreadPoolExecutor(max_workers=min(workers, len(tables))) as executor:
+        futures = {
+            executor.submit(download_table, session, table, base_url, output_dir,
+                            checksums, state, position): table
+            for position, table in enumerate(tables)
+        }
+        for future in as_completed(futures):
+            table = futures[future]
+            try:
+                status = future.result()
                 success_count += 1
-
-        file_size = output_path.stat().st_size / (1024 * 1024) if output_path.exists() else 0
-        print(f"📦 Taille: {file_size:.2f} MB")
+                tqdm.write(f"{table}: {status}")
+            except Exception as e:
+                tqdm.write(f"❌ {table}: {e}")
 
     print("\n" + "=" * 60)
-    print(f"✅ Téléchargement terminé: {success_count}/{len(MB_TABLES)} fichiers")
-    print(f"📂 Données stockées dans: {OUTPUT_DIR.absolute()}")
+    print(f"✅ Téléchargement terminé: {success_count}/{len(tables)} fichiers")
+    print(f"📂 Données stockées dans: {output_dir.absolute()}")
     print("=" * 60)
 
-    return success_count == len(MB_TABLES)
+    return success_count == len(tables)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Télécharger les dumps JSON MusicBrainz")
+    parser.add_argument("--tables", nargs='+', choices=MB_TABLES, default=MB_TABLES,
+                        help="Tables à télécharger")
+    parser.add_argument("--output", type=Path, default=OUTPUT_DIR,
+                        help="Dossier de destination")
+    parser.add_argument("--base-url", default=MUSICBRAINZ_BASE_URL,
+                        help="URL du dossier des dumps")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="Téléchargements simultanés")
+
+    args = parser.parse_args()
+    return download_musicbrainz_dumps(args.tables, args.output, args.base_url, args.workers)
+
 
 if __name__ == "__main__":
-    success = download_musicbrainz_dumps()
-    sys.exit(0 if success else 1)
\ No newline at end of file
+    success = main()
+    sys.exit(0 if success else 1)
@@ -1,13 +1,32 @@
 #!/usr/bin/env python3
 """
 Script pour extraire les dumps incrémentaux ListenBrainz (.tar.zst)
+
+Pipeline en deux étages qui se recouvrent:
+1. Téléchargement S3 → disque: pool de threads (I/O), un client boto3 par thread
+2. Décompression zstd + écriture des fichiers tar: pool de process (CPU),
+   un par cœur par défaut
+
+Les archives téléchargées attendent dans une file bornée (--queue-size)
+avant d'être extraites: le disque ne se remplit pas d'archives en attente
+si l'extraction est le goulot, et les téléchargements continuent pendant
+les extractions. Le débit (MB/s) et le taux d'occupation de chaque étage
+sont affichés à la fin pour voir quelle ressource est saturée.
+
+Usage:
+  python scripts/extract_incrementals.py
+  python scripts/extract_incrementals.py --io-workers 8 --cpu-workers 4
+  python scripts/extract_incrementals.py --local data/raw/listenbrainz/incrementals
 """
 import os
+import shutil
 import sys
 import tarfile
-import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Optional
 
 import zstandard as zstd
 import boto3
@@ -19,22 +38,48 @@ S3_PREFIX = "raw/listenbrainz/incrementals/"
 LOCAL_RAW_DIR = Path(__file__).parent.parent / "data" / "raw" / "listenbrainz"
 LOCAL_EXTRACTED_DIR = Path(__file__).parent.parent / "data" / "extracted" / "listenbrainz"
 
+_local = threading.local()
+
+
+def thread_s3_client():
+    """Client S3 propre au thread courant (une session boto3 n'est pas thread-safe)."""
+    if not hasattr(_local, 's3_client'):
+        _local.s3_client = boto3.session.Session().client('s3')
+    return _local.s3_client
+
 
 def download_from_s3(s3_client, bucket: str, key: str, local_path: Path) -> Path:
     """Télécharge un fichier depuis S3."""
     local_path.parent.mkdir(parents=True, exist_ok=True)
     if not local_path.exists():
-        print(f"Téléchargement de {key}...")
-        s3_client.download_file(bucket, key, str(local_path))
+        tmp_path = local_path.with_name(local_path.name + '.part')
+        s3_client.download_file(bucket, key, str(tmp_path))
+        os.replace(tmp_path, local_path)
     return local_path
 
 
-def extract_tar_zst(archive_path: Path, output_dir: Path) -> list[Path]:
+def download_task(bucket: str, key: str, local_path: Path) -> dict:
+    """Thread I/O: télécharge une archive (si absente) avec le client du thread."""
+    start = time.time()
+    existed = local_path.exists()
+    download_from_s3(thread_s3_client(), bucket, key, local_path)
+    return {
+        'path': local_path,
+        'bytes': 0 if existed else local_path.stat().st_size,
+        'seconds': time.time() - start,
+    }
+
+
+def extract_tar_zst(archive_path: Path, output_dir: Path) -> tuple[list[Path], int]:
     """
-    Extrait une archive .tar.zst et retourne la liste des fichiers extraits.
+    Extrait une archive .tar.zst.
+
+    Returns:
+        (fichiers extraits, octets décompressés)
     """
     output_dir.mkdir(parents=True, exist_ok=True)
     extracted_files = []
+    n_bytes = 0
 
     # Décompression zstd
     dctx = zstd.ZstdDecompressor()
@@ -46,10 +91,31 @@ def extract_tar_zst(archive_path: Path, output_dir: Path) -> list[Path]:
                     if member.isfile():
                         # Extraire le fichier
                         tar.extract(member, path=output_dir)
-                        extracted_path = output_dir / member.name
-                        extracted_files.append(extracted_path)
+                        extracted_files.append(output_dir / member.name)
+                        n_bytes += member.size
+
+    return extracted_files, n_bytes
 
-    return extracted_files
+
+def extract_task(archive_path: Path, output_dir: Path) -> dict:
+    """
+    Process CPU: extrait une archive dans un dossier temporaire puis le renomme,
+    pour qu'une extraction interrompue ne passe pas pour terminée.
+    """
+    start = time.time()
+    tmp_dir = output_dir.with_name(output_dir.name + '.tmp')
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    files, n_bytes = extract_tar_zst(archive_path, tmp_dir)
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(tmp_dir, output_dir)
+    return {
+        'archive': archive_path.name,
+        'status': 'extracted',
+        'files': [output_dir / f.relative_to(tmp_dir) for f in files],
+        'bytes_in': archive_path.stat().st_size,
+        'bytes_out': n_bytes,
+        'seconds': time.time() - start,
+    }
 
 
 def list_s3_archives(s3_client, bucket: str, prefix: str) -> list[str]:
@@ -65,58 +131,173 @@ def list_s3_archives(s3_client, bucket: str, prefix: str) -> list[str]:
     return sorted(archives)
 
 
-def process_archive(s3_client, bucket: str, s3_key: str, raw_dir: Path, extracted_dir: Path) -> dict:
-    """Télécharge et extrait une archive."""
-    filename = Path(s3_key).name
-    local_archive = raw_dir / filename
-    archive_output_dir = extracted_dir / filename.replace('.tar.zst', '')
+def output_dir_for(extracted_dir: Path, filename: str) -> Path:
+    return extracted_dir / filename.replace('.tar.zst', '')
 
-    # Vérifier si déjà extrait
-    if archive_output_dir.exists() and any(archive_output_dir.iterdir()):
-        return {
-            'archive': filename,
-            'status': 'skipped',
-            'files': list(archive_output_dir.glob('**/*'))
-        }
 
-    # Télécharger si nécessaire
-    download_from_s3(s3_client, bucket, s3_key, local_archive)
+def is_extracted(output_dir: Path) -> bool:
+    return output_dir.exists() and any(output_dir.iterdir())
 
-    # Extraire
-    extracted_files = extract_tar_zst(local_archive, archive_output_dir)
 
-    # Optionnel: supprimer l'archive locale après extraction
-    # local_archive.unlink()
+class StageStats:
+    """Débit et occupation d'un étage du pipeline."""
 
-    return {
-        'archive': filename,
-        'status': 'extracted',
-        'files': extracted_files
-    }
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.bytes = 0
+        self.busy = 0.0
+        self.tasks = 0
+
+    def add(self, n_bytes: int, seconds: float):
+        self.bytes += n_bytes
+        self.busy += seconds
+        self.tasks += 1
+
+    def report(self, wall: float) -> str:
+        mb = self.bytes / 1024**2
+        per_worker = mb / self.busy if self.busy else 0.0
+        occupancy = self.busy / (self.workers * wall) * 100 if wall else 0.0
+        return (f"{self.name:15} {self.tasks:>5} tâches | {mb:>9.1f} MB | "
+                f"{mb / wall if wall else 0.0:>7.1f} MB/s global | "
+                f"{per_worker:>6.1f} MB/s par worker | occupation {occupancy:>5.1f}%")
+
+
+def run_pipeline(
+    archives: List[str],
+    bucket: Optional[str],
+    raw_dir: Path,
+    extracted_dir: Path,
+    io_workers: int = 4,
+    cpu_workers: int = 0,
+    queue_size: int = 0
+) -> list[dict]:
+    """
+    Télécharge (pool de threads) et extrait (pool de process) les archives.
+
+    Args:
+        archives: Clés S3, ou chemins locaux si bucket est None
+        bucket: Bucket S3 (None = archives déjà sur disque)
+        raw_dir: Dossier des archives téléchargées
+        extracted_dir: Dossier d'extraction (un sous-dossier par archive)
+        io_workers: Téléchargements simultanés
+        cpu_workers: Extractions simultanées (0 = nombre de cœurs)
+        queue_size: Archives téléchargées en attente d'extraction, au plus
+                    (0 = 2 × cpu_workers)
+
+    Returns:
+        Résultat par archive
+    """
+    cpu_workers = cpu_workers or os.cpu_count() or 1
+    queue_size = queue_size or 2 * cpu_workers
+    download_stats = StageStats("Téléchargement", io_workers)
+    extract_stats = StageStats("Extraction", cpu_workers)
+
+    results = []
+    todo = []
+    for archive in archives:
+        filename = Path(archive).name
+        output_dir = output_dir_for(extracted_dir, filename)
+        if is_extracted(output_dir):
+            results.append({'archive': filename, 'status': 'skipped',
+                            'files': list(output_dir.glob('**/*'))})
+        else:
+            todo.append(archive)
+
+    start = time.time()
+    with tqdm(total=len(archives), initial=len(results), desc="Extraction") as pbar, \
+            ThreadPoolExecutor(max_workers=io_workers) as io_pool, \
+            ProcessPoolExecutor(max_workers=cpu_workers) as cpu_pool:
+        pending_downloads = set()
+        pending_extracts = set()
+        ready = []   # archives téléchargées, en attente d'un process
+        next_index = 0
+
+        while next_index < len(todo) or pending_downloads or pending_extracts or ready:
+            # File bornée: on ne télécharge pas plus loin que queue_size archives d'avance
+            while (next_index < len(todo) and len(pending_downloads) < io_workers
+                   and len(pending_downloads) + len(ready) + len(pending_extracts) < queue_size + cpu_workers):
+                archive = todo[next_index]
+                next_index += 1
+                if bucket is None:
+                    ready.append(Path(archive))
+                else:
+                    local_path = raw_dir / Path(archive).name
+                    pending_downloads.add(io_pool.submit(download_task, bucket, archive, local_path))
+
+            while ready and len(pending_extracts) < cpu_workers:
+                path = ready.pop(0)
+                pending_extracts.add(cpu_pool.submit(
+                    extract_task, path, output_dir_for(extracted_dir, path.name)))
+
+            if not pending_downloads and not pending_extracts:
+                continue
+
+            done, _ = wait(pending_downloads | pending_extracts, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in pending_downloads:
+                    pending_downloads.remove(future)
+                    info = future.result()
+                    download_stats.add(info['bytes'], info['seconds'])
+                    ready.append(info['path'])
+                else:
+                    pending_extracts.remove(future)
+                    result = future.result()
+                    extract_stats.add(result['bytes_out'], result['seconds'])
+                    results.append(result)
+                    pbar.update(1)
+                    pbar.set_postfix({'last': result['archive'][:30]})
+
+    wall = time.time() - start
+    if todo:
+        print(f"\nDébit par étage ({wall:.1f}s):")
+        if bucket is not None:
+            print(f"  {download_stats.report(wall)}")
+        print(f"  {extract_stats.report(wall)}")
+        compressed = sum(r.get('bytes_in', 0) for r in results) / 1024**2
+        print(f"  {'Lecture zstd':15} {compressed:>9.1f} MB compressés "
+              f"({compressed / wall if wall else 0.0:.1f} MB/s)")
+    return results
 
 
-def main(max_archives: int = None, parallel: int = 4):
+def main(
+    max_archives: int = None,
+    io_workers: int = 4,
+    cpu_workers: int = 0,
+    queue_size: int = 0,
+    local_dir: Optional[Path] = None,
+    raw_dir: Path = LOCAL_RAW_DIR,
+    extracted_dir: Path = LOCAL_EXTRACTED_DIR
+):
     """
     Extrait tous les dumps incrémentaux.
 
     Args:
         max_archives: Nombre max d'archives à traiter (None = toutes)
-        parallel: Nombre de téléchargements parallèles
+        io_workers: Nombre de téléchargements parallèles
+        cpu_workers: Nombre d'extractions parallèles (0 = nombre de cœurs)
+        queue_size: Archives téléchargées en attente d'extraction, au plus
+        local_dir: Dossier d'archives déjà téléchargées (pas de S3)
+        raw_dir: Dossier des archives téléchargées
+        extracted_dir: Dossier d'extraction
     """
     print("=" * 60)
     print("Extraction des dumps incrémentaux ListenBrainz")
     print("=" * 60)
 
     # Créer les dossiers
-    LOCAL_RAW_DIR.mkdir(parents=True, exist_ok=True)
-    LOCAL_EXTRACTED_DIR.mkdir(parents=True, exist_ok=True)
-
-    # Client S3
-    s3_client = boto3.client('s3')
+    raw_dir.mkdir(parents=True, exist_ok=True)
+    extracted_dir.mkdir(parents=True, exist_ok=True)
 
     # Lister les archives
-    print(f"\nRecherche des archives dans s3://{S3_BUCKET}/{S3_PREFIX}...")
-    archives = list_s3_archives(s3_client, S3_BUCKET, S3_PREFIX)
+    if local_dir:
+        print(f"\nRecherche des archives dans {local_dir}...")
+        archives = sorted(str(p) for p in local_dir.glob('*.tar.zst'))
+        bucket = None
+    else:
+        print(f"\nRecherche des archives dans s3://{S3_BUCKET}/{S3_PREFIX}...")
+        archives = list_s3_archives(thread_s3_client(), S3_BUCKET, S3_PREFIX)
+        bucket = S3_BUCKET
     print(f"Trouvé {len(archives)} archives")
 
     if max_archives:
@@ -124,26 +305,10 @@ def main(max_archives: int = None, parallel: int = 4):
         print(f"Traitement limité à {max_archives} archives")
 
     # Traiter les archives
-    results = []
-    with tqdm(total=len(archives), desc="Extraction") as pbar:
-        with ThreadPoolExecutor(max_workers=parallel) as executor:
-            futures = {
-                executor.submit(
-                    process_archive,
-                    s3_client,
-                    S3_BUCKET,
-                    s3_key,
-                    LOCAL_RAW_DIR,
-                    LOCAL_EXTRACTED_DIR
-                ): s3_key
-                for s3_key in archives
-            }
-
-            for future in as_completed(futures):
-                result = future.result()
-                results.append(result)
-                pbar.update(1)
-                pbar.set_postfix({'last': result['archive'][:30]})
+    results = run_pipeline(
+        archives, bucket, raw_dir, extracted_dir,
+        io_workers=io_workers, cpu_workers=cpu_workers, queue_size=queue_size
+    )
 
     # Résumé
     extracted = sum(1 for r in results if r['status'] == 'extracted')
@@ -156,7 +321,7 @@ def main(max_archives: int = None, parallel: int = 4):
     print(f"Archives extraites: {extracted}")
     print(f"Archives ignorées (déjà extraites): {skipped}")
     print(f"Total fichiers extraits: {total_files}")
-    print(f"Dossier de sortie: {LOCAL_EXTRACTED_DIR}")
+    print(f"Dossier de sortie: {extracted_dir}")
 
     return results
 
@@ -166,7 +331,20 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description="Extraire les dumps ListenBrainz")
     parser.add_argument("--max", type=int, help="Nombre max d'archives à traiter")
-    parser.add_argument("--parallel", type=int, default=4, help="Téléchargements parallèles")
+    parser.add_argument("--io-workers", "--parallel", type=int, default=4,
+                        help="Téléchargements parallèles (threads)")
+    parser.add_argument("--cpu-workers", type=int, default=0,
+                        help="Extractions parallèles (process, 0 = nombre de cœurs)")
+    parser.add_argument("--queue-size", type=int, default=0,
+                        help="Archives téléchargées en attente d'extraction (0 = 2 × cpu-workers)")
+    parser.add_argument("--local", type=Path,
+                        help="Extraire les .tar.zst d'un dossier local au lieu de S3")
+    parser.add_argument("--raw-dir", type=Path, default=LOCAL_RAW_DIR,
+                        help="Dossier des archives téléchargées")
+    parser.add_argument("--output", type=Path, default=LOCAL_EXTRACTED_DIR,
+                        help="Dossier d'extraction")
 
     args = parser.parse_args()
-    main(max_archives=args.max, parallel=args.parallel)
+    main(max_archives=args.max, io_workers=args.io_workers, cpu_workers=args.cpu_workers,
+         queue_size=args.queue_size, local_dir=args.local,
+         raw_dir=args.raw_dir, extracted_dir=args.output)
@@ -80,50 +80,41 @@ echo "=========================================="
 # Mettre à jour le système et installer les dépendances
 echo "Installation des dépendances..."
 apt-get update
-apt-get install -y awscli python3-pip
+apt-get install -y awscli python3-pip git
 
 # Installer PyArrow pour lire les Parquet
-pip3 install pyarrow pandas
+pip3 install pyarrow tqdm
 
 # Créer un répertoire de travail avec beaucoup d'espace
-mkdir -p /data/input /data/output
+mkdir -p /data/extracted /data/output
 cd /data
 
+# Code du filtre (scripts/filter_time_window.py)
+git clone https://github.com/Thomas-Brvn/Recommandation_musique.git /data/code
+
 # Configuration
 BUCKET_NAME="{}"
 INPUT_FILE="listenbrainz-spark-dump-2382-20260101-000003-full.tar"
 OUTPUT_DIR="/data/output/listenbrainz-2025"
 
-# Timestamps pour 2025 (UTC)
-# 2025-01-01 00:00:00 = 1735689600
-# 2025-12-31 23:59:59 = 1767225599
+# Fenêtre 2025 (UTC), fin exclue
+START_DATE="2025-01-01"
+END_DATE="2026-01-01"
 START_TS=1735689600
 END_TS=1767225599
 
 echo "=========================================="
-echo "Téléchargement depuis S3"
+echo "Téléchargement et extraction en streaming"
 echo "=========================================="
 echo "Fichier: $INPUT_FILE"
 echo "Taille: ~127 GB"
 
-aws s3 cp "s3://$BUCKET_NAME/raw/listenbrainz/$INPUT_FILE" /data/input/$INPUT_FILE --region {}
+# L'archive est extraite à la volée: le .tar n'est jamais écrit sur disque
+set -o pipefail
+aws s3 cp "s3://$BUCKET_NAME/raw/listenbrainz/$INPUT_FILE" - --region {} | tar -xf - -C /data/extracted
 
 if [ $? -ne 0 ]; then
-    echo "✗ Erreur téléchargement depuis S3"
-    exit 1
-fi
-
-echo "✓ Téléchargement terminé"
-
-echo "=========================================="
-echo "Extraction de l'archive"
-echo "=========================================="
-
-mkdir -p /data/extracted
-tar -xf /data/input/$INPUT_FILE -C /data/extracted
-
-if [ $? -ne 0 ]; then
-    echo "✗ Erreur extraction"
+    echo "✗ Erreur téléchargement/extraction"
     exit 1
 fi
 
@@ -145,74 +136,9 @@ cp $EXTRACTED_DIR/SCHEMA_SEQUENCE $OUTPUT_DIR/ 2>/dev/null || true
 cp $EXTRACTED_DIR/TIMESTAMP $OUTPUT_DIR/ 2>/dev/null || true
 cp $EXTRACTED_DIR/COPYING $OUTPUT_DIR/ 2>/dev/null || true
 
-# Script Python pour filtrer les Parquet
-cat > /data/filter_parquet.py << 'PYEOF'
-import sys
-import pyarrow.parquet as pq
-import pyarrow as pa
-from pathlib import Path
-
-def filter_parquet_file(input_file, output_file, start_ts, end_ts):
-    try:
-        # Lire le fichier Parquet
-        table = pq.read_table(input_file)
-
-        # Filtrer sur la colonne listened_at
-        mask = (table['listened_at'] >= start_ts) & (table['listened_at'] <= end_ts)
-        filtered_table = table.filter(mask)
-
-        # Sauvegarder si des données restent
-        if len(filtered_table) > 0:
-            pq.write_table(filtered_table, output_file)
-            return len(filtered_table)
-        else:
-            return 0
-    except Exception as e:
-        print("Erreur sur " + str(input_file) + ": " + str(e))
-        return -1
-
-if __name__ == "__main__":
-    input_dir = sys.argv[1]
-    output_dir = sys.argv[2]
-    start_ts = int(sys.argv[3])
-    end_ts = int(sys.argv[4])
-
-    input_path = Path(input_dir)
-    output_path = Path(output_dir)
-
-    # Trouver tous les fichiers .parquet
-    parquet_files = sorted(input_path.glob("*.parquet"))
-
-    print("Trouve " + str(len(parquet_files)) + " fichiers Parquet")
-
-    total_rows = 0
-    files_kept = 0
-
-    for i, parquet_file in enumerate(parquet_files):
-        print("[" + str(i+1) + "/" + str(len(parquet_files)) + "] Traitement de " + parquet_file.name + "...", end=" ")
-
-        output_file = output_path / parquet_file.name
-        rows = filter_parquet_file(parquet_file, output_file, start_ts, end_ts)
-
-        if rows > 0:
-            print("OK " + str(rows) + " lignes conservees")
-            total_rows += rows
-            files_kept += 1
-        elif rows == 0:
-            print("Aucune donnee 2025")
-        else:
-            print("Erreur")
-
-    print("\\n========================================")
-    print("Resume du filtrage:")
-    print("  - Fichiers traites: " + str(len(parquet_files)))
-    print("  - Fichiers conserves: " + str(files_kept))
-    print("  - Total lignes 2025: " + str(total_rows))
-    print("========================================")
-PYEOF
-
-# Exécuter le filtrage
-python3 /data/filter_parquet.py "$EXTRACTED_DIR" "$OUTPUT_DIR" $START_TS $END_TS
+# Filtrage parallèle avec élagage des row groups (sortie partitionnée par mois)
+python3 /data/code/scripts/filter_time_window.py "$EXTRACTED_DIR" "$OUTPUT_DIR" \\
+    --start $START_DATE --end $END_DATE
 
 if [ $? -ne 0 ]; then
     echo "✗ Erreur filtrage"
@@ -311,7 +237,7 @@ def create_instance(region, bucket_name):
     print("✅ Profil IAM existant trouvé")
 
     # Lancer l'instance avec un volume EBS de 300 GB
-    # (127 GB tar + 127 GB extrait + 50 GB filtré + marge)
+    # (127 GB extrait en streaming + 50 GB filtré + marge)
     print(f"\n🚀 Lancement de l'instance {INSTANCE_TYPE}...")
 
     cmd = f"""aws ec2 run-instances \
@@ -351,9 +277,8 @@ def monitor_instance(instance_id, region):
     print(f"  aws ec2 terminate-instances --instance-ids {instance_id} --region {region}")
 
     print("\n⏱️  Durée estimée:")
-    print("  • Téléchargement S3 -> EC2: 30-60 min")
-    print("  • Extraction tar: 20-30 min")
-    print("  • Filtrage Parquet: 1-2 heures")
+    print("  • Téléchargement + extraction (streaming): 30-60 min")
+    print("  • Filtrage Parquet (row groups élagués, parallèle): 10-30 min")
     print("  • Compression: 10-20 min")
     print("  • Upload S3: 20-40 min")
     print("  • TOTAL: 2-4 heures")
@@ -389,8 +314,8 @@ def main():
 
     # Confirmation
     print("\n📋 Ce script va:")
-    print("  1. Télécharger le fichier complet (127.7 GB) depuis S3")
-    print("  2. L'extraire (~127 GB décompressé)")
+    print("  1. Télécharger et extraire en streaming le fichier complet (127.7 GB) depuis S3")
+    print("  2. Cloner le repo (scripts/filter_time_window.py)")
     print("  3. Filtrer uniquement les données de 2025")
     print("  4. Recompresser et uploader sur S3")
 
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Filtre un dataset d'écoutes Parquet sur une fenêtre temporelle (listened_at).
+
+Fonctionne sur n'importe quel dossier de fichiers Parquet d'écoutes (dump
+Spark complet, listens_raw.parquet, échantillon local):
+
+- Élagage par row group: les statistiques min/max de listened_at sont lues
+  dans les métadonnées, les row groups hors fenêtre ne sont jamais décodés.
+- Projection: seules les colonnes demandées (--columns) sont lues.
+- Streaming: les batches filtrés sont écrits au fur et à mesure dans une
+  sortie partitionnée par mois (month=YYYY-MM/), jamais une table entière
+  en mémoire.
+- Parallélisme: un process par fichier d'entrée.
+
+La fenêtre est [start, end[ en UTC.
+
+Usage:
+  python scripts/filter_time_window.py data/extracted/full data/processed/listens_2025 --year 2025
+  python scripts/filter_time_window.py data/processed/listens_raw.parquet /tmp/q1 \\
+      --start 2025-01-01 --end 2025-04-01 --columns user_name listened_at track_name artist_name
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+from tqdm import tqdm
+
+TIME_COLUMN = 'listened_at'
+PARTITION_COLUMN = 'month'
+
+
+def parse_date(value: str) -> datetime:
+    """Date ISO (YYYY-MM-DD ou YYYY-MM-DDTHH:MM:SS), interprétée en UTC."""
+    date = datetime.fromisoformat(value)
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return date
+
+
+def find_parquet_files(input_path: Path) -> List[Path]:
+    """Fichiers Parquet d'un dossier (récursif), ou le fichier lui-même."""
+    if input_path.is_file():
+        return [input_path]
+    return sorted(p for p in input_path.rglob("*.parquet") if p.is_file())
+
+
+def window_expression(field_type: pa.DataType, start: datetime, end: datetime) -> ds.Expression:
+    """
+    Prédicat [start, end[ sur listened_at, exprimé dans le type de la colonne
+    (timestamp ou epoch en secondes) pour que l'élagage par statistiques
+    s'applique sans conversion.
+    """
+    column = ds.field(TIME_COLUMN)
+    if pa.types.is_timestamp(field_type):
+        low = pa.scalar(start, type=pa.timestamp('us', tz='UTC')).cast(field_type)
+        high = pa.scalar(end, type=pa.timestamp('us', tz='UTC')).cast(field_type)
+    else:
+        low = pa.scalar(int(start.timestamp()), type=field_type)
+        high = pa.scalar(int(end.timestamp()), type=field_type)
+    return (column >= low) & (column < high)
+
+
+def month_array(values: pa.Array) -> pa.Array:
+    """Mois 'YYYY-MM' (UTC) de chaque listened_at."""
+    if not pa.types.is_timestamp(values.type):
+        values = pc.cast(values, pa.int64()).cast(pa.timestamp('s'))
+    return pc.strftime(values, format='%Y-%m')
+
+
+def filter_file(
+    input_file: Path,
+    output_dir: Path,
+    start: datetime,
+    end: datetime,
+    columns: Optional[List[str]],
+    batch_size: int,
+    partition: bool
+) -> Tuple[str, int, int, int]:
+    """
+    Filtre un fichier et écrit ses lignes dans la sortie partitionnée.
+
+    Returns:
+        (nom, row groups total, row groups lus, lignes conservées)
+    """
+    dataset = ds.dataset(str(input_file), format='parquet')
+    schema = dataset.schema
+    if TIME_COLUMN not in schema.names:
+        raise ValueError(f"{input_file}: colonne {TIME_COLUMN} absente")
+
+    predicate = window_expression(schema.field(TIME_COLUMN).type, start, end)
+    fragments = list(dataset.get_fragments())
+    n_row_groups = sum(f.num_row_groups for f in fragments)
+
+    # Row groups dont les statistiques recoupent la fenêtre
+    kept = [rg for f in fragments for rg in f.split_by_row_group(predicate)]
+    n_read = len(kept)
+    if not kept:
+        return input_file.name, n_row_groups, 0, 0
+
+    read_columns = list(columns) if columns else schema.names
+    if partition and TIME_COLUMN not in read_columns:
+        read_columns.append(TIME_COLUMN)
+    out_schema = pa.schema([schema.field(c) for c in read_columns])
+    if partition:
+        out_schema = out_schema.append(pa.field(PARTITION_COLUMN, pa.string()))
+
+    rows = 0
+
+    def batches():
+        nonlocal rows
+        for fragment in kept:
+            scanner = fragment.scanner(columns=read_columns, filter=predicate, batch_size=batch_size)
+            for batch in scanner.to_batches():
+                if batch.num_rows == 0:
+                    continue
+                rows += batch.num_rows
+                if partition:
+                    batch = pa.RecordBatch.from_arrays(
+                        batch.columns + [month_array(batch.column(TIME_COLUMN))],
+                        schema=out_schema
+                    )
+                yield batch
+
+    # Nom unique par fichier source: les process écrivent dans les mêmes
+    # dossiers month=... sans collision
+    stem = input_file.stem.replace('.', '_')
+    ds.write_dataset(
+        batches(),
+        str(output_dir),
+        schema=out_schema,
+        format='parquet',
+        partitioning=[PARTITION_COLUMN] if partition else None,
+        partitioning_flavor='hive' if partition else None,
+        basename_template=f"{stem}-{{i}}.parquet",
+        existing_data_behavior='overwrite_or_ignore'
+    )
+    return input_file.name, n_row_groups, n_read, rows
+
+
+def filter_time_window(
+    input_path: Path,
+    output_dir: Path,
+    start: datetime,
+    end: datetime,
+    columns: Optional[List[str]] = None,
+    workers: int = 0,
+    batch_size: int = 256_000,
+    partition: bool = True
+) -> dict:
+    """
+    Filtre tous les fichiers Parquet d'écoutes sur la fenêtre [start, end[.
+
+    Args:
+        input_path: Fichier ou dossier de fichiers Parquet
+        output_dir: Dossier de sortie (month=YYYY-MM/*.parquet si partition)
+        start: Début de la fenêtre (inclus)
+        end: Fin de la fenêtre (exclue)
+        columns: Colonnes à conserver (défaut: toutes)
+        workers: Nombre de process (0 = nombre de cœurs)
+        batch_size: Taille des batches lus
+        partition: Partitionner la sortie par mois
+
+    Returns:
+        Statistiques du filtrage
+    """
+    print("=" * 60)
+    print("FILTRAGE PAR FENÊTRE TEMPORELLE")
+    print("=" * 60)
+
+    if end <= start:
+        raise ValueError(f"Fenêtre vide: {start} → {end}")
+
+    files = find_parquet_files(input_path)
+    if not files:
+        raise FileNotFoundError(f"Aucun fichier Parquet dans {input_path}")
+
+    workers = workers or os.cpu_count() or 1
+    print(f"Fenêtre: {start.isoformat()} → {end.isoformat()} (fin exclue)")
+    print(f"Fichiers: {len(files)} | process: {min(workers, len(files))}")
+    if columns:
+        print(f"Colonnes: {', '.join(columns)}")
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    stats = {'files': len(files), 'files_kept': 0, 'row_groups': 0, 'row_groups_read': 0, 'rows': 0}
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(files))) as executor:
+        futures = [
+            executor.submit(filter_file, f, output_dir, start, end, columns, batch_size, partition)
+            for f in files
+        ]
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Filtrage"):
+            _, n_row_groups, n_read, rows = future.result()
+            stats['row_groups'] += n_row_groups
+            stats['row_groups_read'] += n_read
+            stats['rows'] += rows
+            stats['files_kept'] += rows > 0
+
+    skipped = stats['row_groups'] - stats['row_groups_read']
+    print(f"\nRow groups: {stats['row_groups']:,} ({skipped:,} ignorés grâce aux statistiques)")
+    print(f"Fichiers avec données: {stats['files_kept']}/{stats['files']}")
+    print(f"Lignes conservées: {stats['rows']:,}")
+    print(f"Sortie: {output_dir}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Filtrer des écoutes Parquet par fenêtre temporelle")
+    parser.add_argument("input", type=Path, help="Fichier ou dossier Parquet d'entrée")
+    parser.add_argument("output", type=Path, help="Dossier de sortie")
+    parser.add_argument("--year", type=int, help="Année complète (raccourci pour --start/--end)")
+    parser.add_argument("--start", type=parse_date, help="Début (inclus), ex: 2025-01-01")
+    parser.add_argument("--end", type=parse_date, help="Fin (exclue), ex: 2026-01-01")
+    parser.add_argument("--columns", nargs='+', help="Colonnes à conserver (défaut: toutes)")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Nombre de process (0 = nombre de cœurs)")
+    parser.add_argument("--batch-size", type=int, default=256_000,
+                        help="Taille des batches lus")
+    parser.add_argument("--no-partition", action="store_true",
+                        help="Ne pas partitionner la sortie par mois")
+
+    args = parser.parse_args()
+
+    if args.year:
+        start = datetime(args.year, 1, 1, tzinfo=timezone.utc)
+        end = datetime(args.year + 1, 1, 1, tzinfo=timezone.utc)
+    elif args.start and args.end:
+        start, end = args.start, args.end
+    else:
+        parser.error("--year ou --start et --end sont requis")
+
+    filter_time_window(
+        input_path=args.input,
+        output_dir=args.output,
+        start=start,
+        end=end,
+        columns=args.columns,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        partition=not args.no_partition
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,510 @@
+#!/usr/bin/env python3
+"""
+Génère un dataset d'écoutes synthétique au format ListenBrainz.
+
+Permet de faire tourner et de mesurer tout le pipeline (parse_listens →
+evaluate, puis l'API) sans AWS ni téléchargement de plusieurs Go:
+
+- Dumps incrémentaux: dossiers listens/YYYY/M.listens (JSON lines, format de
+  parse_listen_line), empaquetés en .tar.zst comme les vrais incrémentaux
+  (--format tar.zst) ou laissés extraits (--format files)
+- Utilisateurs, artistes et titres tirés selon des lois de Zipf
+  (quelques utilisateurs très actifs, quelques titres très écoutés)
+- Goûts: chaque utilisateur a un cluster d'artistes préféré, une part des
+  écoutes (--taste) y est tirée, ce qui donne un signal à ALS
+- Variantes de titres réalistes pour l'étape de déduplication (feat., remix,
+  remaster, casse, accents, numéro de piste), écrites avec leur titre
+  canonique dans catalog.parquet (vérité terrain)
+- Chevauchement entre dumps consécutifs (--overlap) pour listen_dedup.py
+- Reproductible: même --seed, mêmes fichiers, quel que soit --workers
+
+Volume: de 10K à 100M écoutes; chaque dump est généré par blocs, la mémoire
+ne dépend que du catalogue.
+
+Usage:
+  python scripts/generate_synthetic_listens.py --listens 100000
+  python scripts/generate_synthetic_listens.py --listens 10000000 --dumps 30 --overlap 0.02 --workers 8
+  python scripts/generate_synthetic_listens.py --listens 50000 --format files --output data/extracted/synthetic
+"""
+import argparse
+import json
+import os
+import shutil
+import tarfile
+import time
+import unicodedata
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import zstandard as zstd
+from tqdm import tqdm
+
+# Configuration
+OUTPUT_DIR = Path(__file__).parent.parent / "data" / "raw" / "listenbrainz" / "synthetic"
+
+CHUNK_SIZE = 200_000
+N_CLUSTERS = 64
+
+SYLLABLES = [
+    'la', 'mo', 'ri', 'ka', 'ne', 'so', 'vi', 'da', 'lu', 'mé', 'ro', 'ta',
+    'zé', 'pa', 'ni', 'co', 'fé', 'ju', 'bel', 'mar', 'son', 'tor', 'lin',
+    'dor', 'vel', 'nou', 'rè', 'sha', 'kri', 'blu', 'stra', 'ver', 'cœ', 'ä',
+]
+TITLE_WORDS = [
+    'love', 'night', 'fire', 'dream', 'city', 'heart', 'light', 'rain', 'blue',
+    'gold', 'wild', 'summer', 'ocean', 'shadow', 'river', 'echo', 'star', 'soul',
+    'amour', 'nuit', 'été', 'rêve', 'cœur', 'lumière', 'ciel', 'mélodie', 'océan',
+    'noir', 'fièvre', 'étoile', 'café', 'début', 'señor', 'corazón', 'canción',
+]
+
+
+# ──────────────────────────────────────────────
+# Lois de Zipf
+# ──────────────────────────────────────────────
+
+def zipf_cdf(n: int, exponent: float) -> np.ndarray:
+    """CDF d'une loi de Zipf tronquée sur n rangs (p_k ∝ 1/k^s)."""
+    weights = 1.0 / np.arange(1, n + 1, dtype=np.float64) ** exponent
+    cdf = np.cumsum(weights)
+    return cdf / cdf[-1]
+
+
+def zipf_sample(rng: np.random.Generator, cdf: np.ndarray, size: int) -> np.ndarray:
+    """Tire `size` rangs (0-indexés) selon une CDF de Zipf."""
+    return np.minimum(np.searchsorted(cdf, rng.random(size)), len(cdf) - 1)
+
+
+# ──────────────────────────────────────────────
+# Catalogue
+# ──────────────────────────────────────────────
+
+def strip_accents(s: str) -> str:
+    s = unicodedata.normalize('NFD', s)
+    return unicodedata.normalize('NFC', ''.join(c for c in s if unicodedata.category(c) != 'Mn'))
+
+
+def pseudo_name(rng: np.random.Generator, n_words: int, n_syllables: tuple) -> str:
+    words = []
+    for _ in range(n_words):
+        k = rng.integers(n_syllables[0], n_syllables[1] + 1)
+        words.append(''.join(SYLLABLES[i] for i in rng.integers(0, len(SYLLABLES), k)))
+    return ' '.join(w.capitalize() for w in words)
+
+
+def title_variants(rng: np.random.Generator, title: str, artists: List[str], max_variants: int) -> List[str]:
+    """Variantes d'un titre telles qu'on les trouve dans les écoutes réelles."""
+    guest = artists[rng.integers(0, len(artists))]
+    candidates = [
+        f"{title} (feat. {guest})",
+        f"{title} feat. {guest}",
+        f"{title} ({guest} Remix)",
+        f"{title} (Remastered {rng.integers(1995, 2025)})",
+        f"{title} (Live)",
+        f"{title} - Radio Edit",
+        title.upper(),
+        title.lower(),
+        strip_accents(title),
+        f"{rng.integers(1, 20):02d} - {title}",
+    ]
+    picks = rng.choice(len(candidates), size=min(max_variants, len(candidates)), replace=False)
+    return [candidates[i] for i in picks if candidates[i] != title]
+
+
+def mbid(rng: np.random.Generator) -> str:
+    return str(uuid.UUID(bytes=rng.bytes(16), version=4))
+
+
+def build_catalog(
+    n_artists: int,
+    n_tracks: int,
+    seed: int,
+    artist_exponent: float = 1.0,
+    variant_tracks: float = 0.3,
+    max_variants: int = 3,
+    mbid_rate: float = 0.6
+) -> dict:
+    """
+    Construit le catalogue: artistes, titres, variantes et fragments JSON
+    track_metadata pré-sérialisés (un par variante).
+
+    Un artiste populaire (loi de Zipf) a plus de titres; chaque artiste
+    appartient à un cluster de goût.
+    """
+    rng = np.random.default_rng([seed, 0])
+
+    artists, seen = [], set()
+    while len(artists) < n_artists:
+        name = pseudo_name(rng, int(rng.integers(1, 3)), (2, 3))
+        if name not in seen:
+            seen.add(name)
+            artists.append(name)
+    artist_mbids = [mbid(rng) for _ in range(n_artists)]
+    artist_cluster = rng.integers(0, N_CLUSTERS, n_artists)
+
+    track_artist = zipf_sample(rng, zipf_cdf(n_artists, artist_exponent), n_tracks)
+    # Ordre des titres par cluster, pour tirer un titre dans les goûts d'un utilisateur
+    track_cluster = artist_cluster[track_artist]
+    cluster_order = np.argsort(track_cluster, kind='stable')
+    cluster_starts = np.searchsorted(track_cluster[cluster_order], np.arange(N_CLUSTERS + 1))
+
+    fragments, variant_offsets, rows = [], np.zeros(n_tracks + 1, dtype=np.int64), []
+    for track in range(n_tracks):
+        artist = artists[track_artist[track]]
+        n_words = int(rng.integers(1, 4))
+        title = ' '.join(TITLE_WORDS[i] for i in rng.integers(0, len(TITLE_WORDS), n_words)).title()
+        titles = [title]
+        if rng.random() < variant_tracks:
+            titles += title_variants(rng, title, artists, int(rng.integers(1, max_variants + 1)))
+
+        recording_mbid = mbid(rng) if rng.random() < mbid_rate else None
+        additional = {'artist_mbids': [artist_mbids[track_artist[track]]]}
+        if recording_mbid:
+            additional['recording_mbid'] = recording_mbid
+        for variant, name in enumerate(titles):
+            metadata = {'track_name': name, 'artist_name': artist, 'additional_info': additional}
+            fragments.append(json.dumps(metadata, ensure_ascii=False))
+            rows.append((track, variant, artist, name, f"{artist} - {title}",
+                         recording_mbid, int(track_cluster[track])))
+        variant_offsets[track + 1] = len(fragments)
+
+    return {
+        'fragments': fragments,
+        'variant_offsets': variant_offsets,
+        'cluster_order': cluster_order,
+        'cluster_starts': cluster_starts,
+        'rows': rows,
+    }
+
+
+def write_catalog(catalog: dict, path: Path):
+    """Vérité terrain: chaque variante avec son titre canonique."""
+    columns = list(zip(*catalog['rows']))
+    table = pa.table({
+        'track_id': pa.array(columns[0], type=pa.int32()),
+        'variant': pa.array(columns[1], type=pa.int8()),
+        'artist_name': pa.array(columns[2], type=pa.string()),
+        'track_name': pa.array(columns[3], type=pa.string()),
+        'canonical_key': pa.array(columns[4], type=pa.string()),
+        'recording_mbid': pa.array(columns[5], type=pa.string()),
+        'cluster': pa.array(columns[6], type=pa.int16()),
+    })
+    pq.write_table(table, path)
+
+
+# ──────────────────────────────────────────────
+# Écoutes
+# ──────────────────────────────────────────────
+
+_worker = {}
+
+
+def _init_worker(catalog: dict, config: dict):
+    """Initialise un process: catalogue et paramètres partagés par tous les dumps."""
+    _worker['catalog'] = catalog
+    _worker['config'] = config
+    seed = config['seed']
+    rng = np.random.default_rng([seed, 1])
+    n_users = config['n_users']
+    _worker['user_names'] = [json.dumps(f"user_{mbid(rng)[:8]}") for _ in range(n_users)]
+    _worker['user_cluster'] = rng.integers(0, N_CLUSTERS, n_users)
+    _worker['user_cdf'] = zipf_cdf(n_users, config['user_exponent'])
+    _worker['track_cdf'] = zipf_cdf(len(catalog['variant_offsets']) - 1, config['track_exponent'])
+    _worker['track_rank'] = rng.permutation(len(catalog['variant_offsets']) - 1)
+
+
+def generate_chunk(dump: int, chunk: int, n: int, t0: int, t1: int) -> tuple[List[str], np.ndarray]:
+    """
+    Génère les lignes JSON d'un bloc d'écoutes dans [t0, t1[, triées par date.
+    Déterministe: ne dépend que de (seed, dump, bloc).
+
+    Returns:
+        (lignes, timestamps)
+    """
+    w, config = _worker, _worker['config']
+    catalog = w['catalog']
+    rng = np.random.default_rng([config['seed'], 2, dump, chunk])
+
+    users = zipf_sample(rng, w['user_cdf'], n)
+    tracks = w['track_rank'][zipf_sample(rng, w['track_cdf'], n)]
+
+    # Part des écoutes tirée dans le cluster préféré de l'utilisateur
+    taste = rng.random(n) < config['taste']
+    if taste.any():
+        clusters = w['user_cluster'][users[taste]]
+        starts = catalog['cluster_starts'][clusters]
+        sizes = catalog['cluster_starts'][clusters + 1] - starts
+        ranks = zipf_sample(rng, w['track_cdf'], int(taste.sum()))
+        in_cluster = np.where(sizes > 0, starts + ranks % np.maximum(sizes, 1), -1)
+        taste_tracks = np.where(in_cluster >= 0,
+                                catalog['cluster_order'][np.maximum(in_cluster, 0)], tracks[taste])
+        tracks[taste] = taste_tracks
+
+    offsets = catalog['variant_offsets']
+    n_variants = offsets[tracks + 1] - offsets[tracks]
+    variant = np.where(rng.random(n) < config['variant_rate'],
+                       rng.integers(0, 1 << 30, n) % n_variants, 0)
+    fragment_ids = offsets[tracks] + variant
+
+    timestamps = np.sort(rng.integers(t0, t1, n))
+    order = rng.permutation(n)
+    users, fragment_ids = users[order], fragment_ids[order]
+
+    names, fragments = w['user_names'], catalog['fragments']
+    lines = [
+        f'{{"user_name": {names[u]}, "listened_at": {ts}, "track_metadata": {fragments[f]}}}'
+        for u, ts, f in zip(users.tolist(), timestamps.tolist(), fragment_ids.tolist())
+    ]
+    return lines, timestamps
+
+
+def dump_chunks(n_listens: int, t0: int, t1: int) -> List[tuple]:
+    """Découpe un dump en blocs (n, début, fin) consécutifs dans le temps."""
+    n_chunks = max(1, -(-n_listens // CHUNK_SIZE))
+    bounds = np.linspace(t0, t1, n_chunks + 1).astype(np.int64)
+    sizes = np.full(n_chunks, n_listens // n_chunks)
+    sizes[:n_listens % n_chunks] += 1
+    return [(int(sizes[j]), int(bounds[j]), int(bounds[j + 1])) for j in range(n_chunks)]
+
+
+def dump_dir_name(index: int, end: int) -> str:
+    date = datetime.fromtimestamp(end, tz=timezone.utc).strftime('%Y%m%d-%H%M%S')
+    return f"listenbrainz-listens-dump-{index + 1:04d}-{date}-incremental"
+
+
+def write_dump(task: dict) -> dict:
+    """
+    Process: génère un dump (plus, s'il y a chevauchement, la fin du dump
+    précédent) dans listens/YYYY/M.listens, puis l'empaquette si demandé.
+    """
+    config = _worker['config']
+    index, output_dir = task['index'], Path(task['output_dir'])
+    name = dump_dir_name(index, task['t1'])
+    dump_dir = output_dir / name
+    shutil.rmtree(dump_dir, ignore_errors=True)
+
+    handles = {}
+    n_written = 0
+
+    def write(lines: List[str], timestamps: np.ndarray):
+        # Lignes triées par date: un segment contigu par mois
+        nonlocal n_written
+        months = timestamps.astype('datetime64[s]').astype('datetime64[M]')
+        cuts = np.flatnonzero(months[1:] != months[:-1]) + 1
+        for lo, hi in zip(np.r_[0, cuts], np.r_[cuts, len(lines)]):
+            month = months[lo].item()
+            if month not in handles:
+                path = dump_dir / "listens" / str(month.year) / f"{month.month}.listens"
+                path.parent.mkdir(parents=True, exist_ok=True)
+                handles[month] = open(path, 'a', encoding='utf-8')
+            handles[month].write('\n'.join(lines[lo:hi]) + '\n')
+        n_written += len(lines)
+
+    try:
+        # Chevauchement: les dernières écoutes du dump précédent, regénérées à l'identique
+        n_overlap = task['overlap']
+        if n_overlap and index > 0:
+            previous = task['previous_chunks']
+            tail, tail_ts = [], np.empty(0, dtype=np.int64)
+            for j in range(len(previous) - 1, -1, -1):
+                n, t0, t1 = previous[j]
+                lines, timestamps = generate_chunk(index - 1, j, n, t0, t1)
+                tail, tail_ts = lines + tail, np.concatenate([timestamps, tail_ts])
+                if len(tail) >= n_overlap:
+                    break
+            write(tail[-n_overlap:], tail_ts[-n_overlap:])
+
+        for j, (n, t0, t1) in enumerate(task['chunks']):
+            write(*generate_chunk(index, j, n, t0, t1))
+    finally:
+        for handle in handles.values():
+            handle.close()
+
+    path = dump_dir
+    if config['format'] == 'tar.zst':
+        path = output_dir / f"{name}.tar.zst"
+        cctx = zstd.ZstdCompressor(level=3)
+        with open(path, 'wb') as f, cctx.stream_writer(f) as writer:
+            with tarfile.open(fileobj=writer, mode='w|') as tar:
+                tar.add(dump_dir, arcname=name, filter=lambda info: _reproducible(info, task['t1']))
+        shutil.rmtree(dump_dir)
+
+    return {'name': name, 'listens': n_written, 'bytes': _size(path)}
+
+
+def _reproducible(info: tarfile.TarInfo, mtime: int) -> tarfile.TarInfo:
+    """En-têtes tar indépendants de la machine et de l'heure: archives identiques octet pour octet."""
+    info.mtime = mtime
+    info.uid = info.gid = 0
+    info.uname = info.gname = ''
+    return info
+
+
+def _size(path: Path) -> int:
+    if path.is_file():
+        return path.stat().st_size
+    return sum(p.stat().st_size for p in path.rglob('*') if p.is_file())
+
+
+def generate_dataset(
+    output_dir: Path = OUTPUT_DIR,
+    n_listens: int = 100_000,
+    n_users: Optional[int] = None,
+    n_artists: Optional[int] = None,
+    n_tracks: Optional[int] = None,
+    n_dumps: int = 1,
+    start: str = '2025-01-01',
+    end: str = '2025-07-01',
+    fmt: str = 'tar.zst',
+    overlap: float = 0.0,
+    variant_rate: float = 0.15,
+    taste: float = 0.6,
+    user_exponent: float = 0.9,
+    track_exponent: float = 1.05,
+    mbid_rate: float = 0.6,
+    seed: int = 42,
+    workers: int = 0
+) -> dict:
+    """
+    Génère n_listens écoutes réparties en n_dumps dumps consécutifs entre
+    start et end (UTC, fin exclue).
+
+    Les tailles du catalogue sont déduites du volume si non précisées
+    (1 utilisateur pour 100 écoutes, 1 titre pour 20, 10 titres par artiste).
+
+    Returns:
+        Paramètres et statistiques (aussi écrits dans generation.json)
+    """
+    n_users = n_users or max(100, n_listens // 100)
+    n_tracks = n_tracks or min(max(1_000, n_listens // 20), 1_000_000)
+    n_artists = n_artists or max(10, n_tracks // 10)
+    workers = workers or os.cpu_count() or 1
+
+    print("=" * 60)
+    print("GÉNÉRATION D'ÉCOUTES SYNTHÉTIQUES")
+    print("=" * 60)
+    print(f"Écoutes: {n_listens:,} | dumps: {n_dumps} | format: {fmt}")
+    print(f"Utilisateurs: {n_users:,} | artistes: {n_artists:,} | titres: {n_tracks:,}")
+    print(f"Période: {start} → {end} | seed: {seed}")
+
+    t_start = int(datetime.fromisoformat(start).replace(tzinfo=timezone.utc).timestamp())
+    t_end = int(datetime.fromisoformat(end).replace(tzinfo=timezone.utc).timestamp())
+    if t_end <= t_start:
+        raise ValueError(f"Période vide: {start} → {end}")
+
+    began = time.time()
+    catalog = build_catalog(n_artists, n_tracks, seed, mbid_rate=mbid_rate)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    write_catalog(catalog, output_dir / "catalog.parquet")
+    del catalog['rows']
+    print(f"Catalogue: {len(catalog['fragments']):,} variantes de titres ({time.time() - began:.1f}s)")
+
+    config = {
+        'seed': seed, 'n_users': n_users, 'format': fmt, 'taste': taste,
+        'variant_rate': variant_rate, 'user_exponent': user_exponent,
+        'track_exponent': track_exponent,
+    }
+    bounds = np.linspace(t_start, t_end, n_dumps + 1).astype(np.int64)
+    sizes = np.full(n_dumps, n_listens // n_dumps)
+    sizes[:n_listens % n_dumps] += 1
+    chunks = [dump_chunks(int(sizes[k]), int(bounds[k]), int(bounds[k + 1])) for k in range(n_dumps)]
+    tasks = [{
+        'index': k,
+        'output_dir': str(output_dir),
+        't1': int(bounds[k + 1]),
+        'chunks': chunks[k],
+        'previous_chunks': chunks[k - 1] if k else [],
+        'overlap': int(overlap * sizes[k - 1]) if k else 0,
+    } for k in range(n_dumps)]
+
+    dumps = []
+    with ProcessPoolExecutor(max_workers=min(workers, n_dumps), initializer=_init_worker,
+                             initargs=(catalog, config)) as executor:
+        for result in tqdm(executor.map(write_dump, tasks), total=n_dumps, desc="Dumps"):
+            dumps.append(result)
+
+    seconds = time.time() - began
+    written = sum(d['listens'] for d in dumps)
+    size = sum(d['bytes'] for d in dumps)
+    summary = {
+        'params': {
+            'listens': n_listens, 'users': n_users, 'artists': n_artists, 'tracks': n_tracks,
+            'dumps': n_dumps, 'start': start, 'end': end, 'format': fmt, 'overlap': overlap,
+            'variant_rate': variant_rate, 'taste': taste, 'user_exponent': user_exponent,
+            'track_exponent': track_exponent, 'mbid_rate': mbid_rate, 'seed': seed,
+        },
+        'listens_written': written,
+        'duplicates': written - n_listens,
+        'bytes': size,
+        'seconds': round(seconds, 2),
+        'dumps': dumps,
+    }
+    with open(output_dir / "generation.json", 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+
+    print(f"\nÉcoutes écrites: {written:,} (dont {written - n_listens:,} en double entre dumps)")
+    print(f"Taille: {size / 1024**2:.1f} MB | {seconds:.1f}s ({written / max(seconds, 1e-9):,.0f} écoutes/s)")
+    print(f"Sortie: {output_dir}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Générer des écoutes ListenBrainz synthétiques")
+    parser.add_argument("--output", type=Path, default=OUTPUT_DIR,
+                        help="Dossier de sortie")
+    parser.add_argument("--listens", type=int, default=100_000,
+                        help="Nombre d'écoutes (hors chevauchement)")
+    parser.add_argument("--users", type=int, help="Nombre d'utilisateurs (défaut: écoutes / 100)")
+    parser.add_argument("--artists", type=int, help="Nombre d'artistes (défaut: titres / 10)")
+    parser.add_argument("--tracks", type=int, help="Nombre de titres (défaut: écoutes / 20)")
+    parser.add_argument("--dumps", type=int, default=1,
+                        help="Nombre de dumps incrémentaux consécutifs")
+    parser.add_argument("--start", default='2025-01-01', help="Début de la période (inclus)")
+    parser.add_argument("--end", default='2025-07-01', help="Fin de la période (exclue)")
+    parser.add_argument("--format", choices=['tar.zst', 'files'], default='tar.zst',
+                        help="Archives .tar.zst ou dossiers extraits")
+    parser.add_argument("--overlap", type=float, default=0.0,
+                        help="Part du dump précédent répétée en tête de chaque dump")
+    parser.add_argument("--variant-rate", type=float, default=0.15,
+                        help="Probabilité qu'une écoute utilise une variante du titre")
+    parser.add_argument("--taste", type=float, default=0.6,
+                        help="Part des écoutes tirée dans le cluster préféré de l'utilisateur")
+    parser.add_argument("--user-exponent", type=float, default=0.9,
+                        help="Exposant de Zipf de l'activité des utilisateurs")
+    parser.add_argument("--track-exponent", type=float, default=1.05,
+                        help="Exposant de Zipf de la popularité des titres")
+    parser.add_argument("--mbid-rate", type=float, default=0.6,
+                        help="Part des titres avec un recording_mbid")
+    parser.add_argument("--seed", type=int, default=42, help="Graine aléatoire")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Nombre de process (0 = nombre de cœurs)")
+
+    args = parser.parse_args()
+    generate_dataset(
+        output_dir=args.output,
+        n_listens=args.listens,
+        n_users=args.users,
+        n_artists=args.artists,
+        n_tracks=args.tracks,
+        n_dumps=args.dumps,
+        start=args.start,
+        end=args.end,
+        fmt=args.format,
+        overlap=args.overlap,
+        variant_rate=args.variant_rate,
+        taste=args.taste,
+        user_exponent=args.user_exponent,
+        track_exponent=args.track_exponent,
+        mbid_rate=args.mbid_rate,
+        seed=args.seed,
+        workers=args.workers
+    )
+
+
+if __name__ == "__main__":
+    main()
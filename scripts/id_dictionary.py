@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Dictionnaires d'IDs persistants et append-only (utilisateurs, tracks, artistes).
+
+Chaque dictionnaire est un fichier Arrow IPC à une colonne `key`: l'ID d'une
+valeur est son numéro de ligne. Un run n'efface ni ne réordonne jamais les
+valeurs existantes, il ajoute seulement les nouvelles en fin de fichier.
+Les indices de colonnes de user_item_matrix.npz restent donc stables entre
+deux réentraînements (références item_id de la bibliothèque, caches, etc.).
+
+Usage:
+  python scripts/id_dictionary.py                  # résumé des dictionnaires
+  python scripts/id_dictionary.py --lookup tracks "Daft Punk - One More Time"
+"""
+import os
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+import numpy as np
+import pyarrow as pa
+
+# Configuration
+PROCESSED_DIR = Path(__file__).parent.parent / "data" / "processed"
+ID_DICTS_DIR = PROCESSED_DIR / "id_dicts"
+
+DICT_NAMES = ("users", "tracks", "artists")
+SCHEMA = pa.schema([('key', pa.string())])
+
+
+class IdDictionary:
+    """
+    Dictionnaire valeur ↔ ID append-only, persisté en Arrow IPC.
+
+    Attributs:
+        path: Fichier .arrow du dictionnaire
+        keys: Valeurs dans l'ordre des IDs
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.keys: List[str] = []
+        self._to_id: dict = {}
+        self._persisted = 0
+
+        if self.path.exists():
+            with pa.memory_map(str(self.path), 'r') as source:
+                table = pa.ipc.open_file(source).read_all()
+            self.keys = table.column('key').to_pylist()
+            self._to_id = {k: i for i, k in enumerate(self.keys)}
+            self._persisted = len(self.keys)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, value: str) -> bool:
+        return value in self._to_id
+
+    @property
+    def n_new(self) -> int:
+        """Nombre de valeurs ajoutées depuis le dernier chargement/sauvegarde."""
+        return len(self.keys) - self._persisted
+
+    def add(self, values: Iterable[str]) -> int:
+        """
+        Ajoute les valeurs inconnues, dans l'ordre trié pour qu'un même lot
+        de nouvelles valeurs reçoive toujours les mêmes IDs.
+
+        Returns:
+            Nombre de valeurs ajoutées
+        """
+        new_values = sorted({v for v in values if v is not None and v not in self._to_id})
+        start = len(self.keys)
+        for i, value in enumerate(new_values):
+            self._to_id[value] = start + i
+        self.keys.extend(new_values)
+        return len(new_values)
+
+    def encode(self, values: Iterable[str], add_missing: bool = True) -> np.ndarray:
+        """
+        Convertit des valeurs en IDs (int64). Les valeurs inconnues sont
+        ajoutées si add_missing, sinon codées -1.
+        """
+        values = list(values)
+        if add_missing:
+            self.add(values)
+        return np.fromiter((self._to_id.get(v, -1) for v in values), dtype=np.int64, count=len(values))
+
+    def decode(self, ids: Iterable[int]) -> List[Optional[str]]:
+        """Convertit des IDs en valeurs (None si hors limites)."""
+        n = len(self.keys)
+        return [self.keys[i] if 0 <= i < n else None for i in ids]
+
+    def to_dict(self) -> dict:
+        """Mapping valeur → ID complet (format des mappings.json)."""
+        return dict(self._to_id)
+
+    def save(self):
+        """Écrit le dictionnaire (écriture atomique, préfixe existant inchangé)."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix('.tmp')
+        table = pa.table({'key': pa.array(self.keys, type=pa.string())}, schema=SCHEMA)
+        with pa.OSFile(str(tmp), 'wb') as sink:
+            with pa.ipc.new_file(sink, SCHEMA) as writer:
+                writer.write_table(table)
+        os.replace(tmp, self.path)
+        self._persisted = len(self.keys)
+
+    def __repr__(self) -> str:
+        return f"IdDictionary({self.path.name}, {len(self.keys):,} clés)"
+
+
+def load_id_dicts(id_dicts_dir: Path = ID_DICTS_DIR) -> dict:
+    """Charge (ou initialise) les dictionnaires users/tracks/artists."""
+    return {name: IdDictionary(id_dicts_dir / f"{name}.arrow") for name in DICT_NAMES}
+
+
+def save_id_dicts(id_dicts: dict):
+    """Sauvegarde les dictionnaires et affiche les ajouts."""
+    for name, dictionary in id_dicts.items():
+        added = dictionary.n_new
+        dictionary.save()
+        print(f"  - {name:8} {len(dictionary):>12,} IDs (+{added:,})")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspecter les dictionnaires d'IDs")
+    parser.add_argument("--dir", type=Path, default=ID_DICTS_DIR,
+                        help="Dossier des dictionnaires")
+    parser.add_argument("--lookup", nargs=2, metavar=("DICT", "VALUE"),
+                        help="Afficher l'ID d'une valeur (DICT = users, tracks ou artists)")
+
+    args = parser.parse_args()
+    id_dicts = load_id_dicts(args.dir)
+
+    if args.lookup:
+        name, value = args.lookup
+        ids = id_dicts[name].encode([value], add_missing=False)
+        print(f"{value} → {ids[0] if ids[0] >= 0 else 'absent'}")
+        return
+
+    print(f"Dictionnaires dans {args.dir}:")
+    for name, dictionary in id_dicts.items():
+        print(f"  - {name:8} {len(dictionary):>12,} IDs")
+
+
+if __name__ == "__main__":
+    main()
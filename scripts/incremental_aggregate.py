@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+"""
+Agrégation incrémentale des play counts, dump par dump.
+
+Maintient un store persistant (user, track) → play_count, first_listen,
+last_listen, partitionné par hash d'utilisateur (mêmes buckets que
+partitioned_aggregate.py), et un manifest des dumps déjà intégrés.
+
+Un rafraîchissement quotidien ne parse donc que les nouveaux dumps:
+1. Chaque nouveau dump (.tar.zst ou dossier extrait) est parsé et agrégé
+2. Ses deltas sont ajoutés au store, un petit fichier par bucket touché
+   (coût en E/S proportionnel au dump, pas à l'historique); un bucket est
+   compacté (base + deltas réécrits en un fichier) quand il accumule
+   --compact-after deltas
+3. listens.parquet, mappings.json et user_item_matrix.npz sont régénérés
+   depuis le store (déduplication + filtres min_user/min_track)
+
+Les fusions passent par un journal (pending.json): si le process meurt au
+milieu d'un commit, le run suivant le termine au lieu de compter deux fois.
+
+Les écoutes déjà intégrées par un dump précédent (dumps qui se chevauchent)
+sont écartées grâce aux clés d'écoutes du store (voir listen_dedup.py),
+committées avec les buckets. Les clés sont rangées par mois d'écoute: un run
+ne charge que les mois présents dans ses dumps.
+
+Usage:
+  python scripts/incremental_aggregate.py --dumps data/raw/listenbrainz/incrementals
+  python scripts/incremental_aggregate.py --dumps data/extracted/listenbrainz --no-refresh
+  python scripts/incremental_aggregate.py --refresh-only
+"""
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+import pandas as pd
+from tqdm import tqdm
+
+from id_dictionary import ID_DICTS_DIR
+from listen_dedup import ListenDeduplicator, MonthlyKeySet
+from parse_listens import (
+    find_listen_files,
+    listens_to_table,
+    stream_listens_from_archive,
+    stream_listens_from_file,
+)
+from partitioned_aggregate import (
+    BucketSource,
+    aggregate_frame,
+    finalize_aggregates,
+    merge_aggregates,
+    to_timestamp,
+    user_bucket_ids,
+    write_aggregate,
+)
+
+# Configuration
+PROCESSED_DIR = Path(__file__).parent.parent / "data" / "processed"
+DUMPS_DIR = Path(__file__).parent.parent / "data" / "raw" / "listenbrainz" / "incrementals"
+STORE_DIR = PROCESSED_DIR / "aggregate_store"
+OUTPUT_FILE = PROCESSED_DIR / "listens.parquet"
+OUTPUT_MATRIX = PROCESSED_DIR / "user_item_matrix.npz"
+
+DEFAULT_PARTITIONS = 64
+DEFAULT_BATCH_SIZE = 500_000
+DEFAULT_COMPACT_AFTER = 8
+
+
+class AggregateStore:
+    """
+    Store persistant des agrégats (user, track), partitionné par utilisateur.
+
+    Layout:
+        store_dir/
+            manifest.json         # n_partitions + dumps intégrés
+            bucket=NNNN.parquet   # AGGREGATE_SCHEMA (track_key non dédupliqué)
+            deltas/               # bucket=NNNN.SSSSSS.parquet: agrégats d'un dump pas encore compactés
+            listen_keys/          # clés des écoutes intégrées, par mois (MonthlyKeySet)
+            pending.json          # journal du commit en cours (transitoire)
+            staging/              # buckets en cours d'écriture (transitoire)
+    """
+
+    def __init__(
+        self,
+        store_dir: Path = STORE_DIR,
+        n_partitions: int = DEFAULT_PARTITIONS,
+        compact_after: int = DEFAULT_COMPACT_AFTER
+    ):
+        self.store_dir = store_dir
+        self.compact_after = compact_after
+        self.deltas_dir = store_dir / "deltas"
+        self.manifest_file = store_dir / "manifest.json"
+        self.pending_file = store_dir / "pending.json"
+        self.staging_dir = store_dir / "staging"
+        self.keys_dir = store_dir / "listen_keys"
+
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        if self.manifest_file.exists():
+            with open(self.manifest_file, encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {'n_partitions': n_partitions, 'dumps': {}}
+            self._write_manifest()
+
+        self._recover()
+        self.deduplicator = ListenDeduplicator(MonthlyKeySet.load(self.keys_dir))
+
+    @property
+    def n_partitions(self) -> int:
+        return self.manifest['n_partitions']
+
+    def bucket_path(self, bucket: int) -> Path:
+        return self.store_dir / f"bucket={bucket:04d}.parquet"
+
+    def bucket_paths(self) -> List[Path]:
+        """Fichiers de base des buckets (sans les deltas non compactés)."""
+        return sorted(self.store_dir.glob("bucket=*.parquet"))
+
+    def delta_paths(self, bucket: int) -> List[Path]:
+        return sorted(self.deltas_dir.glob(f"bucket={bucket:04d}.*.parquet"))
+
+    def bucket_sources(self) -> List[BucketSource]:
+        """Fichiers de chaque bucket non vide: base puis deltas, fusionnés à la lecture."""
+        sources = []
+        for bucket in range(self.n_partitions):
+            base = self.bucket_path(bucket)
+            files = ([base] if base.exists() else []) + self.delta_paths(bucket)
+            if files:
+                sources.append(files[0] if len(files) == 1 else files)
+        return sources
+
+    def has_dump(self, dump_name: str) -> bool:
+        return dump_name in self.manifest['dumps']
+
+    def _write_manifest(self):
+        tmp = self.manifest_file.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp, self.manifest_file)
+
+    def _recover(self):
+        """Termine un commit interrompu (roll-forward du journal)."""
+        if not self.pending_file.exists():
+            shutil.rmtree(self.staging_dir, ignore_errors=True)
+            return
+
+        with open(self.pending_file, encoding='utf-8') as f:
+            pending = json.load(f)
+        print(f"Reprise du commit interrompu: {pending['dump'] or 'compaction'}")
+        self._apply_pending(pending)
+
+    def _apply_pending(self, pending: dict):
+        for name in pending['buckets']:
+            staged = self.staging_dir / name
+            if staged.exists():
+                target = self.store_dir / name
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(staged, target)
+        # Deltas absorbés par une compaction
+        for name in pending.get('remove', []):
+            (self.store_dir / name).unlink(missing_ok=True)
+        if pending['dump'] is not None:
+            self.manifest['dumps'][pending['dump']] = pending['info']
+            self._write_manifest()
+        self.pending_file.unlink()
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+    def _commit(self, pending: dict):
+        tmp = self.pending_file.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(pending, f)
+        os.replace(tmp, self.pending_file)
+        self._apply_pending(pending)
+
+    def merge_delta(self, dump_name: str, delta: pd.DataFrame, info: dict):
+        """
+        Ajoute les agrégats d'un dump au store.
+
+        Chaque bucket touché reçoit un fichier delta (seules les lignes du
+        dump sont écrites); les buckets ayant accumulé compact_after deltas
+        sont ensuite compactés. Sans cela, chaque dump réécrirait presque
+        tous les buckets: O(historique) en E/S par incrément.
+
+        Args:
+            dump_name: Nom du dump (clé du manifest)
+            delta: Agrégats du dump au schéma AGGREGATE_SCHEMA
+            info: Métadonnées enregistrées dans le manifest
+        """
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
+        delta = delta.assign(bucket=user_bucket_ids(delta['user_name'].values, self.n_partitions))
+
+        # Numéro de séquence unique par dump: ordre des deltas d'un bucket
+        seq = len(self.manifest['dumps'])
+        staged = []
+        (self.staging_dir / self.deltas_dir.name).mkdir(parents=True, exist_ok=True)
+        for bucket, part in tqdm(delta.groupby('bucket', sort=True), desc="Deltas"):
+            name = f"{self.deltas_dir.name}/bucket={bucket:04d}.{seq:06d}.parquet"
+            write_aggregate(part.drop(columns='bucket'), self.staging_dir / name)
+            staged.append(name)
+
+        # Clés d'écoutes modifiées: committées avec les buckets
+        key_files = self.deduplicator.key_set.save(self.staging_dir / self.keys_dir.name, only_dirty=True)
+        staged.extend(str(p.relative_to(self.staging_dir)) for p in key_files)
+
+        self._commit({'dump': dump_name, 'buckets': staged, 'info': info})
+        self.compact(self.compact_after)
+
+    def compact(self, min_deltas: int = 1):
+        """
+        Réécrit base + deltas en un seul fichier pour les buckets ayant au
+        moins min_deltas deltas (commit journalisé comme une fusion).
+        """
+        todo = {}
+        for bucket in range(self.n_partitions):
+            deltas = self.delta_paths(bucket)
+            if deltas and len(deltas) >= max(min_deltas, 1):
+                todo[bucket] = deltas
+        if not todo:
+            return
+
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
+        staged, removed = [], []
+        for bucket, deltas in tqdm(todo.items(), desc="Compaction"):
+            path = self.bucket_path(bucket)
+            files = ([path] if path.exists() else []) + deltas
+            merged = merge_aggregates(pd.concat([pd.read_parquet(f) for f in files], ignore_index=True))
+            write_aggregate(merged, self.staging_dir / path.name)
+            staged.append(path.name)
+            removed.extend(str(f.relative_to(self.store_dir)) for f in deltas)
+
+        self._commit({'dump': None, 'buckets': staged, 'remove': removed, 'info': None})
+
+
+# ──────────────────────────────────────────────
+# Dumps
+# ──────────────────────────────────────────────
+
+def dump_name(path: Path) -> str:
+    """Nom d'un dump, qu'il soit archivé (.tar.zst) ou déjà extrait (dossier)."""
+    name = path.name
+    return name[:-len('.tar.zst')] if name.endswith('.tar.zst') else name
+
+
+def find_dumps(dumps_dir: Path) -> List[Path]:
+    """Liste les dumps incrémentaux: archives .tar.zst ou dossiers extraits."""
+    dumps = [p for p in dumps_dir.iterdir()
+             if p.is_dir() or p.name.endswith('.tar.zst')]
+    return sorted(dumps, key=dump_name)
+
+
+def stream_dump(path: Path) -> Iterator[dict]:
+    """Génère les écoutes d'un dump."""
+    if path.is_dir():
+        for filepath in find_listen_files(path):
+            yield from stream_listens_from_file(filepath)
+    else:
+        yield from stream_listens_from_archive(path)
+
+
+def aggregate_dump(
+    path: Path,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    deduplicator: Optional[ListenDeduplicator] = None
+) -> tuple[pd.DataFrame, int, int]:
+    """
+    Parse et agrège un seul dump.
+
+    Args:
+        path: Dump (.tar.zst ou dossier extrait)
+        batch_size: Écoutes par batch
+        deduplicator: Écarte les écoutes déjà vues (None = pas de déduplication)
+
+    Returns:
+        (agrégats au schéma AGGREGATE_SCHEMA, nombre d'écoutes, doublons écartés)
+    """
+    partials = []
+    batch = []
+    n_listens = 0
+    n_duplicates = 0
+
+    def flush():
+        nonlocal n_duplicates
+        table = listens_to_table(batch)
+        if deduplicator is not None:
+            table, duplicates = deduplicator.filter_table(table)
+            n_duplicates += duplicates
+        df = table.select(['user_name', 'listened_at', 'track_name', 'artist_name']).to_pandas()
+        df['listened_at'] = to_timestamp(df['listened_at'])
+        if len(df):
+            partials.append(aggregate_frame(df))
+        batch.clear()
+
+    for listen in stream_dump(path):
+        batch.append(listen)
+        n_listens += 1
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    if not partials:
+        return pd.DataFrame(), n_listens, n_duplicates
+    return merge_aggregates(pd.concat(partials, ignore_index=True)), n_listens, n_duplicates
+
+
+# ──────────────────────────────────────────────
+# Pipeline principal
+# ──────────────────────────────────────────────
+
+def ingest_dumps(
+    dumps_dir: Path = DUMPS_DIR,
+    store: Optional[AggregateStore] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE
+) -> List[str]:
+    """Intègre au store tous les dumps absents du manifest. Retourne leurs noms."""
+    store = store or AggregateStore()
+    new_dumps = [p for p in find_dumps(dumps_dir) if not store.has_dump(dump_name(p))]
+    print(f"Dumps déjà intégrés: {len(store.manifest['dumps'])}")
+    print(f"Nouveaux dumps     : {len(new_dumps)}")
+
+    ingested = []
+    for i, path in enumerate(new_dumps, 1):
+        name = dump_name(path)
+        print(f"\n[{i}/{len(new_dumps)}] {name}")
+        delta, n_listens, n_duplicates = aggregate_dump(path, batch_size, store.deduplicator)
+        rate = n_duplicates / n_listens * 100 if n_listens else 0.0
+        print(f"  Écoutes: {n_listens:,} | Doublons: {n_duplicates:,} ({rate:.2f}%) "
+              f"| Interactions: {len(delta):,}")
+
+        info = {
+            'listens': n_listens,
+            'duplicates': n_duplicates,
+            'interactions': len(delta),
+            'ingested_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        }
+        if not delta.empty:
+            store.merge_delta(name, delta, info)
+        else:
+            store.manifest['dumps'][name] = info
+            store._write_manifest()
+        ingested.append(name)
+
+    return ingested
+
+
+def refresh_outputs(
+    store: AggregateStore,
+    output_file: Path = OUTPUT_FILE,
+    output_matrix: Path = OUTPUT_MATRIX,
+    min_user_listens: int = 5,
+    min_track_listens: int = 3,
+    workers: int = 0,
+    confidence_scaling: float = 40.0,
+    id_dicts_dir: Optional[Path] = ID_DICTS_DIR
+):
+    """
+    Régénère listens.parquet, mappings.json et la matrice depuis le store.
+    Les IDs viennent des dictionnaires persistants (id_dicts_dir): les
+    colonnes de la matrice ne bougent pas d'un rafraîchissement à l'autre.
+    Avec id_dicts_dir=None, les IDs sont réattribués à chaque run.
+    """
+    from build_matrix import build_sparse_matrix
+
+    work_dir = store.store_dir.parent / "partitions"
+    shutil.rmtree(work_dir, ignore_errors=True)
+    try:
+        finalize_aggregates(
+            store.bucket_sources(), work_dir,
+            output_file=output_file,
+            processed_dir=output_file.parent,
+            min_user_listens=min_user_listens,
+            min_track_listens=min_track_listens,
+            workers=workers or os.cpu_count() or 1,
+            id_dicts_dir=id_dicts_dir,
+        )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    build_sparse_matrix(
+        input_file=output_file,
+        output_matrix=output_matrix,
+        confidence_scaling=confidence_scaling,
+        id_dicts_dir=id_dicts_dir
+    )
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Agrégation incrémentale des dumps ListenBrainz")
+    parser.add_argument("--dumps", type=Path, default=DUMPS_DIR,
+                        help="Dossier des dumps (.tar.zst ou dossiers extraits)")
+    parser.add_argument("--store", type=Path, default=STORE_DIR,
+                        help="Dossier du store d'agrégats")
+    parser.add_argument("--partitions", type=int, default=DEFAULT_PARTITIONS,
+                        help="Nombre de buckets (à la création du store uniquement)")
+    parser.add_argument("--compact-after", type=int, default=DEFAULT_COMPACT_AFTER,
+                        help="Deltas accumulés avant compaction d'un bucket (chaque dump n'écrit "
+                             "que ses propres lignes; la compaction réécrit le bucket entier)")
+    parser.add_argument("--compact", action="store_true",
+                        help="Compacter tous les buckets avant de continuer")
+    parser.add_argument("--output", type=Path, default=OUTPUT_FILE,
+                        help="Fichier listens.parquet régénéré")
+    parser.add_argument("--matrix", type=Path, default=OUTPUT_MATRIX,
+                        help="Matrice .npz régénérée")
+    parser.add_argument("--id-dicts", type=Path, default=None,
+                        help="Dossier des dictionnaires d'IDs persistants (défaut: id_dicts/ à côté de --output)")
+    parser.add_argument("--no-id-dicts", action="store_true",
+                        help="Réattribuer les IDs à chaque run (ancien comportement)")
+    parser.add_argument("--min-user-listens", type=int, default=5,
+                        help="Minimum d'écoutes par utilisateur")
+    parser.add_argument("--min-track-listens", type=int, default=3,
+                        help="Minimum d'écoutes par track")
+    parser.add_argument("--alpha", type=float, default=40.0,
+                        help="Facteur de scaling des confidences")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Nombre de process (0 = nombre de cœurs)")
+    parser.add_argument("--no-refresh", action="store_true",
+                        help="Intégrer les dumps sans régénérer la matrice")
+    parser.add_argument("--refresh-only", action="store_true",
+                        help="Régénérer la matrice sans chercher de nouveaux dumps")
+
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Agrégation incrémentale des écoutes")
+    print("=" * 60)
+
+    store = AggregateStore(args.store, n_partitions=args.partitions, compact_after=args.compact_after)
+    if args.compact:
+        store.compact()
+
+    if not args.refresh_only:
+        ingested = ingest_dumps(args.dumps, store)
+        if not ingested:
+            print("\nAucun nouveau dump: store et matrice à jour.")
+            return
+
+    if not args.no_refresh:
+        refresh_outputs(
+            store,
+            output_file=args.output,
+            output_matrix=args.matrix,
+            min_user_listens=args.min_user_listens,
+            min_track_listens=args.min_track_listens,
+            workers=args.workers,
+            confidence_scaling=args.alpha,
+            id_dicts_dir=None if args.no_id_dicts else (args.id_dicts or args.output.parent / ID_DICTS_DIR.name)
+        )
+
+
+if __name__ == "__main__":
+    main()
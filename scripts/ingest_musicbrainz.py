@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+"""
+Ingestion des dumps JSON MusicBrainz en tables Parquet de métadonnées.
+
+download_musicbrainz.py télécharge artist, recording, release et
+release-group en .tar.xz: chaque archive contient mbdump/<entité>, un
+document JSON par ligne (plusieurs Ko par ligne pour les releases).
+
+Ingestion en streaming, sans extraction sur disque:
+1. L'archive est décompressée à la volée (tarfile en mode flux 'r|xz')
+2. Les lignes sont envoyées par blocs à un process pool qui parse le JSON
+   et ne garde que les colonnes projetées (nombre de blocs en vol borné)
+3. Les colonnes sont écrites en Parquet au fil de l'eau (un row group par
+   bloc), une table par entité, clé = MBID
+
+Tables produites (data/processed/musicbrainz/):
+    recording.parquet          recording_mbid, titre, durée, artistes, année, tags, genres
+    artist.parquet             artist_mbid, nom, type, pays, année de début, tags, genres
+    release.parquet            release_mbid, titre, release_group_mbid, année, statut, pays
+    recording_release.parquet  (recording_mbid, release_mbid, année) depuis les tracklists
+    release_group.parquet      release_group_mbid, titre, type, année, tags, genres
+
+recording_mbid est la colonne extraite par parse_listens.parse_listen_line:
+les écoutes se joignent directement à recording.parquet.
+
+Usage:
+  python scripts/ingest_musicbrainz.py
+  python scripts/ingest_musicbrainz.py --entities recording artist --workers 4
+  python scripts/ingest_musicbrainz.py --listens data/processed/listens_raw.parquet
+"""
+import argparse
+import json
+import os
+import tarfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from tqdm import tqdm
+
+# Configuration
+RAW_DIR = Path(__file__).parent.parent / "data" / "raw" / "musicbrainz"
+OUTPUT_DIR = Path(__file__).parent.parent / "data" / "processed" / "musicbrainz"
+
+DEFAULT_CHUNK_LINES = 2_000
+
+TAGS = pa.list_(pa.string())
+
+SCHEMAS = {
+    'recording': pa.schema([
+        ('recording_mbid', pa.string()),
+        ('title', pa.string()),
+        ('length_ms', pa.int64()),
+        ('artist_credit', pa.string()),
+        ('artist_mbid', pa.string()),
+        ('artist_mbids', pa.list_(pa.string())),
+        ('first_release_year', pa.int16()),
+        ('tags', TAGS),
+        ('genres', TAGS),
+    ]),
+    'artist': pa.schema([
+        ('artist_mbid', pa.string()),
+        ('name', pa.string()),
+        ('sort_name', pa.string()),
+        ('type', pa.string()),
+        ('country', pa.string()),
+        ('begin_year', pa.int16()),
+        ('tags', TAGS),
+        ('genres', TAGS),
+    ]),
+    'release': pa.schema([
+        ('release_mbid', pa.string()),
+        ('title', pa.string()),
+        ('release_group_mbid', pa.string()),
+        ('artist_mbid', pa.string()),
+        ('year', pa.int16()),
+        ('status', pa.string()),
+        ('country', pa.string()),
+    ]),
+    'recording_release': pa.schema([
+        ('recording_mbid', pa.string()),
+        ('release_mbid', pa.string()),
+        ('year', pa.int16()),
+    ]),
+    'release_group': pa.schema([
+        ('release_group_mbid', pa.string()),
+        ('title', pa.string()),
+        ('primary_type', pa.string()),
+        ('artist_mbid', pa.string()),
+        ('first_release_year', pa.int16()),
+        ('tags', TAGS),
+        ('genres', TAGS),
+    ]),
+}
+
+# Tables produites par chaque dump
+ENTITY_TABLES = {
+    'recording': ['recording'],
+    'artist': ['artist'],
+    'release': ['release', 'recording_release'],
+    'release-group': ['release_group'],
+}
+
+
+# ──────────────────────────────────────────────
+# Projection des documents JSON
+# ──────────────────────────────────────────────
+
+def parse_year(date: Optional[str]) -> Optional[int]:
+    """Année d'une date MusicBrainz ('YYYY', 'YYYY-MM' ou 'YYYY-MM-DD'), None si absente."""
+    if not date or len(date) < 4 or not date[:4].isdigit():
+        return None
+    return int(date[:4])
+
+
+def names(items: Optional[list]) -> List[str]:
+    """Noms des tags/genres, du plus voté au moins voté."""
+    items = sorted(items or [], key=lambda t: -t.get('count', 0))
+    return [t['name'] for t in items if t.get('name')]
+
+
+def credit_name(credits: list) -> str:
+    """Crédit artiste tel qu'affiché ('A feat. B')."""
+    return ''.join(c.get('name', '') + c.get('joinphrase', '') for c in credits)
+
+
+def credit_mbids(credits: list) -> List[str]:
+    return [c['artist']['id'] for c in credits if c.get('artist', {}).get('id')]
+
+
+def project_recording(doc: dict, rows: Dict[str, list]):
+    credits = doc.get('artist-credit') or []
+    mbids = credit_mbids(credits)
+    rows['recording'].append((
+        doc['id'], doc.get('title'), doc.get('length'),
+        credit_name(credits), mbids[0] if mbids else None, mbids,
+        parse_year(doc.get('first-release-date')),
+        names(doc.get('tags')), names(doc.get('genres')),
+    ))
+
+
+def project_artist(doc: dict, rows: Dict[str, list]):
+    rows['artist'].append((
+        doc['id'], doc.get('name'), doc.get('sort-name'), doc.get('type'),
+        doc.get('country'), parse_year((doc.get('life-span') or {}).get('begin')),
+        names(doc.get('tags')), names(doc.get('genres')),
+    ))
+
+
+def project_release(doc: dict, rows: Dict[str, list]):
+    mbids = credit_mbids(doc.get('artist-credit') or [])
+    year = parse_year(doc.get('date'))
+    rows['release'].append((
+        doc['id'], doc.get('title'), (doc.get('release-group') or {}).get('id'),
+        mbids[0] if mbids else None, year, doc.get('status'), doc.get('country'),
+    ))
+    seen = set()
+    for medium in doc.get('media') or []:
+        for track in medium.get('tracks') or []:
+            recording_mbid = (track.get('recording') or {}).get('id')
+            if recording_mbid and recording_mbid not in seen:
+                seen.add(recording_mbid)
+                rows['recording_release'].append((recording_mbid, doc['id'], year))
+
+
+def project_release_group(doc: dict, rows: Dict[str, list]):
+    mbids = credit_mbids(doc.get('artist-credit') or [])
+    rows['release_group'].append((
+        doc['id'], doc.get('title'), doc.get('primary-type'),
+        mbids[0] if mbids else None, parse_year(doc.get('first-release-date')),
+        names(doc.get('tags')), names(doc.get('genres')),
+    ))
+
+
+PROJECTIONS = {
+    'recording': project_recording,
+    'artist': project_artist,
+    'release': project_release,
+    'release-group': project_release_group,
+}
+
+
+def converter(field_type: pa.DataType):
+    """
+    Validation d'une valeur pour une colonne: retourne la valeur convertie, ou
+    lève ValueError/TypeError (ligne comptée en erreur plutôt que d'échouer
+    à la construction du RecordBatch).
+    """
+    if pa.types.is_integer(field_type):
+        bits = field_type.bit_width - 1
+        low, high = -(1 << bits), (1 << bits) - 1
+
+        def convert(value):
+            if value is None:
+                return None
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise TypeError(f"entier attendu: {value!r}")
+            if isinstance(value, float) and not value.is_integer():
+                raise ValueError(f"entier attendu: {value!r}")
+            value = int(value)
+            if not low <= value <= high:
+                raise ValueError(f"hors limites pour {field_type}: {value}")
+            return value
+        return convert
+
+    if pa.types.is_list(field_type):
+        convert_item = converter(field_type.value_type)
+
+        def convert(value):
+            if value is None:
+                return None
+            if not isinstance(value, list):
+                raise TypeError(f"liste attendue: {value!r}")
+            return [convert_item(item) for item in value]
+        return convert
+
+    def convert(value):
+        if value is not None and not isinstance(value, str):
+            raise TypeError(f"chaîne attendue: {value!r}")
+        return value
+    return convert
+
+
+CONVERTERS = {table: [converter(field.type) for field in schema] for table, schema in SCHEMAS.items()}
+
+
+def validate_row(table: str, row: tuple) -> tuple:
+    return tuple(convert(value) for convert, value in zip(CONVERTERS[table], row))
+
+
+def parse_chunk(entity: str, lines: List[bytes]) -> tuple:
+    """
+    Worker: parse un bloc de lignes JSON et projette les colonnes utiles.
+
+    Returns:
+        ({table: RecordBatch}, lignes en erreur, octets lus)
+    """
+    rows = {table: [] for table in ENTITY_TABLES[entity]}
+    project = PROJECTIONS[entity]
+    errors = 0
+    for line in lines:
+        # Projection et validation dans un tampon: une ligne invalide n'ajoute rien
+        doc_rows = {table: [] for table in rows}
+        try:
+            project(json.loads(line), doc_rows)
+            validated = {table: [validate_row(table, row) for row in values]
+                         for table, values in doc_rows.items()}
+        except (ValueError, KeyError, TypeError, AttributeError):
+            errors += 1
+            continue
+        for table, values in validated.items():
+            rows[table].extend(values)
+
+    batches = {}
+    for table, values in rows.items():
+        schema = SCHEMAS[table]
+        columns = list(zip(*values)) if values else [[] for _ in schema]
+        batches[table] = pa.RecordBatch.from_arrays(
+            [pa.array(col, type=field.type) for col, field in zip(columns, schema)],
+            schema=schema
+        )
+    return batches, errors, sum(len(line) for line in lines)
+
+
+# ──────────────────────────────────────────────
+# Lecture en flux
+# ──────────────────────────────────────────────
+
+def find_dump(raw_dir: Path, entity: str) -> Optional[Path]:
+    """Archive <entité>.tar.xz, ou fichier mbdump/<entité> déjà extrait."""
+    for candidate in (raw_dir / f"{entity}.tar.xz", raw_dir / "mbdump" / entity):
+        if candidate.exists():
+            return candidate
+    return None
+
+
+def stream_chunks(path: Path, entity: str, chunk_lines: int) -> Iterator[List[bytes]]:
+    """Blocs de lignes JSON du fichier mbdump/<entité>, décompressés à la volée."""
+    def chunks(f) -> Iterator[List[bytes]]:
+        chunk = []
+        for line in f:
+            if line.strip():
+                chunk.append(line)
+                if len(chunk) >= chunk_lines:
+                    yield chunk
+                    chunk = []
+        if chunk:
+            yield chunk
+
+    if not path.name.endswith('.tar.xz'):
+        with open(path, 'rb') as f:
+            yield from chunks(f)
+        return
+
+    with tarfile.open(path, mode='r|xz') as tar:
+        for member in tar:
+            if member.isfile() and member.name.endswith(f"mbdump/{entity}"):
+                yield from chunks(tar.extractfile(member))
+                return
+    raise FileNotFoundError(f"mbdump/{entity} absent de {path}")
+
+
+def ingest_entity(
+    path: Path,
+    entity: str,
+    output_dir: Path,
+    workers: int = 0,
+    chunk_lines: int = DEFAULT_CHUNK_LINES
+) -> dict:
+    """
+    Ingère un dump: lignes JSON → tables Parquet projetées.
+
+    Les blocs sont parsés en parallèle; au plus 2 × workers blocs sont en
+    vol, la mémoire reste bornée quelle que soit la taille du dump.
+
+    Returns:
+        Statistiques (documents, erreurs, lignes par table, MB/s)
+    """
+    workers = workers or os.cpu_count() or 1
+    output_dir.mkdir(parents=True, exist_ok=True)
+    tables = ENTITY_TABLES[entity]
+    tmp_paths = {t: output_dir / f"{t}.parquet.tmp" for t in tables}
+    writers = {t: pq.ParquetWriter(tmp_paths[t], SCHEMAS[t], compression='zstd') for t in tables}
+    stats = {'documents': 0, 'errors': 0, 'bytes': 0, 'rows': {t: 0 for t in tables}}
+
+    def collect(future):
+        batches, errors, n_bytes = future.result()
+        stats['errors'] += errors
+        stats['bytes'] += n_bytes
+        for table, batch in batches.items():
+            if batch.num_rows:
+                writers[table].write_batch(batch)
+                stats['rows'][table] += batch.num_rows
+
+    start = time.time()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = set()
+            progress = tqdm(desc=entity, unit=" docs")
+            for chunk in stream_chunks(path, entity, chunk_lines):
+                if len(pending) >= 2 * workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(future)
+                pending.add(executor.submit(parse_chunk, entity, chunk))
+                stats['documents'] += len(chunk)
+                progress.update(len(chunk))
+            for future in pending:
+                collect(future)
+            progress.close()
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    for table, tmp_path in tmp_paths.items():
+        os.replace(tmp_path, output_dir / f"{table}.parquet")
+
+    stats['seconds'] = time.time() - start
+    stats['mb_per_s'] = stats['bytes'] / 1024**2 / max(stats['seconds'], 1e-9)
+    return stats
+
+
+def ingest_musicbrainz(
+    raw_dir: Path = RAW_DIR,
+    output_dir: Path = OUTPUT_DIR,
+    entities: Optional[List[str]] = None,
+    workers: int = 0,
+    chunk_lines: int = DEFAULT_CHUNK_LINES
+) -> Dict[str, dict]:
+    """
+    Ingère les dumps MusicBrainz présents dans raw_dir.
+
+    Args:
+        raw_dir: Dossier des .tar.xz (download_musicbrainz.py)
+        output_dir: Dossier des tables Parquet
+        entities: Entités à ingérer (défaut: toutes celles trouvées)
+        workers: Nombre de process de parsing (0 = nombre de cœurs)
+        chunk_lines: Lignes JSON par bloc envoyé aux workers
+
+    Returns:
+        Statistiques par entité
+    """
+    print("=" * 60)
+    print("INGESTION DES DUMPS MUSICBRAINZ")
+    print("=" * 60)
+
+    results = {}
+    for entity in entities or list(ENTITY_TABLES):
+        path = find_dump(raw_dir, entity)
+        if path is None:
+            print(f"\n{entity}: dump absent de {raw_dir}, ignoré")
+            continue
+
+        print(f"\n{entity}: {path}")
+        stats = ingest_entity(path, entity, output_dir, workers, chunk_lines)
+        results[entity] = stats
+        rows = ', '.join(f"{t}: {n:,}" for t, n in stats['rows'].items())
+        print(f"  Documents: {stats['documents']:,} | erreurs: {stats['errors']:,}")
+        print(f"  Lignes   : {rows}")
+        print(f"  Débit    : {stats['mb_per_s']:.1f} MB/s de JSON ({stats['seconds']:.1f}s)")
+
+    print(f"\nTables: {output_dir}")
+    return results
+
+
+def recording_coverage(listens_path: Path, output_dir: Path = OUTPUT_DIR) -> dict:
+    """
+    Part des recording_mbid distincts des écoutes présents dans recording.parquet
+    (jointure listens ⋈ recording sur recording_mbid).
+    """
+    from listen_dataset import open_listens
+
+    listened = pc.unique(
+        open_listens(listens_path).to_table(columns=['recording_mbid']).column('recording_mbid')
+    ).drop_null()
+    known = pq.read_table(output_dir / "recording.parquet", columns=['recording_mbid'])
+    matched = int(pc.sum(pc.is_in(listened, value_set=known.column('recording_mbid'))).as_py() or 0)
+    return {'recordings': len(listened), 'matched': matched}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingestion des dumps JSON MusicBrainz en Parquet")
+    parser.add_argument("--input", type=Path, default=RAW_DIR,
+                        help="Dossier des dumps .tar.xz")
+    parser.add_argument("--output", type=Path, default=OUTPUT_DIR,
+                        help="Dossier des tables Parquet")
+    parser.add_argument("--entities", nargs='+', choices=list(ENTITY_TABLES),
+                        help="Entités à ingérer (défaut: toutes)")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Nombre de process de parsing (0 = nombre de cœurs)")
+    parser.add_argument("--chunk-lines", type=int, default=DEFAULT_CHUNK_LINES,
+                        help="Lignes JSON par bloc")
+    parser.add_argument("--listens", type=Path,
+                        help="Dataset d'écoutes pour mesurer la couverture des recording_mbid")
+
+    args = parser.parse_args()
+
+    ingest_musicbrainz(
+        raw_dir=args.input,
+        output_dir=args.output,
+        entities=args.entities,
+        workers=args.workers,
+        chunk_lines=args.chunk_lines
+    )
+
+    if args.listens:
+        coverage = recording_coverage(args.listens, args.output)
+        rate = coverage['matched'] / coverage['recordings'] * 100 if coverage['recordings'] else 0.0
+        print(f"\nCouverture: {coverage['matched']:,}/{coverage['recordings']:,} "
+              f"recording_mbid des écoutes ({rate:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Format partitionné des datasets d'écoutes (listens_raw.parquet, listens.parquet).
+
+Les datasets sont des dossiers Parquet partitionnés à la Hive (comme ceux
+écrits par Spark), avec un manifest:
+
+    listens_raw.parquet/
+        _manifest.json
+        month=2025-01/user_bucket=00/part-0.parquet
+        month=2025-01/user_bucket=01/part-0.parquet
+        ...
+
+- month: mois UTC de l'écoute (YYYY-MM)
+- user_bucket: hash stable de user_name modulo n_user_buckets
+
+Les lecteurs élaguent par fenêtre de mois et/ou par bucket sans ouvrir les
+fichiers hors sélection, et ne lisent que les colonnes demandées. Un
+utilisateur est toujours dans un seul bucket: les traitements par bucket sont
+indépendants.
+
+Les anciens fichiers Parquet monolithiques restent lisibles (sans élagage
+par partition).
+
+Usage:
+  python scripts/listen_dataset.py data/processed/listens_raw.parquet
+"""
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+MANIFEST_NAME = "_manifest.json"
+DEFAULT_USER_BUCKETS = 16
+
+PARTITION_SCHEMA = pa.schema([
+    ('month', pa.string()),
+    ('user_bucket', pa.string()),
+])
+PARTITIONING = ds.partitioning(PARTITION_SCHEMA, flavor='hive')
+
+
+# ──────────────────────────────────────────────
+# Clés de partition
+# ──────────────────────────────────────────────
+
+def user_bucket_ids(user_names, n_buckets: int) -> np.ndarray:
+    """
+    Calcule le bucket de chaque utilisateur.
+
+    Le hash est stable d'un run à l'autre (pd.util.hash_array utilise une clé
+    fixe), contrairement à hash() qui est salé par processus.
+    """
+    values = np.asarray(user_names, dtype=object)
+    return (pd.util.hash_array(values) % np.uint64(n_buckets)).astype(np.int32)
+
+
+def bucket_keys(user_names, n_buckets: int = DEFAULT_USER_BUCKETS) -> pa.Array:
+    """Valeurs de partition user_bucket ('00', '01', ...)."""
+    width = len(str(n_buckets - 1))
+    ids = pa.array(user_bucket_ids(user_names, n_buckets)).cast(pa.string())
+    return pc.utf8_lpad(ids, width=width, padding='0')
+
+
+def month_keys(timestamps: pa.Array) -> pa.Array:
+    """Valeurs de partition month ('YYYY-MM', UTC) depuis des timestamps."""
+    if not pa.types.is_timestamp(timestamps.type):
+        timestamps = pc.cast(timestamps, pa.int64()).cast(pa.timestamp('s'))
+    return pc.strftime(timestamps, format='%Y-%m')
+
+
+def bucket_values(buckets: Iterable[int], n_buckets: int) -> List[str]:
+    """Buckets entiers → valeurs de partition."""
+    width = len(str(n_buckets - 1))
+    return [f"{b:0{width}d}" for b in buckets]
+
+
+# ──────────────────────────────────────────────
+# Écriture
+# ──────────────────────────────────────────────
+
+def _remove(path: Path):
+    if path.is_dir():
+        shutil.rmtree(path)
+    elif path.exists():
+        path.unlink()
+
+
+def write_partitioned(
+    tables: Iterable[pa.Table],
+    root: Path,
+    schema: pa.Schema,
+    n_user_buckets: int = DEFAULT_USER_BUCKETS,
+    rows_per_group: int = 128_000
+) -> dict:
+    """
+    Écrit des tables (qui contiennent déjà les colonnes month et user_bucket)
+    en dataset partitionné, en streaming.
+
+    Le dataset est écrit à côté puis substitué à l'ancien (fichier monolithique
+    ou dossier): un lecteur ne voit jamais un dataset à moitié écrit.
+
+    Args:
+        tables: Tables au schéma `schema`
+        root: Dossier du dataset
+        schema: Schéma complet, colonnes de partition incluses
+        n_user_buckets: Nombre de buckets (noté dans le manifest)
+        rows_per_group: Taille visée des row groups
+
+    Returns:
+        Manifest écrit
+    """
+    root = Path(root)
+    tmp_root = root.with_name(root.name + '.tmp')
+    _remove(tmp_root)
+    tmp_root.mkdir(parents=True)
+
+    def batches() -> Iterator[pa.RecordBatch]:
+        for table in tables:
+            yield from table.cast(schema).to_batches()
+
+    ds.write_dataset(
+        batches(),
+        str(tmp_root),
+        schema=schema,
+        format='parquet',
+        partitioning=PARTITIONING,
+        basename_template="part-{i}.parquet",
+        min_rows_per_group=rows_per_group,
+        max_rows_per_group=rows_per_group * 8,
+        existing_data_behavior='overwrite_or_ignore'
+    )
+
+    manifest = write_manifest(tmp_root, n_user_buckets)
+    _remove(root)
+    os.replace(tmp_root, root)
+    return manifest
+
+
+def write_manifest(root: Path, n_user_buckets: int) -> dict:
+    """Inventorie les partitions d'un dataset et écrit son manifest."""
+    root = Path(root)
+    partitions = {}
+    for path in sorted(root.rglob("*.parquet")):
+        relative = path.parent.relative_to(root)
+        keys = dict(part.split('=', 1) for part in relative.parts)
+        entry = partitions.setdefault(str(relative), {
+            'path': str(relative),
+            'month': keys.get('month'),
+            'user_bucket': keys.get('user_bucket'),
+            'files': 0,
+            'rows': 0,
+            'bytes': 0,
+        })
+        entry['files'] += 1
+        entry['rows'] += pq.read_metadata(path).num_rows
+        entry['bytes'] += path.stat().st_size
+
+    entries = list(partitions.values())
+    manifest = {
+        'format': 'parquet',
+        'partitioning': PARTITION_SCHEMA.names,
+        'n_user_buckets': n_user_buckets,
+        'months': sorted({e['month'] for e in entries if e['month']}),
+        'rows': sum(e['rows'] for e in entries),
+        'bytes': sum(e['bytes'] for e in entries),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'partitions': entries,
+    }
+    with open(root / MANIFEST_NAME, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+# ──────────────────────────────────────────────
+# Lecture
+# ──────────────────────────────────────────────
+
+def read_manifest(root: Path) -> Optional[dict]:
+    """Manifest d'un dataset partitionné (None pour un fichier monolithique)."""
+    path = Path(root) / MANIFEST_NAME
+    if not path.exists():
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def open_listens(path: Path) -> ds.Dataset:
+    """Ouvre un dataset d'écoutes, partitionné ou fichier unique."""
+    path = Path(path)
+    if path.is_dir():
+        return ds.dataset(str(path), format='parquet', partitioning=PARTITIONING)
+    return ds.dataset(str(path), format='parquet')
+
+
+def listens_filter(
+    dataset: ds.Dataset,
+    start_month: Optional[str] = None,
+    end_month: Optional[str] = None,
+    buckets: Optional[List[int]] = None,
+    time_column: str = 'listened_at',
+    n_user_buckets: int = DEFAULT_USER_BUCKETS
+) -> Optional[ds.Expression]:
+    """
+    Prédicat de sélection par fenêtre de mois (bornes incluses, 'YYYY-MM')
+    et par buckets utilisateurs.
+
+    Sur un dataset partitionné, le prédicat porte sur les clés de partition:
+    les fichiers hors sélection ne sont pas ouverts. Sur un fichier unique,
+    la fenêtre est appliquée à `time_column` (statistiques des row groups).
+    """
+    names = dataset.schema.names
+    expression = None
+
+    def combine(expr):
+        nonlocal expression
+        expression = expr if expression is None else expression & expr
+
+    if 'month' in names:
+        if start_month:
+            combine(ds.field('month') >= start_month)
+        if end_month:
+            combine(ds.field('month') <= end_month)
+    elif start_month or end_month:
+        if time_column not in names:
+            raise ValueError(f"Fenêtre temporelle impossible: ni month ni {time_column}")
+        field_type = dataset.schema.field(time_column).type
+        if start_month:
+            low = pd.Timestamp(f"{start_month}-01")
+            combine(ds.field(time_column) >= _time_scalar(low, field_type))
+        if end_month:
+            high = pd.Timestamp(f"{end_month}-01") + pd.offsets.MonthBegin(1)
+            combine(ds.field(time_column) < _time_scalar(high, field_type))
+
+    if buckets is not None:
+        if 'user_bucket' not in names:
+            raise ValueError("Sélection par bucket impossible: dataset non partitionné")
+        combine(ds.field('user_bucket').isin(bucket_values(buckets, n_user_buckets)))
+
+    return expression
+
+
+def _time_scalar(value: pd.Timestamp, field_type: pa.DataType) -> pa.Scalar:
+    if pa.types.is_timestamp(field_type):
+        return pa.scalar(value.to_pydatetime(), type=pa.timestamp('us')).cast(field_type)
+    return pa.scalar(int(value.timestamp()), type=field_type)
+
+
+def select_listens(
+    path: Path,
+    start_month: Optional[str] = None,
+    end_month: Optional[str] = None,
+    buckets: Optional[List[int]] = None,
+    time_column: str = 'listened_at'
+) -> tuple:
+    """Ouvre un dataset et construit son prédicat de sélection: (dataset, filtre)."""
+    dataset = open_listens(path)
+    manifest = read_manifest(path)
+    n_user_buckets = manifest['n_user_buckets'] if manifest else DEFAULT_USER_BUCKETS
+    expression = listens_filter(dataset, start_month, end_month, buckets,
+                                time_column, n_user_buckets)
+    return dataset, expression
+
+
+def iter_listen_batches(
+    path: Path,
+    columns: Optional[List[str]] = None,
+    start_month: Optional[str] = None,
+    end_month: Optional[str] = None,
+    buckets: Optional[List[int]] = None,
+    batch_size: int = 500_000,
+    time_column: str = 'listened_at'
+) -> Iterator[pd.DataFrame]:
+    """Lit un dataset d'écoutes par batches, avec élagage et projection."""
+    dataset, expression = select_listens(path, start_month, end_month, buckets, time_column)
+    for batch in dataset.to_batches(columns=columns, filter=expression, batch_size=batch_size):
+        if batch.num_rows:
+            yield batch.to_pandas()
+
+
+def read_listens(
+    path: Path,
+    columns: Optional[List[str]] = None,
+    start_month: Optional[str] = None,
+    end_month: Optional[str] = None,
+    buckets: Optional[List[int]] = None,
+    time_column: str = 'listened_at'
+) -> pd.DataFrame:
+    """Charge la sélection (fenêtre, buckets, colonnes) d'un dataset d'écoutes."""
+    dataset, expression = select_listens(path, start_month, end_month, buckets, time_column)
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Résumé d'un dataset d'écoutes partitionné")
+    parser.add_argument("path", type=Path, help="Dossier du dataset")
+
+    args = parser.parse_args()
+    manifest = read_manifest(args.path)
+    if manifest is None:
+        print(f"{args.path}: pas de manifest (fichier monolithique ou dataset absent)")
+        return
+
+    print(f"{args.path}")
+    print(f"  Lignes: {manifest['rows']:,} | Taille: {manifest['bytes'] / 1024**2:.1f} MB")
+    print(f"  Buckets utilisateurs: {manifest['n_user_buckets']}")
+    print(f"  Mois: {len(manifest['months'])}")
+    rows_by_month = {}
+    for entry in manifest['partitions']:
+        rows_by_month[entry['month']] = rows_by_month.get(entry['month'], 0) + entry['rows']
+    for month in sorted(rows_by_month, key=str):
+        print(f"    {month}: {rows_by_month[month]:>12,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+Déduplication des écoutes entre dumps qui se chevauchent.
+
+Deux dumps incrémentaux consécutifs (ou un dump re-téléchargé par
+download_missing_files.py) peuvent contenir les mêmes écoutes: sans
+déduplication, chaque copie compte comme une écoute de plus dans play_count.
+
+Une écoute est identifiée par (user_name, listened_at, recording_mbid), ou
+(user_name, listened_at, track_key) quand recording_mbid est absent. La clé
+est réduite à un hash 64 bits, et les clés déjà vues sont gardées dans:
+
+- ExactKeySet: ensemble exact en mémoire, partitionné par les bits de poids
+  fort du hash (tableaux uint64 triés, 8 octets par écoute)
+- MonthlyKeySet: ensemble exact persisté sur disque, une partition par mois
+  d'écoute chargée à la demande: la mémoire est bornée par les mois touchés
+  pendant un run (8 octets par écoute de ces mois), pas par l'historique
+- BloomKeySet: filtre de Bloom à mémoire fixe (~1,2 octet par écoute à 1 %
+  de faux positifs). Un faux positif écarte une écoute unique à tort; pas de
+  faux négatif.
+
+Usage (ExactKeySet dans parse_listens.py, MonthlyKeySet dans le store de
+incremental_aggregate.py):
+    dedup = ListenDeduplicator(ExactKeySet())
+    table, n_duplicates = dedup.filter_table(table)
+"""
+import json
+import math
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from listen_dataset import month_keys
+
+DEFAULT_KEY_PARTITIONS = 64
+DEFAULT_FP_RATE = 0.01
+
+# Taille cumulée des runs non fusionnés au-delà de laquelle une partition
+# est recompactée en un seul tableau trié
+MIN_COMPACTION_SIZE = 65_536
+
+
+def listen_keys(table: pa.Table) -> np.ndarray:
+    """
+    Hash 64 bits stable de (user_name, listened_at, recording_mbid ou track_key)
+    pour chaque écoute d'une table au schéma de parse_listens.RAW_SCHEMA.
+    """
+    artist = pc.fill_null(table.column('artist_name'), 'Unknown')
+    track_key = pc.binary_join_element_wise(artist, table.column('track_name'), ' - ')
+    if 'recording_mbid' in table.column_names:
+        identity = pc.coalesce(table.column('recording_mbid'), track_key)
+    else:
+        identity = track_key
+
+    listened_at = table.column('listened_at')
+    if pa.types.is_timestamp(listened_at.type):
+        listened_at = listened_at.cast(pa.int64())
+
+    frame = pd.DataFrame({
+        'user_name': table.column('user_name').to_numpy(zero_copy_only=False),
+        'listened_at': listened_at.to_numpy(zero_copy_only=False),
+        'identity': identity.to_numpy(zero_copy_only=False),
+    })
+    return pd.util.hash_pandas_object(frame, index=False).values
+
+
+def listen_months(table: pa.Table) -> np.ndarray:
+    """Mois d'écoute ('YYYY-MM', 'unknown' sans timestamp) de chaque écoute."""
+    months = pc.fill_null(month_keys(table.column('listened_at')), 'unknown')
+    return months.to_numpy(zero_copy_only=False)
+
+
+class ExactKeySet:
+    """
+    Ensemble exact de clés uint64, partitionné par hash.
+
+    Chaque partition est un tableau trié plus quelques runs triés récents,
+    recompactés quand ils grossissent: un ajout ne recopie pas toute la
+    partition, et le test d'appartenance reste une recherche dichotomique.
+
+    Attributs:
+        n_partitions: Nombre de partitions (puissance de 2)
+    """
+
+    def __init__(self, n_partitions: int = DEFAULT_KEY_PARTITIONS):
+        if n_partitions & (n_partitions - 1):
+            raise ValueError(f"n_partitions doit être une puissance de 2: {n_partitions}")
+        self.n_partitions = n_partitions
+        self._shift = np.uint64(64 - int(math.log2(n_partitions))) if n_partitions > 1 else None
+        self._main: List[np.ndarray] = [np.empty(0, dtype=np.uint64) for _ in range(n_partitions)]
+        self._runs: List[List[np.ndarray]] = [[] for _ in range(n_partitions)]
+        self._dirty: set = set()
+
+    def __len__(self) -> int:
+        return sum(len(m) + sum(len(r) for r in runs) for m, runs in zip(self._main, self._runs))
+
+    @property
+    def nbytes(self) -> int:
+        return len(self) * 8
+
+    def _partition_ids(self, keys: np.ndarray) -> np.ndarray:
+        if self._shift is None:
+            return np.zeros(len(keys), dtype=np.int64)
+        return (keys >> self._shift).astype(np.int64)
+
+    @staticmethod
+    def _member(sorted_keys: np.ndarray, keys: np.ndarray) -> np.ndarray:
+        if not len(sorted_keys):
+            return np.zeros(len(keys), dtype=bool)
+        positions = np.searchsorted(sorted_keys, keys)
+        positions[positions == len(sorted_keys)] = 0
+        return sorted_keys[positions] == keys
+
+    def contains(self, keys: np.ndarray) -> np.ndarray:
+        """Masque des clés présentes (sans ajout)."""
+        seen = np.zeros(len(keys), dtype=bool)
+        partition_ids = self._partition_ids(keys)
+        for p in np.unique(partition_ids):
+            idx = np.flatnonzero(partition_ids == p)
+            part_seen = self._member(self._main[p], keys[idx])
+            for run in self._runs[p]:
+                part_seen |= self._member(run, keys[idx])
+            seen[idx] = part_seen
+        return seen
+
+    def contains_add(self, keys: np.ndarray, months: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Teste puis ajoute des clés distinctes (months: ignoré, voir MonthlyKeySet).
+
+        Returns:
+            Masque des clés déjà présentes avant l'appel
+        """
+        seen = np.zeros(len(keys), dtype=bool)
+        partition_ids = self._partition_ids(keys)
+        order = np.argsort(partition_ids, kind='stable')
+        bounds = np.searchsorted(partition_ids[order], np.arange(self.n_partitions + 1))
+
+        for p in range(self.n_partitions):
+            idx = order[bounds[p]:bounds[p + 1]]
+            if not len(idx):
+                continue
+            part_keys = keys[idx]
+            part_seen = self._member(self._main[p], part_keys)
+            for run in self._runs[p]:
+                part_seen |= self._member(run, part_keys)
+            seen[idx] = part_seen
+
+            new_keys = np.sort(part_keys[~part_seen])
+            if len(new_keys):
+                self._runs[p].append(new_keys)
+                self._dirty.add(p)
+                if sum(len(r) for r in self._runs[p]) > max(len(self._main[p]) // 4, MIN_COMPACTION_SIZE):
+                    self._compact(p)
+        return seen
+
+    def _compact(self, p: int):
+        if self._runs[p]:
+            self._main[p] = np.sort(np.concatenate([self._main[p]] + self._runs[p]))
+            self._runs[p] = []
+
+    def save(self, directory: Path, only_dirty: bool = False) -> List[Path]:
+        """
+        Écrit les partitions (keys=NNNN.npy) et les paramètres (keys.json).
+
+        Returns:
+            Fichiers écrits
+        """
+        directory.mkdir(parents=True, exist_ok=True)
+        written = []
+        partitions = sorted(self._dirty) if only_dirty else range(self.n_partitions)
+        for p in partitions:
+            self._compact(p)
+            path = directory / f"keys={p:04d}.npy"
+            np.save(path, self._main[p])
+            written.append(path)
+        params = directory / "keys.json"
+        with open(params, 'w', encoding='utf-8') as f:
+            json.dump({'type': 'exact', 'n_partitions': self.n_partitions}, f)
+        written.append(params)
+        self._dirty.clear()
+        return written
+
+    @classmethod
+    def load(cls, directory: Path, n_partitions: int = DEFAULT_KEY_PARTITIONS) -> 'ExactKeySet':
+        """Charge un ensemble sauvegardé (vide si le dossier n'existe pas)."""
+        params = directory / "keys.json"
+        if params.exists():
+            with open(params, encoding='utf-8') as f:
+                info = json.load(f)
+            if info.get('type') == 'exact':
+                n_partitions = info['n_partitions']
+        key_set = cls(n_partitions)
+        for p in range(n_partitions):
+            path = directory / f"keys={p:04d}.npy"
+            if path.exists():
+                key_set._main[p] = np.load(path)
+        return key_set
+
+
+class MonthlyKeySet:
+    """
+    Ensemble exact de clés persisté sur disque, partitionné par mois d'écoute.
+
+    Des dumps qui se chevauchent portent sur des écoutes proches dans le
+    temps: seules les partitions des mois présents dans un batch sont lues
+    (à la demande), et seules celles qui ont reçu des clés sont réécrites.
+    Mémoire: 8 octets par écoute des mois chargés pendant le run; un dump
+    incrémental n'en touche en général qu'un ou deux.
+
+    Layout:
+        directory/
+            keys.json              # {'type': 'monthly', 'legacy_partitions': n ou null}
+            month=YYYY-MM.npy      # clés triées des écoutes du mois
+            keys=NNNN.npy          # ancien ExactKeySet (hash), consulté en lecture seule
+    """
+
+    def __init__(self, directory: Optional[Path] = None, legacy: Optional[ExactKeySet] = None):
+        self.directory = directory
+        self.legacy = legacy
+        self._months: Dict[str, ExactKeySet] = {}
+        self._dirty: set = set()
+
+    def __len__(self) -> int:
+        return sum(len(part) for part in self._months.values()) + (len(self.legacy) if self.legacy else 0)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self) * 8
+
+    @staticmethod
+    def _month_file(directory: Path, month: str) -> Path:
+        return directory / f"month={month}.npy"
+
+    def _partition(self, month: str) -> ExactKeySet:
+        part = self._months.get(month)
+        if part is None:
+            part = ExactKeySet(1)
+            if self.directory is not None:
+                path = self._month_file(self.directory, month)
+                if path.exists():
+                    part._main[0] = np.load(path)
+            self._months[month] = part
+        return part
+
+    def contains_add(self, keys: np.ndarray, months: Optional[np.ndarray] = None) -> np.ndarray:
+        """Teste puis ajoute des clés distinctes, rangées par mois d'écoute."""
+        if months is None:
+            raise ValueError("MonthlyKeySet: le mois de chaque clé est requis")
+        seen = np.zeros(len(keys), dtype=bool)
+        labels, inverse = np.unique(months, return_inverse=True)
+        for i, month in enumerate(labels):
+            idx = np.flatnonzero(inverse == i)
+            seen[idx] = self._partition(str(month)).contains_add(keys[idx])
+            if len(idx) > int(seen[idx].sum()):
+                self._dirty.add(str(month))
+        if self.legacy is not None and len(keys):
+            # Clés enregistrées avant le partitionnement par mois
+            seen |= self.legacy.contains(keys)
+        return seen
+
+    def save(self, directory: Path, only_dirty: bool = False) -> List[Path]:
+        """
+        Écrit les mois modifiés (month=YYYY-MM.npy) et keys.json.
+
+        Returns:
+            Fichiers écrits
+        """
+        directory.mkdir(parents=True, exist_ok=True)
+        if not only_dirty and self.directory is not None:
+            for path in self.directory.glob("month=*.npy"):
+                self._partition(path.stem[len("month="):])
+        written = []
+        for month in sorted(self._dirty if only_dirty else self._months):
+            part = self._months[month]
+            part._compact(0)
+            path = self._month_file(directory, month)
+            np.save(path, part._main[0])
+            written.append(path)
+        params = directory / "keys.json"
+        with open(params, 'w', encoding='utf-8') as f:
+            json.dump({'type': 'monthly',
+                       'legacy_partitions': self.legacy.n_partitions if self.legacy else None}, f)
+        written.append(params)
+        self._dirty.clear()
+        return written
+
+    @classmethod
+    def load(cls, directory: Path) -> 'MonthlyKeySet':
+        """
+        Ouvre un ensemble sauvegardé; les mois sont lus au premier accès.
+        Un ancien ExactKeySet sauvegardé dans le dossier est chargé en lecture seule.
+        """
+        params = directory / "keys.json"
+        legacy = None
+        if params.exists():
+            with open(params, encoding='utf-8') as f:
+                info = json.load(f)
+            n_legacy = info['n_partitions'] if info.get('type') == 'exact' else info.get('legacy_partitions')
+            if n_legacy:
+                legacy = ExactKeySet.load(directory, n_legacy)
+        return cls(directory, legacy)
+
+
+class BloomKeySet:
+    """
+    Filtre de Bloom sur des clés uint64 (double hashing sur les deux moitiés
+    de la clé), dimensionné pour `expected_keys` et `fp_rate`.
+    """
+
+    def __init__(self, expected_keys: int, fp_rate: float = DEFAULT_FP_RATE):
+        expected_keys = max(int(expected_keys), 1)
+        self.n_bits = max(64, int(math.ceil(-expected_keys * math.log(fp_rate) / math.log(2) ** 2)))
+        self.n_hashes = max(1, round(self.n_bits / expected_keys * math.log(2)))
+        self.expected_keys = expected_keys
+        self.fp_rate = fp_rate
+        self.bits = np.zeros((self.n_bits + 7) // 8, dtype=np.uint8)
+        self.n_added = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self.bits.nbytes
+
+    def _positions(self, keys: np.ndarray) -> np.ndarray:
+        h1 = keys & np.uint64(0xFFFFFFFF)
+        h2 = (keys >> np.uint64(32)) | np.uint64(1)
+        steps = np.arange(self.n_hashes, dtype=np.uint64)
+        return (h1[:, None] + steps[None, :] * h2[:, None]) % np.uint64(self.n_bits)
+
+    def contains_add(self, keys: np.ndarray, months: Optional[np.ndarray] = None) -> np.ndarray:
+        """Teste puis ajoute des clés distinctes. Retourne le masque « déjà vues »."""
+        if not len(keys):
+            return np.zeros(0, dtype=bool)
+        positions = self._positions(keys)
+        bytes_idx = (positions >> np.uint64(3)).astype(np.int64)
+        masks = (np.uint8(1) << (positions & np.uint64(7)).astype(np.uint8))
+        seen = np.all(self.bits[bytes_idx] & masks, axis=1)
+        np.bitwise_or.at(self.bits, bytes_idx.ravel(), masks.ravel())
+        self.n_added += int((~seen).sum())
+        return seen
+
+
+class ListenDeduplicator:
+    """
+    Filtre les écoutes déjà vues (dans le même batch ou avant).
+
+    Attributs:
+        key_set: ExactKeySet ou BloomKeySet
+        n_seen: Écoutes examinées
+        n_duplicates: Écoutes écartées
+    """
+
+    def __init__(self, key_set):
+        self.key_set = key_set
+        self.n_seen = 0
+        self.n_duplicates = 0
+
+    def duplicate_mask(self, table: pa.Table) -> np.ndarray:
+        """Masque des écoutes en double (toutes les copies sauf la première)."""
+        keys = listen_keys(table)
+        unique_keys, first_index = np.unique(keys, return_index=True)
+        months = listen_months(table)[first_index] if isinstance(self.key_set, MonthlyKeySet) else None
+        already_seen = self.key_set.contains_add(unique_keys, months)
+
+        duplicate = np.ones(len(keys), dtype=bool)
+        duplicate[first_index[~already_seen]] = False
+        self.n_seen += len(keys)
+        self.n_duplicates += int(duplicate.sum())
+        return duplicate
+
+    def filter_table(self, table: pa.Table) -> Tuple[pa.Table, int]:
+        """Retourne (table sans doublons, nombre de doublons écartés)."""
+        duplicate = self.duplicate_mask(table)
+        n_duplicates = int(duplicate.sum())
+        if n_duplicates:
+            table = table.filter(pa.array(~duplicate))
+        return table, n_duplicates
+
+    def describe(self) -> str:
+        kind = 'bloom' if isinstance(self.key_set, BloomKeySet) else 'exact'
+        rate = self.n_duplicates / self.n_seen * 100 if self.n_seen else 0.0
+        return (f"Déduplication ({kind}, {self.key_set.nbytes / 1024**2:.1f} MB): "
+                f"{self.n_duplicates:,} doublons sur {self.n_seen:,} écoutes ({rate:.2f}%)")
+
+
+def make_deduplicator(
+    mode: str = 'exact',
+    expected_listens: int = 0,
+    fp_rate: float = DEFAULT_FP_RATE
+) -> Optional[ListenDeduplicator]:
+    """
+    Crée le déduplicateur demandé ('exact', 'bloom' ou 'none').
+    Le filtre de Bloom est dimensionné sur expected_listens.
+    """
+    if mode == 'none':
+        return None
+    if mode == 'exact':
+        return ListenDeduplicator(ExactKeySet())
+    if mode == 'bloom':
+        if expected_listens <= 0:
+            raise ValueError("--expected-listens est requis pour le filtre de Bloom")
+        return ListenDeduplicator(BloomKeySet(expected_listens, fp_rate))
+    raise ValueError(f"Mode de déduplication inconnu: {mode}")
@@ -2,16 +2,37 @@
 """
 Script pour parser les fichiers JSON lines des écoutes ListenBrainz.
 Transforme les fichiers extraits en un format tabulaire.
+
+La sortie listens_raw.parquet est un dataset partitionné
+month=YYYY-MM/user_bucket=NN/ avec manifest (voir listen_dataset.py).
+
+Les écoutes présentes dans plusieurs dumps (chevauchement des incrémentaux,
+re-téléchargements) sont écartées au parsing (voir listen_dedup.py), avec le
+taux de doublons de chaque dump.
 """
 import json
 import os
+import tarfile
 from pathlib import Path
 from datetime import datetime
 from typing import Generator
 
-import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import zstandard as zstd
 from tqdm import tqdm
 
+from listen_dataset import (
+    DEFAULT_USER_BUCKETS,
+    PARTITION_SCHEMA,
+    bucket_keys,
+    month_keys,
+    open_listens,
+    write_partitioned,
+)
+from listen_dedup import DEFAULT_FP_RATE, make_deduplicator
+
 # Configuration
 EXTRACTED_DIR = Path(__file__).parent.parent / "data" / "extracted" / "listenbrainz"
 OUTPUT_DIR = Path(__file__).parent.parent / "data" / "processed"
@@ -76,36 +97,136 @@ def stream_listens_from_file(filepath: Path) -> Generator[dict, None, None]:
                     yield listen
 
 
+def stream_listens_from_archive(archive_path: Path) -> Generator[dict, None, None]:
+    """
+    Génère les écoutes d'un dump incrémental .tar.zst sans l'extraire sur disque:
+    décompression zstd et lecture tar en streaming.
+    """
+    dctx = zstd.ZstdDecompressor()
+    with open(archive_path, 'rb') as compressed:
+        with dctx.stream_reader(compressed) as reader:
+            with tarfile.open(fileobj=reader, mode='r|') as tar:
+                for member in tar:
+                    if not member.isfile() or not is_listen_path(Path(member.name)):
+                        continue
+                    f = tar.extractfile(member)
+                    if f is None:
+                        continue
+                    for raw in f:
+                        line = raw.decode('utf-8', errors='replace').strip()
+                        if line:
+                            listen = parse_listen_line(line)
+                            if listen:
+                                yield listen
+
+
+def is_listen_path(path: Path) -> bool:
+    """Vrai si le chemin ressemble à un fichier d'écoutes (pas de metadata)."""
+    if path.suffix == '.listens':
+        return True
+    if path.suffix in ('', '.json', '.jsonl'):
+        return 'listen' in path.name.lower() or path.suffix == ''
+    return False
+
+
 def find_listen_files(base_dir: Path) -> list[Path]:
     """Trouve tous les fichiers d'écoutes dans le dossier extrait."""
     listen_files = []
 
     for path in base_dir.rglob('*'):
-        if path.is_file() and path.suffix in ('', '.json', '.jsonl'):
-            # Vérifier si c'est un fichier d'écoutes (pas de metadata)
-            if 'listen' in path.name.lower() or path.suffix == '':
-                listen_files.append(path)
+        if path.is_file() and is_listen_path(path):
+            listen_files.append(path)
 
     return sorted(listen_files)
 
 
+def find_listen_sources(base_dir: Path) -> list[Path]:
+    """
+    Trouve les sources d'écoutes: fichiers extraits et archives .tar.zst
+    (lues en streaming, sans extraction préalable).
+    """
+    archives = sorted(p for p in base_dir.rglob('*.tar.zst') if p.is_file())
+    return find_listen_files(base_dir) + archives
+
+
+def stream_listens(path: Path) -> Generator[dict, None, None]:
+    """Génère les écoutes d'un fichier extrait ou d'une archive .tar.zst."""
+    if path.name.endswith('.tar.zst'):
+        return stream_listens_from_archive(path)
+    return stream_listens_from_file(path)
+
+
+RAW_SCHEMA = pa.schema([
+    ('user_name', pa.string()),
+    ('listened_at', pa.timestamp('s')),
+    ('track_name', pa.string()),
+    ('artist_name', pa.string()),
+    ('release_name', pa.string()),
+    ('recording_mbid', pa.string()),
+    ('release_mbid', pa.string()),
+    ('artist_mbid', pa.string()),
+])
+
+RAW_DATASET_SCHEMA = pa.schema(list(RAW_SCHEMA) + list(PARTITION_SCHEMA))
+
+
+def listens_to_table(listens: list[dict]) -> pa.Table:
+    """Convertit un batch d'écoutes parsées en table Arrow (schéma RAW_SCHEMA)."""
+    columns = {name: [listen[name] for listen in listens] for name in RAW_SCHEMA.names}
+    # Timestamps invalides (chaînes, flottants...) → null plutôt qu'un batch perdu
+    listened_at = pa.array(
+        [v if isinstance(v, int) else None for v in columns['listened_at']], type=pa.int64()
+    )
+    columns['listened_at'] = listened_at.cast(pa.timestamp('s'))
+    return pa.table(columns, schema=RAW_SCHEMA)
+
+
+def dump_label(path: Path, base_dir: Path) -> str:
+    """Dump d'origine d'une source: l'archive elle-même ou le premier dossier sous base_dir."""
+    try:
+        name = path.relative_to(base_dir).parts[0]
+    except ValueError:
+        name = path.name
+    return name[:-len('.tar.zst')] if name.endswith('.tar.zst') else name
+
+
+def add_partition_keys(table: pa.Table, n_user_buckets: int = DEFAULT_USER_BUCKETS) -> pa.Table:
+    """Ajoute les colonnes de partition month et user_bucket."""
+    table = table.append_column('month', month_keys(table.column('listened_at')))
+    return table.append_column(
+        'user_bucket', bucket_keys(table.column('user_name').to_numpy(zero_copy_only=False), n_user_buckets)
+    )
+
+
 def parse_all_listens(
     extracted_dir: Path = EXTRACTED_DIR,
     output_dir: Path = OUTPUT_DIR,
     batch_size: int = 100_000,
-    max_files: int = None
+    max_files: int = None,
+    n_user_buckets: int = DEFAULT_USER_BUCKETS,
+    dedup: str = 'exact',
+    expected_listens: int = 0,
+    fp_rate: float = DEFAULT_FP_RATE
 ) -> Path:
     """
     Parse tous les fichiers d'écoutes et les sauvegarde en Parquet.
 
+    Les écoutes sont écrites batch par batch dans un dataset partitionné par
+    mois et bucket utilisateur: la mémoire utilisée est bornée par batch_size,
+    quel que soit le volume total.
+
     Args:
-        extracted_dir: Dossier contenant les fichiers extraits
+        extracted_dir: Dossier contenant les fichiers extraits ou les archives .tar.zst
         output_dir: Dossier de sortie
         batch_size: Nombre d'écoutes par batch avant écriture
         max_files: Limite le nombre de fichiers (pour tests)
+        n_user_buckets: Nombre de buckets utilisateurs du dataset
+        dedup: Déduplication des écoutes: 'exact', 'bloom' ou 'none'
+        expected_listens: Nombre d'écoutes attendu (dimensionne le filtre de Bloom)
+        fp_rate: Taux de faux positifs visé du filtre de Bloom
 
     Returns:
-        Chemin vers le fichier Parquet de sortie
+        Chemin vers le dataset de sortie
     """
     print("=" * 60)
     print("Parsing des écoutes ListenBrainz")
@@ -116,7 +237,7 @@ def parse_all_listens(
 
     # Trouver les fichiers
     print(f"\nRecherche des fichiers dans {extracted_dir}...")
-    listen_files = find_listen_files(extracted_dir)
+    listen_files = find_listen_sources(extracted_dir)
     print(f"Trouvé {len(listen_files)} fichiers d'écoutes")
 
     if max_files:
@@ -128,63 +249,77 @@ def parse_all_listens(
         return None
 
     # Parser les fichiers
-    all_listens = []
-    total_parsed = 0
-    total_errors = 0
-    batch_num = 0
-
-    for filepath in tqdm(listen_files, desc="Fichiers"):
-        try:
-            for listen in stream_listens_from_file(filepath):
-                all_listens.append(listen)
-                total_parsed += 1
-
-                # Sauvegarder par batch pour gérer la mémoire
-                if len(all_listens) >= batch_size:
-                    df_batch = pd.DataFrame(all_listens)
-
-                    # Premier batch: créer le fichier
-                    if batch_num == 0:
-                        df_batch.to_parquet(output_file, index=False)
-                    else:
-                        # Batches suivants: ajouter au fichier existant
-                        # Note: on accumule tout en mémoire puis on écrit à la fin
-                        pass
-
-                    batch_num += 1
-                    # On garde les données pour écriture finale
-
-        except Exception as e:
-            total_errors += 1
-            print(f"\nErreur sur {filepath}: {e}")
-
-    # Créer le DataFrame final
-    print(f"\nCréation du DataFrame ({len(all_listens)} écoutes)...")
-    df = pd.DataFrame(all_listens)
-
-    # Convertir les types
-    if 'listened_at' in df.columns:
-        df['listened_at'] = pd.to_datetime(df['listened_at'], unit='s', errors='coerce')
-
-    # Statistiques
+    stats = {'parsed': 0, 'errors': 0}
+    deduplicator = make_deduplicator(dedup, expected_listens, fp_rate)
+    dumps = sorted({dump_label(p, extracted_dir) for p in listen_files})
+    dump_index = {name: i for i, name in enumerate(dumps)}
+    dump_listens = np.zeros(len(dumps), dtype=np.int64)
+    dump_duplicates = np.zeros(len(dumps), dtype=np.int64)
+
+    def to_table(batch: list, sources: list) -> pa.Table:
+        table = listens_to_table(batch)
+        sources = np.asarray(sources, dtype=np.int64)
+        dump_listens[:] += np.bincount(sources, minlength=len(dumps))
+        if deduplicator is not None:
+            duplicate = deduplicator.duplicate_mask(table)
+            if duplicate.any():
+                dump_duplicates[:] += np.bincount(sources[duplicate], minlength=len(dumps))
+                table = table.filter(pa.array(~duplicate))
+        return add_partition_keys(table, n_user_buckets)
+
+    def tables():
+        batch, sources = [], []
+        for filepath in tqdm(listen_files, desc="Fichiers"):
+            source = dump_index[dump_label(filepath, extracted_dir)]
+            try:
+                for listen in stream_listens(filepath):
+                    batch.append(listen)
+                    sources.append(source)
+                    stats['parsed'] += 1
+
+                    # Écrire par batch pour borner la mémoire
+                    if len(batch) >= batch_size:
+                        yield to_table(batch, sources)
+                        batch, sources = [], []
+
+            except Exception as e:
+                stats['errors'] += 1
+                print(f"\nErreur sur {filepath}: {e}")
+
+        if batch:
+            yield to_table(batch, sources)
+
+    manifest = write_partitioned(tables(), output_file, RAW_DATASET_SCHEMA, n_user_buckets)
+
+    if deduplicator is not None:
+        print(f"\n{deduplicator.describe()}")
+        print(f"  {'Dump':50} {'Écoutes':>12} {'Doublons':>10} {'Taux':>7}")
+        for name, listens, duplicates in zip(dumps, dump_listens, dump_duplicates):
+            rate = duplicates / listens * 100 if listens else 0.0
+            print(f"  {name[:50]:50} {listens:>12,} {duplicates:>10,} {rate:>6.2f}%")
+
+    # Statistiques (colonne par colonne, sans recharger tout le dataset)
     print(f"\n{'=' * 60}")
     print("STATISTIQUES")
     print(f"{'=' * 60}")
-    print(f"Écoutes parsées: {total_parsed:,}")
-    print(f"Fichiers avec erreurs: {total_errors}")
-    print(f"Utilisateurs uniques: {df['user_name'].nunique():,}")
-    print(f"Tracks uniques: {df['track_name'].nunique():,}")
-    print(f"Artistes uniques: {df['artist_name'].nunique():,}")
-
-    if 'listened_at' in df.columns:
-        print(f"Période: {df['listened_at'].min()} à {df['listened_at'].max()}")
-
-    # Sauvegarder
-    print(f"\nSauvegarde vers {output_file}...")
-    df.to_parquet(output_file, index=False)
-
-    file_size_mb = output_file.stat().st_size / (1024 * 1024)
-    print(f"Taille du fichier: {file_size_mb:.1f} MB")
+    print(f"Écoutes parsées: {stats['parsed']:,}")
+    if deduplicator is not None:
+        print(f"Écoutes écrites (sans doublons): {stats['parsed'] - deduplicator.n_duplicates:,}")
+    print(f"Fichiers avec erreurs: {stats['errors']}")
+    if stats['parsed']:
+        dataset = open_listens(output_file)
+        for column, label in (('user_name', 'Utilisateurs'), ('track_name', 'Tracks'),
+                              ('artist_name', 'Artistes')):
+            values = dataset.to_table(columns=[column]).column(column)
+            print(f"{label} uniques: {pc.count_distinct(values).as_py():,}")
+
+        listened_at = dataset.to_table(columns=['listened_at']).column('listened_at')
+        bounds = pc.min_max(listened_at)
+        print(f"Période: {bounds['min'].as_py()} à {bounds['max'].as_py()}")
+
+    print(f"Partitions: {len(manifest['partitions'])} ({len(manifest['months'])} mois × "
+          f"{n_user_buckets} buckets max)")
+    print(f"Taille du dataset: {manifest['bytes'] / (1024 * 1024):.1f} MB")
 
     return output_file
 
@@ -194,13 +329,21 @@ def main():
 
     parser = argparse.ArgumentParser(description="Parser les écoutes ListenBrainz")
     parser.add_argument("--input", type=Path, default=EXTRACTED_DIR,
-                       help="Dossier des fichiers extraits")
+                       help="Dossier des fichiers extraits ou des archives .tar.zst")
     parser.add_argument("--output", type=Path, default=OUTPUT_DIR,
                        help="Dossier de sortie")
     parser.add_argument("--batch-size", type=int, default=100_000,
                        help="Taille des batches")
     parser.add_argument("--max-files", type=int,
                        help="Limite de fichiers à traiter")
+    parser.add_argument("--user-buckets", type=int, default=DEFAULT_USER_BUCKETS,
+                       help="Nombre de buckets utilisateurs du dataset")
+    parser.add_argument("--dedup", choices=['exact', 'bloom', 'none'], default='exact',
+                       help="Déduplication des écoutes entre dumps")
+    parser.add_argument("--expected-listens", type=int, default=0,
+                       help="Nombre d'écoutes attendu (dimensionne le filtre de Bloom)")
+    parser.add_argument("--fp-rate", type=float, default=DEFAULT_FP_RATE,
+                       help="Taux de faux positifs du filtre de Bloom")
 
     args = parser.parse_args()
 
@@ -208,7 +351,11 @@ def main():
         extracted_dir=args.input,
         output_dir=args.output,
         batch_size=args.batch_size,
-        max_files=args.max_files
+        max_files=args.max_files,
+        n_user_buckets=args.user_buckets,
+        dedup=args.dedup,
+        expected_listens=args.expected_listens,
+        fp_rate=args.fp_rate
     )
 
 
@@ -0,0 +1,608 @@
+#!/usr/bin/env python3
+"""
+Agrégation out-of-core des écoutes, pour des volumes plus grands que la RAM.
+
+Produit les mêmes sorties que aggregate_data.py (listens.parquet + mappings.json)
+sans jamais charger toutes les écoutes en mémoire:
+
+1. Partitionnement: les écoutes sont lues par batches (colonnes utiles seulement)
+   et réparties par hash de user_name dans N buckets Parquet sur disque.
+2. Agrégation: chaque bucket est agrégé indépendamment (process pool) en
+   (user_name, track_key, artist_name, first_listen, last_listen, play_count).
+3. Filtrage utilisateurs: un utilisateur est entièrement contenu dans un bucket,
+   le filtre min_user_listens est donc local au bucket (et le mapping de
+   déduplication est appliqué à ce moment-là).
+4. Filtrage tracks: seconde passe légère qui ne lit que (track_key, play_count)
+   pour calculer les comptes globaux par track.
+5. Attribution des IDs et écriture de listens.parquet bucket par bucket.
+
+Les agrégats sont par (utilisateur, track, mois): listens.parquet est un
+dataset partitionné month=YYYY-MM/user_bucket=NN/ (voir listen_dataset.py),
+ce qui permet de réentraîner sur une fenêtre de mois sans réagréger.
+
+La mémoire de pointe dépend de la taille d'un bucket (réglable via --memory-mb
+ou --partitions), pas de la taille du dataset.
+
+Usage:
+  python scripts/partitioned_aggregate.py
+  python scripts/partitioned_aggregate.py --memory-mb 1024 --workers 4
+"""
+import json
+import math
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from tqdm import tqdm
+
+import listen_dataset
+from aggregate_data import save_mappings
+from id_dictionary import ID_DICTS_DIR, load_id_dicts, save_id_dicts
+from listen_dataset import (
+    DEFAULT_USER_BUCKETS,
+    bucket_keys,
+    user_bucket_ids,
+    write_partitioned,
+)
+
+# Configuration
+PROCESSED_DIR = Path(__file__).parent.parent / "data" / "processed"
+INPUT_FILE = PROCESSED_DIR / "listens_raw.parquet"
+OUTPUT_FILE = PROCESSED_DIR / "listens.parquet"
+WORK_DIR = PROCESSED_DIR / "partitions"
+
+DEFAULT_MEMORY_MB = 2048
+DEFAULT_BATCH_SIZE = 500_000
+
+# Facteur d'expansion approximatif Parquet (non compressé) → DataFrame pandas
+# (les chaînes Python coûtent bien plus cher que leur encodage Parquet).
+PANDAS_EXPANSION = 4
+
+LISTEN_COLUMNS = ['user_name', 'listened_at', 'track_name', 'artist_name']
+
+PARTITION_SCHEMA = pa.schema([
+    ('user_name', pa.string()),
+    ('listened_at', pa.timestamp('ms')),
+    ('track_name', pa.string()),
+    ('artist_name', pa.string()),
+])
+
+AGGREGATE_SCHEMA = pa.schema([
+    ('user_name', pa.string()),
+    ('track_key', pa.string()),
+    ('artist_name', pa.string()),
+    ('month', pa.string()),
+    ('first_listen', pa.timestamp('ms')),
+    ('last_listen', pa.timestamp('ms')),
+    ('play_count', pa.int64()),
+])
+
+LISTENS_SCHEMA = pa.schema([
+    ('user_id', pa.int64()),
+    ('track_id', pa.int64()),
+    ('artist_id', pa.int64()),
+    ('first_listen', pa.timestamp('ms')),
+    ('last_listen', pa.timestamp('ms')),
+    ('play_count', pa.int64()),
+    ('month', pa.string()),
+    ('user_bucket', pa.string()),
+])
+
+AGGREGATE_KEYS = ['user_name', 'track_key', 'artist_name', 'month']
+
+
+# ──────────────────────────────────────────────
+# Partitionnement
+# ──────────────────────────────────────────────
+
+def to_timestamp(series: pd.Series) -> pd.Series:
+    """Normalise listened_at (epoch en secondes ou datetime) en datetime64."""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    return pd.to_datetime(series, unit='s', errors='coerce')
+
+
+def month_of(timestamps: pd.Series) -> pd.Series:
+    """Mois 'YYYY-MM' de chaque timestamp (None si absent)."""
+    months = np.datetime_as_string(timestamps.values.astype('datetime64[M]'), unit='M')
+    return pd.Series(months, index=timestamps.index).where(timestamps.notna(), None)
+
+
+def iter_listen_batches(
+    input_path: Path,
+    columns: List[str] = LISTEN_COLUMNS,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    start_month: Optional[str] = None,
+    end_month: Optional[str] = None
+) -> Iterator[pd.DataFrame]:
+    """
+    Lit les écoutes par batches en ne projetant que les colonnes demandées.
+    Accepte un fichier Parquet unique ou un dataset partitionné (élagué par
+    fenêtre de mois).
+    """
+    yield from listen_dataset.iter_listen_batches(
+        input_path, columns=columns, start_month=start_month, end_month=end_month,
+        batch_size=batch_size
+    )
+
+
+def estimate_partitions(
+    input_path: Path,
+    memory_mb: int,
+    workers: int,
+    start_month: Optional[str] = None,
+    end_month: Optional[str] = None
+) -> int:
+    """
+    Choisit le nombre de buckets pour que `workers` buckets agrégés en
+    parallèle tiennent dans `memory_mb`.
+    """
+    dataset, expression = listen_dataset.select_listens(input_path, start_month, end_month)
+    uncompressed = 0
+    for fragment in dataset.get_fragments(filter=expression):
+        metadata = fragment.metadata
+        for i in range(metadata.num_row_groups):
+            uncompressed += metadata.row_group(i).total_byte_size
+
+    budget_per_worker = memory_mb * 1024 * 1024 / max(workers, 1)
+    return max(1, math.ceil(uncompressed * PANDAS_EXPANSION / budget_per_worker))
+
+
+def partition_listens(
+    input_path: Path,
+    work_dir: Path,
+    n_partitions: int,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    start_month: Optional[str] = None,
+    end_month: Optional[str] = None
+) -> Tuple[List[Path], int]:
+    """
+    Répartit les écoutes dans `n_partitions` fichiers Parquet par hash d'utilisateur.
+
+    Returns:
+        (liste des buckets non vides, nombre d'écoutes écrites)
+    """
+    raw_dir = work_dir / "raw"
+    raw_dir.mkdir(parents=True, exist_ok=True)
+
+    writers: dict[int, pq.ParquetWriter] = {}
+    total = 0
+
+    try:
+        batches = iter_listen_batches(input_path, batch_size=batch_size,
+                                      start_month=start_month, end_month=end_month)
+        for df in tqdm(batches, desc="Partitionnement"):
+            df = df.dropna(subset=['user_name', 'track_name'])
+            if df.empty:
+                continue
+            df['listened_at'] = to_timestamp(df['listened_at'])
+            df['bucket'] = user_bucket_ids(df['user_name'].values, n_partitions)
+
+            for bucket, part in df.groupby('bucket', sort=False):
+                table = pa.Table.from_pandas(
+                    part[LISTEN_COLUMNS], schema=PARTITION_SCHEMA, preserve_index=False, safe=False
+                )
+                writer = writers.get(bucket)
+                if writer is None:
+                    writer = pq.ParquetWriter(raw_dir / f"bucket={bucket:04d}.parquet", PARTITION_SCHEMA)
+                    writers[bucket] = writer
+                writer.write_table(table)
+            total += len(df)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    return sorted(raw_dir / f"bucket={b:04d}.parquet" for b in writers), total
+
+
+# ──────────────────────────────────────────────
+# Agrégation par bucket
+# ──────────────────────────────────────────────
+
+def aggregate_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Agrège des écoutes brutes en (user, track, mois) → first/last/play_count."""
+    df = df.assign(
+        artist_name=df['artist_name'].fillna('Unknown'),
+        month=month_of(df['listened_at']),
+    )
+    df['track_key'] = df['artist_name'] + ' - ' + df['track_name']
+
+    agg = df.groupby(AGGREGATE_KEYS, sort=False, dropna=False).agg(
+        first_listen=('listened_at', 'min'),
+        last_listen=('listened_at', 'max'),
+        play_count=('listened_at', 'size'),
+    ).reset_index()
+    return agg
+
+
+def merge_aggregates(df: pd.DataFrame) -> pd.DataFrame:
+    """Fusionne des lignes agrégées portant sur le même (user, track, mois)."""
+    if 'month' not in df or df['month'].isna().any():
+        # Agrégats écrits avant le découpage par mois: rattachés au mois de last_listen
+        fallback = month_of(df['last_listen'])
+        df = df.assign(month=df['month'].fillna(fallback) if 'month' in df else fallback)
+    return df.groupby(AGGREGATE_KEYS, sort=False, dropna=False).agg(
+        first_listen=('first_listen', 'min'),
+        last_listen=('last_listen', 'max'),
+        play_count=('play_count', 'sum'),
+    ).reset_index()
+
+
+def write_aggregate(df: pd.DataFrame, path: Path) -> None:
+    """Écrit un bucket agrégé au schéma AGGREGATE_SCHEMA (écriture atomique)."""
+    tmp_path = path.with_suffix('.tmp')
+    table = pa.Table.from_pandas(
+        df[AGGREGATE_SCHEMA.names], schema=AGGREGATE_SCHEMA, preserve_index=False, safe=False
+    )
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _aggregate_bucket(args: Tuple[Path, Path]) -> Tuple[Path, int, int]:
+    """Worker: agrège un bucket brut. Retourne (chemin, écoutes, interactions)."""
+    raw_path, out_path = args
+    df = pd.read_parquet(raw_path)
+    agg = aggregate_frame(df)
+    write_aggregate(agg, out_path)
+    return out_path, len(df), len(agg)
+
+
+def aggregate_partitions(raw_paths: List[Path], work_dir: Path, workers: int) -> List[Path]:
+    """Agrège chaque bucket brut en parallèle."""
+    agg_dir = work_dir / "aggregated"
+    agg_dir.mkdir(parents=True, exist_ok=True)
+    tasks = [(p, agg_dir / p.name) for p in raw_paths]
+
+    outputs = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for out_path, _, _ in tqdm(executor.map(_aggregate_bucket, tasks), total=len(tasks), desc="Agrégation"):
+            outputs.append(out_path)
+    return outputs
+
+
+# ──────────────────────────────────────────────
+# Filtrage + IDs
+# ──────────────────────────────────────────────
+
+_DEDUP_MAP: dict = {}
+
+
+def _init_filter_worker(dedup_file: Optional[Path]):
+    """Charge le mapping de déduplication une seule fois par process."""
+    global _DEDUP_MAP
+    _DEDUP_MAP = {}
+    if dedup_file and dedup_file.exists():
+        with open(dedup_file, encoding='utf-8') as f:
+            _DEDUP_MAP = json.load(f)
+
+
+# Un bucket agrégé: un fichier, ou plusieurs fichiers à fusionner (base + deltas)
+BucketSource = Union[Path, List[Path]]
+
+
+def _filter_bucket(args: Tuple[BucketSource, Path, int]) -> Tuple[Path, int, int]:
+    """
+    Worker: applique la déduplication puis le filtre min_user_listens
+    sur un bucket agrégé. Retourne (chemin, utilisateurs gardés, interactions).
+    """
+    agg_path, out_path, min_user_listens = args
+    sources = agg_path if isinstance(agg_path, list) else [agg_path]
+    df = pd.concat([pd.read_parquet(path) for path in sources], ignore_index=True)
+
+    if _DEDUP_MAP:
+        df['track_key'] = df['track_key'].map(lambda k: _DEDUP_MAP.get(k, k))
+        df = merge_aggregates(df)
+    elif 'month' not in df or len(sources) > 1:
+        df = merge_aggregates(df)
+
+    user_totals = df.groupby('user_name', sort=False)['play_count'].transform('sum')
+    df = df[user_totals >= min_user_listens]
+
+    write_aggregate(df, out_path)
+    return out_path, df['user_name'].nunique(), len(df)
+
+
+def filter_users(
+    agg_paths: List[BucketSource],
+    work_dir: Path,
+    min_user_listens: int,
+    dedup_file: Optional[Path],
+    workers: int
+) -> List[Path]:
+    """Applique la déduplication et le filtre utilisateurs bucket par bucket."""
+    filtered_dir = work_dir / "filtered"
+    filtered_dir.mkdir(parents=True, exist_ok=True)
+    tasks = [(p, filtered_dir / (p[0] if isinstance(p, list) else p).name, min_user_listens)
+             for p in agg_paths]
+
+    outputs = []
+    n_users = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_filter_worker,
+                             initargs=(dedup_file,)) as executor:
+        for out_path, users, _ in tqdm(executor.map(_filter_bucket, tasks), total=len(tasks), desc="Filtrage users"):
+            outputs.append(out_path)
+            n_users += users
+    print(f"Utilisateurs conservés: {n_users:,}")
+    return outputs
+
+
+def count_tracks(paths: List[Path]) -> pd.Series:
+    """Seconde passe légère: compte global d'écoutes par track (2 colonnes lues)."""
+    counts: Optional[pd.Series] = None
+    for path in tqdm(paths, desc="Comptage tracks"):
+        df = pd.read_parquet(path, columns=['track_key', 'play_count'])
+        bucket_counts = df.groupby('track_key', sort=False)['play_count'].sum()
+        counts = bucket_counts if counts is None else counts.add(bucket_counts, fill_value=0)
+    if counts is None:
+        return pd.Series(dtype=np.int64)
+    return counts.astype(np.int64)
+
+
+def collect_keys(paths: List[Path], column: str, valid_tracks: pd.Index) -> List[str]:
+    """Liste triée des valeurs distinctes d'une colonne, après filtre des tracks."""
+    values = set()
+    for path in paths:
+        df = pd.read_parquet(path, columns=[column, 'track_key'])
+        values.update(df.loc[df['track_key'].isin(valid_tracks), column].unique())
+    return sorted(values)
+
+
+def write_listens(
+    paths: List[Path],
+    output_file: Path,
+    valid_tracks: pd.Index,
+    user_to_id: dict,
+    track_to_id: dict,
+    artist_to_id: dict,
+    n_user_buckets: int = DEFAULT_USER_BUCKETS
+) -> Tuple[int, int, dict]:
+    """
+    Écrit listens.parquet (dataset month=/user_bucket=) bucket par bucket.
+
+    Returns:
+        (interactions, play_count total, manifest du dataset)
+    """
+    totals = {'rows': 0, 'plays': 0}
+
+    def tables():
+        for path in tqdm(paths, desc="Écriture"):
+            df = pd.read_parquet(path)
+            df = df[df['track_key'].isin(valid_tracks)]
+            if df.empty:
+                continue
+            out = pd.DataFrame({
+                'user_id': df['user_name'].map(user_to_id).astype(np.int64),
+                'track_id': df['track_key'].map(track_to_id).astype(np.int64),
+                'artist_id': df['artist_name'].map(artist_to_id).astype(np.int64),
+                'first_listen': df['first_listen'],
+                'last_listen': df['last_listen'],
+                'play_count': df['play_count'].astype(np.int64),
+                'month': df['month'],
+            })
+            table = pa.Table.from_pandas(out, preserve_index=False, safe=False)
+            table = table.append_column('user_bucket', bucket_keys(df['user_name'].values, n_user_buckets))
+            totals['rows'] += len(out)
+            totals['plays'] += int(out['play_count'].sum())
+            yield table
+
+    manifest = write_partitioned(tables(), output_file, LISTENS_SCHEMA, n_user_buckets)
+    return totals['rows'], totals['plays'], manifest
+
+
+def finalize_aggregates(
+    agg_paths: List[BucketSource],
+    work_dir: Path,
+    output_file: Path = OUTPUT_FILE,
+    processed_dir: Path = PROCESSED_DIR,
+    min_user_listens: int = 5,
+    min_track_listens: int = 3,
+    workers: int = 1,
+    id_dicts_dir: Optional[Path] = ID_DICTS_DIR
+) -> dict:
+    """
+    Transforme des buckets agrégés en listens.parquet + mappings.json:
+    déduplication, filtres min_user/min_track, attribution des IDs.
+
+    Avec id_dicts_dir, les IDs proviennent des dictionnaires persistants
+    (stables entre runs); sinon ils sont attribués dans l'ordre trié.
+
+    Réutilisable par tout producteur de buckets au schéma AGGREGATE_SCHEMA;
+    un bucket peut être une liste de fichiers (ex: base + deltas du store
+    incrémental), fusionnés à la lecture.
+    """
+    dedup_file = processed_dir / "track_dedup_map.json"
+    if dedup_file.exists():
+        print(f"Mapping de déduplication: {dedup_file}")
+
+    print(f"\nFiltrage des utilisateurs (min {min_user_listens} écoutes)...")
+    filtered = filter_users(agg_paths, work_dir, min_user_listens, dedup_file, workers)
+
+    print(f"Filtrage des tracks (min {min_track_listens} écoutes)...")
+    track_counts = count_tracks(filtered)
+    valid_tracks = track_counts.index[track_counts >= min_track_listens]
+    print(f"Tracks conservés: {len(valid_tracks):,}")
+
+    print("\nCréation des mappings ID...")
+    users = collect_keys(filtered, 'user_name', valid_tracks)
+    artists = collect_keys(filtered, 'artist_name', valid_tracks)
+    tracks = sorted(valid_tracks)
+    if id_dicts_dir:
+        id_dicts = load_id_dicts(id_dicts_dir)
+        for name, values in (('users', users), ('tracks', tracks), ('artists', artists)):
+            id_dicts[name].add(values)
+        print(f"Dictionnaires d'IDs ({id_dicts_dir}):")
+        save_id_dicts(id_dicts)
+        user_to_id = id_dicts['users'].to_dict()
+        track_to_id = id_dicts['tracks'].to_dict()
+        artist_to_id = id_dicts['artists'].to_dict()
+    else:
+        user_to_id = {u: i for i, u in enumerate(users)}
+        track_to_id = {t: i for i, t in enumerate(tracks)}
+        artist_to_id = {a: i for i, a in enumerate(artists)}
+
+    n_rows, n_plays, manifest = write_listens(filtered, output_file, valid_tracks,
+                                              user_to_id, track_to_id, artist_to_id)
+
+    mappings_file = processed_dir / "mappings.json"
+    save_mappings(user_to_id, track_to_id, artist_to_id, mappings_file)
+
+    print(f"\n{'=' * 60}")
+    print("STATISTIQUES FINALES")
+    print(f"{'=' * 60}")
+    print(f"Interactions (user, track, mois): {n_rows:,}")
+    print(f"Utilisateurs uniques: {len(users):,}")
+    print(f"Tracks uniques: {len(tracks):,}")
+    print(f"Artistes uniques: {len(artists):,}")
+    if n_rows:
+        print(f"Play count moyen: {n_plays / n_rows:.2f}")
+    print(f"Mois: {len(manifest['months'])} | Partitions: {len(manifest['partitions'])}")
+    print(f"Taille du dataset: {manifest['bytes'] / (1024 * 1024):.1f} MB")
+    print(f"Mappings sauvegardés: {mappings_file}")
+
+    return {
+        'n_interactions': n_rows,
+        'n_plays': n_plays,
+        'n_users': len(users),
+        'n_tracks': len(tracks),
+        'n_artists': len(artists),
+    }
+
+
+# ──────────────────────────────────────────────
+# Pipeline principal
+# ──────────────────────────────────────────────
+
+def aggregate_partitioned(
+    input_path: Path = INPUT_FILE,
+    output_file: Path = OUTPUT_FILE,
+    work_dir: Path = WORK_DIR,
+    processed_dir: Path = PROCESSED_DIR,
+    n_partitions: int = 0,
+    memory_mb: int = DEFAULT_MEMORY_MB,
+    workers: int = 0,
+    min_user_listens: int = 5,
+    min_track_listens: int = 3,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    keep_partitions: bool = False,
+    id_dicts_dir: Optional[Path] = ID_DICTS_DIR,
+    start_month: Optional[str] = None,
+    end_month: Optional[str] = None
+) -> dict:
+    """
+    Agrège les écoutes en mémoire bornée.
+
+    Args:
+        input_path: Fichier ou dataset partitionné des écoutes brutes
+        output_file: Dataset de sortie (même schéma que aggregate_data.py)
+        work_dir: Dossier des buckets intermédiaires
+        processed_dir: Dossier des mappings (mappings.json, track_dedup_map.json)
+        n_partitions: Nombre de buckets (0 = calculé depuis memory_mb)
+        memory_mb: Budget mémoire total pour l'agrégation parallèle
+        workers: Nombre de process (0 = nombre de cœurs)
+        min_user_listens: Minimum d'écoutes par utilisateur
+        min_track_listens: Minimum d'écoutes par track
+        batch_size: Taille des batches de lecture
+        keep_partitions: Conserver les buckets intermédiaires
+        id_dicts_dir: Dossier des dictionnaires d'IDs persistants (None = IDs non stables)
+        start_month: Premier mois agrégé ('YYYY-MM', None = depuis le début)
+        end_month: Dernier mois agrégé inclus (None = jusqu'à la fin)
+
+    Returns:
+        Statistiques de l'agrégation
+    """
+    print("=" * 60)
+    print("Agrégation partitionnée des écoutes")
+    print("=" * 60)
+
+    workers = workers or os.cpu_count() or 1
+    if not n_partitions:
+        n_partitions = estimate_partitions(input_path, memory_mb, workers, start_month, end_month)
+    print(f"Buckets: {n_partitions} | Workers: {workers} | Budget: {memory_mb} MB")
+    if start_month or end_month:
+        print(f"Fenêtre: {start_month or 'début'} → {end_month or 'fin'}")
+
+    if work_dir.exists():
+        shutil.rmtree(work_dir)
+
+    try:
+        print(f"\nPartitionnement de {input_path}...")
+        raw_paths, total = partition_listens(input_path, work_dir, n_partitions, batch_size,
+                                             start_month, end_month)
+        print(f"Écoutes partitionnées: {total:,} dans {len(raw_paths)} buckets")
+
+        agg_paths = aggregate_partitions(raw_paths, work_dir, workers)
+        stats = finalize_aggregates(
+            agg_paths, work_dir,
+            output_file=output_file,
+            processed_dir=processed_dir,
+            min_user_listens=min_user_listens,
+            min_track_listens=min_track_listens,
+            workers=workers,
+            id_dicts_dir=id_dicts_dir,
+        )
+    finally:
+        if not keep_partitions and work_dir.exists():
+            shutil.rmtree(work_dir)
+
+    return stats
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Agrégation out-of-core des écoutes")
+    parser.add_argument("--input", type=Path, default=INPUT_FILE,
+                        help="Fichier ou dataset parquet d'entrée")
+    parser.add_argument("--output", type=Path, default=OUTPUT_FILE,
+                        help="Dataset parquet de sortie")
+    parser.add_argument("--work-dir", type=Path, default=WORK_DIR,
+                        help="Dossier des buckets intermédiaires")
+    parser.add_argument("--partitions", type=int, default=0,
+                        help="Nombre de buckets (0 = auto selon --memory-mb)")
+    parser.add_argument("--memory-mb", type=int, default=DEFAULT_MEMORY_MB,
+                        help="Budget mémoire de l'agrégation (MB)")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Nombre de process (0 = nombre de cœurs)")
+    parser.add_argument("--min-user-listens", type=int, default=5,
+                        help="Minimum d'écoutes par utilisateur")
+    parser.add_argument("--min-track-listens", type=int, default=3,
+                        help="Minimum d'écoutes par track")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Taille des batches de lecture")
+    parser.add_argument("--keep-partitions", action="store_true",
+                        help="Conserver les buckets intermédiaires")
+    parser.add_argument("--id-dicts", type=Path, default=ID_DICTS_DIR,
+                        help="Dossier des dictionnaires d'IDs persistants")
+    parser.add_argument("--no-id-dicts", action="store_true",
+                        help="Réattribuer les IDs à chaque run")
+    parser.add_argument("--start-month", help="Premier mois agrégé (YYYY-MM)")
+    parser.add_argument("--end-month", help="Dernier mois agrégé, inclus (YYYY-MM)")
+
+    args = parser.parse_args()
+
+    aggregate_partitioned(
+        input_path=args.input,
+        output_file=args.output,
+        work_dir=args.work_dir,
+        processed_dir=args.output.parent,
+        n_partitions=args.partitions,
+        memory_mb=args.memory_mb,
+        workers=args.workers,
+        min_user_listens=args.min_user_listens,
+        min_track_listens=args.min_track_listens,
+        batch_size=args.batch_size,
+        keep_partitions=args.keep_partitions,
+        id_dicts_dir=None if args.no_id_dicts else args.id_dicts,
+        start_month=args.start_month,
+        end_month=args.end_month
+    )
+
+
+if __name__ == "__main__":
+    main()
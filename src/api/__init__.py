@@ -1,4 +1,12 @@
 from .recommender import RecommendationService
-from .main import app
 
 __all__ = ['RecommendationService', 'app']
+
+
+def __getattr__(name):
+    # Import paresseux: les modules du paquet (export, tracks...) restent
+    # importables sans démarrer l'application (agent festival, dotenv)
+    if name == 'app':
+        from .main import app
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
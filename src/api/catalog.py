@@ -4,16 +4,21 @@ Entièrement async : boto3 exécuté dans un thread via asyncio.to_thread.
 """
 import asyncio
 import json
+from pathlib import Path
 from typing import List, Optional
 
 import boto3
+import numpy as np
+
+from .tracks import TrackTable
 
 
 class CatalogService:
     _instance: Optional["CatalogService"] = None
 
     def __init__(self):
-        self.tracks: List[dict] = []
+        self.tracks: Optional[TrackTable] = None
+        self.item_ids: np.ndarray = np.empty(0, dtype=np.int64)
         self.is_loaded: bool = False
 
     @classmethod
@@ -32,7 +37,26 @@ class CatalogService:
         dedup_map: dict = json.loads(raw)
         track_to_id: dict = json.loads(mappings_raw).get("track_to_id", {})
         self._build_catalog(dedup_map, track_to_id)
-        print(f"Catalogue chargé: {len(self.tracks):,} tracks (alignés sur le modèle)")
+        print(f"Catalogue chargé: {self.total():,} tracks (alignés sur le modèle)")
+
+    async def load(self, mappings_path: Path, dedup_path: Optional[Path] = None):
+        """
+        Charge le catalogue depuis le disque (non-bloquant).
+        Sans track_dedup_map.json, chaque track du modèle est son propre nom canonique.
+        """
+        print(f"  - Catalogue: {dedup_path if dedup_path and dedup_path.exists() else mappings_path}")
+
+        def _read():
+            with open(mappings_path, "r", encoding="utf-8") as f:
+                track_to_id = json.load(f).get("track_to_id", {})
+            if dedup_path and dedup_path.exists():
+                with open(dedup_path, "r", encoding="utf-8") as f:
+                    return json.load(f), track_to_id
+            return {name: name for name in track_to_id}, track_to_id
+
+        dedup_map, track_to_id = await asyncio.to_thread(_read)
+        self._build_catalog(dedup_map, track_to_id)
+        print(f"Catalogue chargé: {self.total():,} tracks (alignés sur le modèle)")
 
     @staticmethod
     def _fetch_s3(bucket: str, key: str, region: str) -> bytes:
@@ -40,33 +64,32 @@ class CatalogService:
         return s3.get_object(Bucket=bucket, Key=key)["Body"].read()
 
     def _build_catalog(self, dedup_map: dict, track_to_id: dict):
-        canonical_names = sorted(set(dedup_map.values()))
-        self.tracks = []
-        for name in canonical_names:
-            item_id = track_to_id.get(name)
-            if item_id is None:
-                continue  # track absente du modèle → on ne l'affiche pas
-            if " - " in name:
-                artist, title = name.split(" - ", 1)
-            else:
-                artist, title = "Unknown", name
-            self.tracks.append(
-                {
-                    "id": item_id,
-                    "canonical_name": name,
-                    "artist": artist.strip(),
-                    "title": title.strip(),
-                }
-            )
+        # Ordre d'affichage: noms canoniques triés, tracks absentes du modèle exclues
+        names = [name for name in sorted(set(dedup_map.values())) if name in track_to_id]
+        tracks = TrackTable.from_names(names)
+        tracks.build_search_index()
+        self.item_ids = np.fromiter((track_to_id[name] for name in names), dtype=np.int64, count=len(names))
+        self.tracks = tracks
         self.is_loaded = True
 
+    def _records(self, rows) -> List[dict]:
+        rows = np.asarray(rows, dtype=np.int64)
+        return [
+            {"id": item_id, "canonical_name": name, "artist": artist, "title": title}
+            for item_id, name, artist, title in zip(
+                self.item_ids[rows].tolist(),
+                self.tracks.canonical.take(rows),
+                self.tracks.artist.take(rows),
+                self.tracks.title.take(rows),
+            )
+        ]
+
     def search(self, query: str, limit: int = 24) -> List[dict]:
-        q = query.lower()
-        return [t for t in self.tracks if q in t["canonical_name"].lower()][:limit]
+        return self._records(self.tracks.search(query, limit))
 
     def get_page(self, page: int = 0, size: int = 48) -> List[dict]:
-        start = page * size
-        return self.tracks[start : start + size]
+        start = min(page * size, self.total())
+        return self._records(np.arange(start, min(start + size, self.total())))
 
     def total(self) -> int:
-        return len(self.tracks)
+        return len(self.item_ids)
@@ -9,6 +9,8 @@ import time
 
 import httpx
 
+from .metrics import cache_access, stage
+
 _DEEZER_URL  = "https://api.deezer.com/search"
 _ITUNES_URL  = "https://itunes.apple.com/search"
 _PLACEHOLDER = (
@@ -76,21 +78,25 @@ async def get_track_info(artist: str, title: str) -> dict:
     """Retourne {"url": cover_url, "preview_url": mp3_or_None}."""
     key = f"{artist}|{title}".lower()
     if key in _cache:
+        cache_access("cover", hit=True)
         return _cache[key]
 
     info = {"url": _PLACEHOLDER, "preview_url": None}
 
     async with _lock:
         if key in _cache:
+            cache_access("cover", hit=True)
             return _cache[key]
+        cache_access("cover", hit=False)
         await _throttle()
         try:
-            async with httpx.AsyncClient(timeout=6.0) as client:
-                result = await _deezer(client, artist, title)
-                if not result:
-                    result = await _itunes(client, artist, title)
-                if result:
-                    info = result
+            with stage("cover_upstream").time():
+                async with httpx.AsyncClient(timeout=6.0) as client:
+                    result = await _deezer(client, artist, title)
+                    if not result:
+                        result = await _itunes(client, artist, title)
+                    if result:
+                        info = result
         except Exception:
             pass
 
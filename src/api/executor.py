@@ -0,0 +1,135 @@
+"""
+Exécuteur dédié aux calculs du modèle (recommend, similar, historique).
+
+- nombre fixe de workers, séparé du pool par défaut d'asyncio
+- threads BLAS/OpenMP bornés (threadpoolctl) pour éviter N requêtes × M threads
+- contrôle d'admission: une requête est refusée (Overloaded) si la file est
+  pleine ou si l'attente estimée dépasse le budget de latence, plutôt que de
+  ralentir toutes les requêtes
+
+Configuration par variables d'environnement (COMPUTE_*).
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from threadpoolctl import threadpool_limits
+
+from .metrics import COMPUTE_ACTIVE, COMPUTE_QUEUE_DEPTH, COMPUTE_REJECTED, stage
+
+COMPUTE_WORKERS = int(os.getenv("COMPUTE_WORKERS", min(4, os.cpu_count() or 1)))
+COMPUTE_BLAS_THREADS = int(os.getenv("COMPUTE_BLAS_THREADS", 1))
+COMPUTE_MAX_QUEUE = int(os.getenv("COMPUTE_MAX_QUEUE", 64))
+COMPUTE_QUEUE_BUDGET_MS = float(os.getenv("COMPUTE_QUEUE_BUDGET_MS", 500))
+COMPUTE_REJECT_STATUS = int(os.getenv("COMPUTE_REJECT_STATUS", 503))
+
+# Poids de la dernière mesure dans la moyenne mobile du temps de calcul
+_EWMA_ALPHA = 0.2
+
+
+class Overloaded(Exception):
+    """Requête refusée par le contrôle d'admission."""
+
+    def __init__(self, reason: str, retry_after: float, status_code: int = COMPUTE_REJECT_STATUS):
+        super().__init__(f"Service surchargé ({reason}), réessayer dans {retry_after:.1f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+
+class ComputeExecutor:
+    """Pool de calcul borné avec estimation de l'attente en file."""
+
+    def __init__(
+        self,
+        workers: int = COMPUTE_WORKERS,
+        blas_threads: int = COMPUTE_BLAS_THREADS,
+        max_queue: int = COMPUTE_MAX_QUEUE,
+        queue_budget_ms: float = COMPUTE_QUEUE_BUDGET_MS,
+        reject_status: int = COMPUTE_REJECT_STATUS
+    ):
+        self.workers = max(1, workers)
+        self.blas_threads = max(1, blas_threads)
+        self.max_queue = max_queue
+        self.queue_budget = queue_budget_ms / 1000
+        self.reject_status = reject_status
+
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="compute",
+                                        initializer=self._init_worker)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._active = 0
+        self._service_time: Optional[float] = None
+
+    def _init_worker(self):
+        # Les limites threadpoolctl sont globales au process: appliquées au
+        # démarrage des workers, après le chargement de numpy/implicit.
+        threadpool_limits(limits=self.blas_threads)
+
+    def estimated_wait(self) -> float:
+        """Attente estimée d'une nouvelle requête: file / workers × temps de calcul moyen."""
+        if self._service_time is None:
+            return 0.0
+        return (self._pending / self.workers) * self._service_time
+
+    def _admit(self):
+        with self._lock:
+            if self._pending >= self.max_queue:
+                reason = "queue_full"
+            elif self.estimated_wait() > self.queue_budget:
+                reason = "latency_budget"
+            else:
+                self._pending += 1
+                COMPUTE_QUEUE_DEPTH.set(self._pending)
+                return
+            retry_after = max(self.estimated_wait(), self.queue_budget)
+        COMPUTE_REJECTED.labels(reason).inc()
+        raise Overloaded(reason, retry_after, self.reject_status)
+
+    async def run(self, stage_name: str, func, *args):
+        """
+        Exécute func(*args) dans le pool.
+        Mesure l'attente en file (queue_wait) et le calcul (stage_name).
+
+        Raises:
+            Overloaded: si la requête n'est pas admise
+        """
+        self._admit()
+        queue_wait, compute = stage("queue_wait"), stage(stage_name)
+        submitted = time.perf_counter()
+
+        def _run():
+            started = time.perf_counter()
+            queue_wait.observe(started - submitted)
+            with self._lock:
+                self._pending -= 1
+                self._active += 1
+                COMPUTE_QUEUE_DEPTH.set(self._pending)
+                COMPUTE_ACTIVE.set(self._active)
+            try:
+                return func(*args)
+            finally:
+                elapsed = time.perf_counter() - started
+                compute.observe(elapsed)
+                with self._lock:
+                    self._active -= 1
+                    COMPUTE_ACTIVE.set(self._active)
+                    previous = self._service_time
+                    self._service_time = elapsed if previous is None else \
+                        previous + _EWMA_ALPHA * (elapsed - previous)
+
+        future = self._pool.submit(_run)
+        # Requête annulée avant son démarrage (client déconnecté): libérer sa place
+        future.add_done_callback(lambda f: f.cancelled() and self._release_pending())
+        return await asyncio.wrap_future(future)
+
+    def _release_pending(self):
+        with self._lock:
+            self._pending -= 1
+            COMPUTE_QUEUE_DEPTH.set(self._pending)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,154 @@
+"""
+Export en masse des recommandations (top-N de tous les utilisateurs).
+
+Partagé par l'endpoint GET /export/recommendations (blocs calculés dans
+l'exécuteur de l'API) et par la CLI src/export_recommendations.py (blocs
+répartis sur un pool de process). Les utilisateurs sont parcourus par blocs
+et chaque bloc est encodé puis écrit aussitôt: le résultat complet n'est
+jamais construit en mémoire.
+
+Formats:
+- ndjson: une ligne JSON par utilisateur
+- arrow: flux Arrow IPC, un RecordBatch par bloc
+"""
+import io
+import json
+from typing import Iterator, NamedTuple
+
+import numpy as np
+import pyarrow as pa
+
+from models.als_model import PADDING_SCORE
+
+from .topk_store import quantize_scores
+from .tracks import TrackTable
+from .user_index import UserIndex
+
+EXPORT_FORMATS = ("ndjson", "arrow")
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+EXPORT_BLOCK_SIZE = 1000
+
+
+ARROW_SCHEMA = pa.schema([
+    ("user_index", pa.int32()),
+    ("user_id", pa.string()),
+    ("item_id", pa.list_(pa.int32())),
+    ("score", pa.list_(pa.float32())),
+    ("artist", pa.list_(pa.string())),
+    ("track", pa.list_(pa.string())),
+])
+
+
+class ExportBlock(NamedTuple):
+    """Top-N d'un bloc d'utilisateurs: item_ids et scores de forme (len(user_ids), n)."""
+    user_ids: np.ndarray
+    item_ids: np.ndarray
+    scores: np.ndarray
+
+
+def user_blocks(n_users: int, block_size: int = EXPORT_BLOCK_SIZE) -> Iterator[np.ndarray]:
+    for start in range(0, n_users, block_size):
+        yield np.arange(start, min(start + block_size, n_users), dtype=np.int64)
+
+
+def recommend_block(model, user_ids: np.ndarray, n: int, filter_already_liked: bool = True,
+                    store_precision: bool = False) -> ExportBlock:
+    """
+    Top-N d'un bloc. store_precision: scores ramenés à la précision du store
+    top-K (float16), comme ceux servis par l'API quand un store est chargé.
+    """
+    item_ids, scores = model.recommend_arrays(user_ids, n, filter_already_liked)
+    scores = quantize_scores(scores) if store_precision else scores.astype(np.float32, copy=False)
+    return ExportBlock(np.asarray(user_ids, dtype=np.int32), item_ids.astype(np.int32, copy=False), scores)
+
+
+def encode_block(encoder: "BlockEncoder", model, user_ids: np.ndarray, n: int,
+                 filter_already_liked: bool = True, store_precision: bool = False) -> bytes:
+    """Calcul et encodage d'un bloc, à exécuter hors de la boucle asyncio."""
+    return encoder.encode(recommend_block(model, user_ids, n, filter_already_liked, store_precision))
+
+
+class BlockEncoder:
+    """Encode les blocs d'un export: start() → encode(bloc)* → finish()."""
+
+    def __init__(self, fmt: str, users: UserIndex, tracks: TrackTable):
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Format d'export inconnu: {fmt} (attendu: {', '.join(EXPORT_FORMATS)})")
+        self.fmt = fmt
+        self.users = users
+        self.tracks = tracks
+        self._sink = io.BytesIO()
+        self._writer = None
+
+    def _user_name(self, user_id: int) -> str:
+        return self.users.name(user_id) or str(user_id)
+
+    def start(self) -> bytes:
+        if self.fmt == "arrow":
+            self._writer = pa.ipc.new_stream(self._sink, ARROW_SCHEMA)
+            return self._drain()
+        return b""
+
+    def encode(self, block: ExportBlock) -> bytes:
+        if self.fmt == "arrow":
+            return self.write_batch(self.record_batch(block))
+        return self.ndjson(block)
+
+    def _gather(self, block: ExportBlock):
+        """Retire le remplissage et récupère les noms en un seul gather."""
+        valid = block.scores > PADDING_SCORE
+        items = block.item_ids[valid]
+        return (valid.sum(axis=1), items, block.scores[valid],
+                self.tracks.artist.take(items), self.tracks.title.take(items),
+                [self._user_name(uid) for uid in block.user_ids.tolist()])
+
+    def ndjson(self, block: ExportBlock) -> bytes:
+        """Une ligne JSON par utilisateur (sans état: encodable dans un worker)."""
+        counts, items, scores, artists, titles, names = self._gather(block)
+        item_list, score_list = items.tolist(), scores.tolist()
+        lines, position = [], 0
+        for user_id, name, count in zip(block.user_ids.tolist(), names, counts.tolist()):
+            recommendations = [
+                {"track": titles[i], "artist": artists[i], "score": round(score_list[i], 4), "item_id": item_list[i]}
+                for i in range(position, position + count)
+            ]
+            position += count
+            lines.append(json.dumps({"user_id": name, "user_index": user_id,
+                                     "recommendations": recommendations}, ensure_ascii=False))
+        return ("\n".join(lines) + "\n").encode("utf-8") if lines else b""
+
+    def record_batch(self, block: ExportBlock) -> pa.RecordBatch:
+        """RecordBatch du bloc (sans état: construisible dans un worker)."""
+        counts, items, scores, artists, titles, names = self._gather(block)
+        offsets = np.zeros(len(counts) + 1, dtype=np.int32)
+        np.cumsum(counts, out=offsets[1:])
+        offsets = pa.array(offsets)
+        return pa.RecordBatch.from_arrays([
+            pa.array(block.user_ids, type=pa.int32()),
+            pa.array(names, type=pa.string()),
+            pa.ListArray.from_arrays(offsets, pa.array(items, type=pa.int32())),
+            pa.ListArray.from_arrays(offsets, pa.array(scores, type=pa.float32())),
+            pa.ListArray.from_arrays(offsets, pa.array(artists, type=pa.string())),
+            pa.ListArray.from_arrays(offsets, pa.array(titles, type=pa.string())),
+        ], schema=ARROW_SCHEMA)
+
+    def write_batch(self, batch: pa.RecordBatch) -> bytes:
+        """Octets du flux IPC pour un RecordBatch (après start())."""
+        self._writer.write_batch(batch)
+        return self._drain()
+
+    def finish(self) -> bytes:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            return self._drain()
+        return b""
+
+    def _drain(self) -> bytes:
+        data = self._sink.getvalue()
+        self._sink.seek(0)
+        self._sink.truncate()
+        return data
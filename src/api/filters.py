@@ -0,0 +1,74 @@
+"""
+Filtres de recommandation (artistes, items exclus, plafond par artiste).
+
+Une FilterSpec est compilée en un masque booléen sur les item_ids à partir
+des postings artiste → items de la TrackTable, puis appliquée aux scores
+avant la sélection du top-K (ALSRecommender.recommend_filtered): pas de
+sur-échantillonnage suivi d'un filtrage en Python.
+
+Les exclusions propres à chaque utilisateur (titres likés dans la
+bibliothèque) sont passées à part, pour partager le masque dans un batch.
+"""
+from typing import NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .tracks import TrackTable
+
+
+class FilterSpec(NamedTuple):
+    """Filtres communs à une requête (hashable: sert aussi de clé de cache)."""
+    include_artists: Tuple[str, ...] = ()
+    exclude_artists: Tuple[str, ...] = ()
+    exclude_items: Tuple[int, ...] = ()
+    max_per_artist: Optional[int] = None
+
+    @classmethod
+    def build(
+        cls,
+        include_artists: Optional[Sequence[str]] = None,
+        exclude_artists: Optional[Sequence[str]] = None,
+        exclude_items: Optional[Sequence[int]] = None,
+        max_per_artist: Optional[int] = None
+    ) -> Optional["FilterSpec"]:
+        """Spec normalisée (listes triées sans doublons), None si aucun filtre."""
+        spec = cls(
+            include_artists=tuple(sorted(set(include_artists or ()))),
+            exclude_artists=tuple(sorted(set(exclude_artists or ()))),
+            exclude_items=tuple(sorted(set(exclude_items or ()))),
+            max_per_artist=max_per_artist,
+        )
+        return spec if spec != cls() else None
+
+
+class CompiledFilter(NamedTuple):
+    """Arguments de ALSRecommender.recommend_filtered."""
+    allowed: Optional[np.ndarray]
+    groups: Optional[np.ndarray]
+    max_per_group: Optional[int]
+
+
+def compile_filter(spec: Optional[FilterSpec], tracks: TrackTable, n_items: int) -> CompiledFilter:
+    """
+    Masque des items autorisés (None = tous) et groupes artiste pour le plafond.
+
+    Un filtre d'inclusion dont aucun artiste n'est connu n'autorise aucun item.
+    """
+    if spec is None:
+        return CompiledFilter(None, None, None)
+
+    allowed = None
+    if spec.include_artists:
+        allowed = np.zeros(n_items, dtype=bool)
+        rows = tracks.artist_rows(tracks.artist_ids(spec.include_artists))
+        allowed[rows[rows < n_items]] = True
+    if spec.exclude_artists or spec.exclude_items:
+        if allowed is None:
+            allowed = np.ones(n_items, dtype=bool)
+        rows = tracks.artist_rows(tracks.artist_ids(spec.exclude_artists))
+        allowed[rows[rows < n_items]] = False
+        items = np.asarray(spec.exclude_items, dtype=np.int64)
+        allowed[items[(items >= 0) & (items < n_items)]] = False
+
+    groups = tracks.artist_id[:n_items] if spec.max_per_artist else None
+    return CompiledFilter(allowed, groups, spec.max_per_artist)
@@ -4,11 +4,12 @@ Persistance via un fichier JSON local. Entièrement async.
 """
 import asyncio
 import json
+import os
 import uuid
 from pathlib import Path
 from typing import Optional
 
-DATA_FILE = Path(__file__).parent.parent.parent / "data" / "library.json"
+DATA_FILE = Path(os.getenv("LIBRARY_PATH", Path(__file__).parent.parent.parent / "data" / "library.json"))
 
 
 class LibraryService:
@@ -58,6 +59,11 @@ class LibraryService:
     async def get_likes(self, user_id: str) -> list:
         return self._user(user_id)["likes"]
 
+    def liked_item_ids(self, user_id: str) -> list:
+        """item_ids likés (sans créer d'entrée pour un utilisateur inconnu)."""
+        user = self._data.get(user_id)
+        return [t["item_id"] for t in user["likes"]] if user else []
+
     async def is_liked(self, user_id: str, item_id: int) -> bool:
         return any(t["item_id"] == item_id for t in self._user(user_id)["likes"])
 
@@ -14,14 +14,20 @@ from typing import List, Optional
 
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field
 
 from .catalog import CatalogService
 from .cover_service import get_cover_url, get_track_info
+from .executor import Overloaded
+from .filters import FilterSpec
+from .export import EXPORT_BLOCK_SIZE, MEDIA_TYPES
 from .library import LibraryService
+from .metrics import REGISTRY, instrument_app
 from .recommender import RecommendationService
+from .response_cache import ResponseCache
+from .responses import batch_json, history_json, playlist_json, recommendation_json, similar_json
 
 # ---------------------------------------------------------------------------
 # Import de l'agent festival (src/app/agent/)
@@ -52,6 +58,7 @@ S3_MODEL_KEY = os.getenv("S3_MODEL_KEY", "models/als_model.pkl")
 S3_MATRIX_KEY = os.getenv("S3_MATRIX_KEY", "processed/user_item_matrix.npz")
 S3_MAPPINGS_KEY = os.getenv("S3_MAPPINGS_KEY", "processed/mappings.json")
 S3_CATALOG_KEY = os.getenv("S3_CATALOG_KEY", "processed/track_dedup_map.json")
+S3_TOPK_KEY = os.getenv("S3_TOPK_KEY", "models/topk.bin")
 
 STATIC_DIR = Path(__file__).parent.parent / "static"
 
@@ -62,6 +69,11 @@ MODELS_DIR = BASE_DIR / "models"
 MODEL_PATH = Path(os.getenv("MODEL_PATH", MODELS_DIR / "als_model.pkl"))
 MATRIX_PATH = Path(os.getenv("MATRIX_PATH", DATA_DIR / "user_item_matrix.npz"))
 MAPPINGS_PATH = Path(os.getenv("MAPPINGS_PATH", DATA_DIR / "mappings.json"))
+CATALOG_PATH = Path(os.getenv("CATALOG_PATH", DATA_DIR / "track_dedup_map.json"))
+TOPK_PATH = Path(os.getenv("TOPK_PATH", MODELS_DIR / "topk.bin"))
+
+# Nombre maximal d'utilisateurs par appel à /recommend/batch
+BATCH_MAX_USERS = int(os.getenv("BATCH_MAX_USERS", 5000))
 
 # Créer l'application
 app = FastAPI(
@@ -97,6 +109,30 @@ class RecommendationResponse(BaseModel):
     recommendations: List[TrackRecommendation] = Field(..., description="Liste des recommandations")
 
 
+class RecommendationFilters(BaseModel):
+    """Filtres appliqués avant la sélection des recommandations."""
+    artists: List[str] = Field(default_factory=list, description="Restreindre à ces artistes")
+    exclude_artists: List[str] = Field(default_factory=list, description="Exclure ces artistes")
+    exclude_items: List[int] = Field(default_factory=list, description="Exclure ces tracks")
+    exclude_library_likes: bool = Field(default=False, description="Exclure les tracks likés dans la bibliothèque")
+    max_per_artist: Optional[int] = Field(default=None, ge=1, le=100, description="Nombre max de tracks par artiste")
+
+
+class BatchRecommendationRequest(BaseModel):
+    """Requête de recommandations groupées."""
+    user_ids: List[str] = Field(..., min_length=1, max_length=BATCH_MAX_USERS,
+                                description="IDs numériques ou noms d'utilisateurs")
+    n: int = Field(default=10, ge=1, le=100, description="Nombre de recommandations par utilisateur")
+    filter_liked: bool = Field(default=True, description="Exclure les tracks déjà écoutés")
+    filters: Optional[RecommendationFilters] = Field(default=None, description="Filtres communs aux utilisateurs")
+
+
+class BatchRecommendationResponse(BaseModel):
+    """Réponse de recommandations groupées."""
+    results: List[RecommendationResponse] = Field(..., description="Recommandations, dans l'ordre de la requête")
+    not_found: List[str] = Field(..., description="Utilisateurs inconnus")
+
+
 class SimilarTracksResponse(BaseModel):
     """Réponse pour les tracks similaires."""
     track_id: int = Field(..., description="ID du track source")
@@ -135,10 +171,32 @@ class HistoryResponse(BaseModel):
     history: List[HistoryItem]
 
 
+def _overloaded(e: Overloaded) -> HTTPException:
+    """Refus du contrôle d'admission → 503/429 avec Retry-After."""
+    return HTTPException(
+        status_code=e.status_code,
+        detail=str(e),
+        headers={"Retry-After": str(max(1, round(e.retry_after)))},
+    )
+
+
 # Services singletons
 service = RecommendationService.get_instance()
 catalog  = CatalogService.get_instance()
 library  = LibraryService.get_instance()
+response_cache = ResponseCache()
+
+
+def _from_cache(key: tuple) -> Optional[Response]:
+    """Réponse déjà sérialisée pour le snapshot courant, None si absente."""
+    body = response_cache.get(service.snapshot_version, key)
+    return Response(content=body, media_type="application/json") if body is not None else None
+
+
+def _cache_response(version: str, key: tuple, body: bytes) -> Response:
+    """Met en cache le corps déjà encodé (voir responses.py) et le renvoie tel quel."""
+    response_cache.put(version, key, body)
+    return Response(content=body, media_type="application/json")
 
 
 async def _load_model():
@@ -150,12 +208,14 @@ async def _load_model():
             matrix_key=S3_MATRIX_KEY,
             mappings_key=S3_MAPPINGS_KEY,
             region=S3_REGION,
+            topk_key=S3_TOPK_KEY,
         )
     elif MODEL_PATH.exists() and MATRIX_PATH.exists():
         await service.load(
             model_path=MODEL_PATH,
             matrix_path=MATRIX_PATH,
             mappings_path=MAPPINGS_PATH if MAPPINGS_PATH.exists() else None,
+            topk_path=TOPK_PATH,
         )
     else:
         raise FileNotFoundError(
@@ -165,11 +225,16 @@ async def _load_model():
 
 
 async def _load_catalog():
-    """Charge le catalogue de tracks depuis S3."""
+    """Charge le catalogue de tracks depuis S3 (prioritaire) ou depuis le disque local."""
     if S3_BUCKET:
         await catalog.load_from_s3(bucket=S3_BUCKET, key=S3_CATALOG_KEY, region=S3_REGION)
+    elif MAPPINGS_PATH.exists():
+        await catalog.load(mappings_path=MAPPINGS_PATH, dedup_path=CATALOG_PATH)
     else:
-        raise FileNotFoundError("S3_BUCKET_MODEL requis pour charger le catalogue.")
+        raise FileNotFoundError(
+            "Aucune source de catalogue disponible. "
+            "Définissez S3_BUCKET_MODEL ou placez mappings.json localement."
+        )
 
 
 @app.on_event("startup")
@@ -225,11 +290,22 @@ async def get_stats():
     return StatsResponse(**stats)
 
 
+@app.get("/metrics", response_class=PlainTextResponse, tags=["Info"])
+async def metrics():
+    """Métriques opérationnelles au format texte Prometheus."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.get("/recommend/{user_id}", response_model=RecommendationResponse, tags=["Recommendations"])
 async def recommend(
     user_id: str,
     n: int = Query(default=10, ge=1, le=100, description="Nombre de recommandations"),
-    filter_liked: bool = Query(default=True, description="Exclure les tracks déjà écoutés")
+    filter_liked: bool = Query(default=True, description="Exclure les tracks déjà écoutés"),
+    artist: List[str] = Query(default=[], description="Restreindre à ces artistes"),
+    exclude_artist: List[str] = Query(default=[], description="Exclure ces artistes"),
+    exclude_item: List[int] = Query(default=[], description="Exclure ces tracks"),
+    exclude_library_likes: bool = Query(default=False, description="Exclure les tracks likés dans la bibliothèque"),
+    max_per_artist: Optional[int] = Query(default=None, ge=1, le=100, description="Nombre max de tracks par artiste")
 ):
     """
     Génère des recommandations personnalisées pour un utilisateur.
@@ -237,22 +313,63 @@ async def recommend(
     - **user_id**: ID numérique ou nom d'utilisateur
     - **n**: Nombre de recommandations (1-100)
     - **filter_liked**: Exclure les tracks déjà dans l'historique
+    - **artist** / **exclude_artist**: Restreindre à / exclure des artistes (répétables)
+    - **exclude_item**: Exclure des tracks (répétable)
+    - **exclude_library_likes**: Exclure les tracks likés dans la bibliothèque
+    - **max_per_artist**: Nombre max de tracks par artiste
     """
     if not service.is_loaded:
         raise HTTPException(status_code=503, detail="Modèle non chargé")
 
+    excluded = exclude_item + library.liked_item_ids(user_id) if exclude_library_likes else exclude_item
+    filters = FilterSpec.build(artist, exclude_artist, excluded, max_per_artist)
+    key, version = ("recommend", user_id, n, filter_liked, filters), service.snapshot_version
+    cached = _from_cache(key)
+    if cached is not None:
+        return cached
+
     try:
-        recommendations = await service.recommend(user_id, n, filter_liked)
-        return RecommendationResponse(
-            user_id=user_id,
-            recommendations=[TrackRecommendation(**r) for r in recommendations]
-        )
+        item_ids, scores = await service.recommend_arrays(user_id, n, filter_liked, filters)
+        return _cache_response(version, key, recommendation_json(user_id, service.tracks, item_ids, scores))
+    except Overloaded as e:
+        raise _overloaded(e)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
 
+@app.post("/recommend/batch", response_model=BatchRecommendationResponse, tags=["Recommendations"])
+async def recommend_batch(request: BatchRecommendationRequest):
+    """
+    Génère des recommandations pour plusieurs utilisateurs en un appel.
+
+    - **user_ids**: IDs numériques ou noms d'utilisateurs (1-BATCH_MAX_USERS)
+    - **n**: Nombre de recommandations par utilisateur (1-100)
+    - **filter_liked**: Exclure les tracks déjà dans l'historique
+    - **filters**: Filtres artistes / tracks / likés, communs à tous les utilisateurs
+
+    Les utilisateurs inconnus sont listés dans `not_found` sans faire échouer l'appel.
+    """
+    if not service.is_loaded:
+        raise HTTPException(status_code=503, detail="Modèle non chargé")
+
+    try:
+        filters, user_excludes = None, None
+        if request.filters is not None:
+            f = request.filters
+            filters = FilterSpec.build(f.artists, f.exclude_artists, f.exclude_items, f.max_per_artist)
+            if f.exclude_library_likes:
+                user_excludes = {user_id: library.liked_item_ids(user_id) for user_id in request.user_ids}
+        results, not_found = await service.recommend_batch(
+            request.user_ids, request.n, request.filter_liked, filters, user_excludes)
+        return Response(content=batch_json(results, not_found), media_type="application/json")
+    except Overloaded as e:
+        raise _overloaded(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
+
+
 @app.get("/similar/{track_id}", response_model=SimilarTracksResponse, tags=["Recommendations"])
 async def similar_tracks(
     track_id: int,
@@ -267,12 +384,16 @@ async def similar_tracks(
     if not service.is_loaded:
         raise HTTPException(status_code=503, detail="Modèle non chargé")
 
+    key, version = ("similar", track_id, n), service.snapshot_version
+    cached = _from_cache(key)
+    if cached is not None:
+        return cached
+
     try:
-        similar = await service.similar_tracks(track_id, n)
-        return SimilarTracksResponse(
-            track_id=track_id,
-            similar_tracks=[TrackRecommendation(**t) for t in similar]
-        )
+        item_ids, scores = await service.similar_arrays(track_id, n)
+        return _cache_response(version, key, similar_json(track_id, service.tracks, item_ids, scores))
+    except Overloaded as e:
+        raise _overloaded(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
@@ -291,12 +412,16 @@ async def user_history(
     if not service.is_loaded:
         raise HTTPException(status_code=503, detail="Modèle non chargé")
 
+    key, version = ("history", user_id, n), service.snapshot_version
+    cached = _from_cache(key)
+    if cached is not None:
+        return cached
+
     try:
-        history = await service.get_user_history(user_id, n)
-        return HistoryResponse(
-            user_id=user_id,
-            history=[HistoryItem(**h) for h in history]
-        )
+        item_ids, values = await service.history_arrays(user_id, n)
+        return _cache_response(version, key, history_json(user_id, service.tracks, item_ids, values))
+    except Overloaded as e:
+        raise _overloaded(e)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
@@ -316,6 +441,42 @@ async def reload_model():
         raise HTTPException(status_code=500, detail=f"Erreur au rechargement: {str(e)}")
 
 
+# ---------------------------------------------------------------------------
+# Export en masse
+# ---------------------------------------------------------------------------
+
+@app.get("/export/recommendations", tags=["Export"])
+async def export_recommendations(
+    format: str = Query(default="ndjson", pattern="^(ndjson|arrow)$", description="ndjson ou arrow (flux IPC)"),
+    n: int = Query(default=10, ge=1, le=100, description="Nombre de recommandations par utilisateur"),
+    block_size: int = Query(default=EXPORT_BLOCK_SIZE, ge=1, le=10000, description="Utilisateurs par bloc"),
+    filter_liked: bool = Query(default=True, description="Exclure les tracks déjà écoutés")
+):
+    """
+    Exporte en flux le top-N de tous les utilisateurs du snapshot courant.
+
+    Les utilisateurs sont calculés par blocs et chaque bloc est envoyé dès
+    qu'il est prêt: le résultat complet n'est jamais construit en mémoire.
+    Pour un export hors ligne (pool de process), voir src/export_recommendations.py.
+    """
+    if not service.is_loaded:
+        raise HTTPException(status_code=503, detail="Modèle non chargé")
+
+    try:
+        stream = service.export_stream(format, n, block_size, filter_liked)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    extension = "arrows" if format == "arrow" else "ndjson"
+    return StreamingResponse(
+        stream,
+        media_type=MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="recommendations.{extension}"',
+            "X-Model-Snapshot": service.snapshot_version or "",
+        },
+    )
+
+
 # ---------------------------------------------------------------------------
 # Catalogue de tracks
 # ---------------------------------------------------------------------------
@@ -390,6 +551,13 @@ class PlaylistCreate(BaseModel):
     name: str
 
 
+class PlaylistRecommendationResponse(BaseModel):
+    """Recommandations pour une playlist."""
+    playlist_id: str = Field(..., description="ID de la playlist")
+    mode: str = Field(..., description="Agrégation des titres graines")
+    recommendations: List[TrackRecommendation] = Field(..., description="Titres recommandés")
+
+
 class PlaylistRename(BaseModel):
     name: str
 
@@ -436,6 +604,44 @@ async def get_playlist(user_id: str, playlist_id: str):
     return pl
 
 
+@app.get("/library/{user_id}/playlists/{playlist_id}/recommend",
+         response_model=PlaylistRecommendationResponse, tags=["Library"])
+async def recommend_for_playlist(
+    user_id: str,
+    playlist_id: str,
+    n: int = Query(default=10, ge=1, le=100, description="Nombre de recommandations"),
+    mode: str = Query(default="centroid", pattern="^(centroid|max|sum)$",
+                      description="centroid (vecteur moyen), max (meilleure graine) ou sum")
+):
+    """
+    Recommande des titres à partir de tous les titres d'une playlist.
+
+    - **n**: Nombre de recommandations (1-100)
+    - **mode**: Agrégation des similarités aux titres de la playlist
+
+    Les titres déjà présents dans la playlist sont exclus.
+    """
+    if not service.is_loaded:
+        raise HTTPException(status_code=503, detail="Modèle non chargé")
+    pl = await library.get_playlist(user_id, playlist_id)
+    if not pl:
+        raise HTTPException(status_code=404, detail="Playlist introuvable")
+    item_ids = [t["item_id"] for t in pl["tracks"]]
+    if not item_ids:
+        raise HTTPException(status_code=400, detail="Playlist vide")
+
+    try:
+        rec_ids, scores = await service.recommend_for_items_arrays(item_ids, n, item_ids, mode)
+        return Response(content=playlist_json(playlist_id, mode, service.tracks, rec_ids, scores),
+                        media_type="application/json")
+    except Overloaded as e:
+        raise _overloaded(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
+
+
 @app.patch("/library/{user_id}/playlists/{playlist_id}", tags=["Library"])
 async def rename_playlist(user_id: str, playlist_id: str, body: PlaylistRename):
     ok = await library.rename_playlist(user_id, playlist_id, body.name)
@@ -527,3 +733,7 @@ if STATIC_DIR.exists():
     @app.get("/player", include_in_schema=False)
     async def serve_frontend():
         return FileResponse(str(STATIC_DIR / "index.html"))
+
+
+# Instrumentation des routes (après leur déclaration)
+instrument_app(app)
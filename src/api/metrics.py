@@ -0,0 +1,308 @@
+"""
+Métriques opérationnelles de l'API, exposées au format texte Prometheus sur /metrics.
+
+Sans dépendance (pas de prometheus_client) et conçu pour le chemin chaud:
+- histogrammes à classes préallouées (bisect sur des bornes fixes, liste d'entiers)
+- pas de verrou à l'enregistrement: la boucle asyncio est mono-thread, et les
+  rares enregistrements depuis le pool de threads tolèrent une perte d'incrément
+  sous contention (compteurs approximatifs plutôt que contention sur le GIL)
+- séries créées une fois par combinaison de labels, puis réutilisées
+"""
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Bornes (secondes) adaptées aux requêtes HTTP et aux étapes internes
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[tuple, object] = {}
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: labels attendus {self.labelnames}, reçu {values}")
+            child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values: tuple, child) -> List[str]:
+        raise NotImplementedError
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    """Compteur monotone."""
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+
+class Gauge(_Metric):
+    """Valeur instantanée; `function` la calcule à la lecture (pas de coût à l'écriture)."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 function: Optional[Callable[[], Dict[tuple, float]]] = None):
+        self.function = function
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default.dec(amount)
+
+    def set(self, value: float):
+        self._default.set(value)
+
+    def render(self) -> List[str]:
+        if self.function is None:
+            return super().render()
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, value in self.function().items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}")
+        return lines
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_Metric):
+    """Histogramme à classes fixes (compteurs non cumulés, cumulés au rendu)."""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def _render_child(self, values, child):
+        lines, cumulative = [], 0
+        counts = list(child.counts)
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# ── HTTP ──────────────────────────────────────────────────────────────────
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "http_requests_total", "Requêtes HTTP traitées", ("method", "route", "status")))
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "Durée des requêtes HTTP", ("method", "route")))
+HTTP_IN_FLIGHT = REGISTRY.register(Gauge(
+    "http_requests_in_flight", "Requêtes HTTP en cours", ("route",)))
+
+# ── Étapes internes ───────────────────────────────────────────────────────
+STAGE_LATENCY = REGISTRY.register(Histogram(
+    "stage_duration_seconds", "Durée des étapes internes (résolution user, attente du pool, calcul, formatage, covers)",
+    ("stage",)))
+
+# ── Exécuteur de calcul ───────────────────────────────────────────────────
+COMPUTE_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "compute_queue_depth", "Calculs en attente d'un worker"))
+COMPUTE_ACTIVE = REGISTRY.register(Gauge(
+    "compute_active", "Calculs en cours d'exécution"))
+COMPUTE_REJECTED = REGISTRY.register(Counter(
+    "compute_rejected_total", "Requêtes refusées par le contrôle d'admission", ("reason",)))
+
+# ── Caches ────────────────────────────────────────────────────────────────
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "cache_requests_total", "Accès aux caches", ("cache", "result")))
+CACHE_SIZE = REGISTRY.register(Gauge(
+    "cache_size_bytes", "Taille des entrées en cache", ("cache",)))
+CACHE_ENTRIES = REGISTRY.register(Gauge(
+    "cache_entries", "Nombre d'entrées en cache", ("cache",)))
+CACHE_EVICTIONS = REGISTRY.register(Counter(
+    "cache_evictions_total", "Entrées évincées (LRU)", ("cache",)))
+
+
+def _hit_ratios() -> Dict[tuple, float]:
+    totals: Dict[str, List[float]] = {}
+    for (cache, result), child in list(CACHE_REQUESTS._children.items()):
+        hits_total = totals.setdefault(cache, [0.0, 0.0])
+        hits_total[1] += child.value
+        if result == "hit":
+            hits_total[0] += child.value
+    return {(cache, ): hits / total for cache, (hits, total) in totals.items() if total}
+
+
+REGISTRY.register(Gauge("cache_hit_ratio", "Taux de succès des caches", ("cache",), function=_hit_ratios))
+
+# ── Modèle ────────────────────────────────────────────────────────────────
+MODEL_SNAPSHOT = REGISTRY.register(Gauge(
+    "model_snapshot_info", "Version (hash) du modèle servi", ("version",)))
+MODEL_LOADED_AT = REGISTRY.register(Gauge(
+    "model_loaded_timestamp_seconds", "Horodatage du dernier chargement du modèle"))
+
+
+def stage(name: str) -> _HistogramChild:
+    """Histogramme d'une étape interne (à garder en variable sur le chemin chaud)."""
+    return STAGE_LATENCY.labels(name)
+
+
+def cache_access(cache: str, hit: bool, count: int = 1):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc(count)
+
+
+def set_model_snapshot(version: str):
+    MODEL_SNAPSHOT._children.clear()
+    MODEL_SNAPSHOT.labels(version).set(1)
+    MODEL_LOADED_AT.set(time.time())
+
+
+# ── Instrumentation ASGI par route ────────────────────────────────────────
+
+def instrument_route(app, route_path: str):
+    """
+    Enveloppe l'application ASGI d'une route: le template de route est connu
+    sans refaire le routage, et les séries sont résolues une fois par statut.
+    """
+    in_flight = HTTP_IN_FLIGHT.labels(route_path)
+    latency: Dict[str, _HistogramChild] = {}
+
+    async def instrumented(scope, receive, send):
+        if scope["type"] != "http":
+            return await app(scope, receive, send)
+        method = scope["method"]
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            in_flight.dec()
+            hist = latency.get(method)
+            if hist is None:
+                hist = latency[method] = HTTP_LATENCY.labels(method, route_path)
+            hist.observe(elapsed)
+            HTTP_REQUESTS.labels(method, route_path, str(status)).inc()
+
+    return instrumented
+
+
+def instrument_app(app):
+    """Instrumente toutes les routes API déjà déclarées sur l'application."""
+    from fastapi.routing import APIRoute
+
+    for route in app.routes:
+        if isinstance(route, APIRoute):
+            route.app = instrument_route(route.app, route.path)
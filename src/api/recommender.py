@@ -1,32 +1,81 @@
 """
 Service de recommandation pour l'API.
-Entièrement async : boto3 et calculs ALS exécutés dans un thread via asyncio.to_thread.
+Entièrement async : boto3 exécuté via asyncio.to_thread, calculs ALS dans
+l'exécuteur de calcul borné (voir executor.py).
 """
 import asyncio
+import hashlib
 import io
 import json
 import os
 from pathlib import Path
-from typing import List, Optional
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
 import boto3
+import numpy as np
 from scipy import sparse
 
 import sys
 sys.path.insert(0, str(Path(__file__).parent.parent))
 from models.als_model import ALSRecommender
 
+from .executor import ComputeExecutor, Overloaded
+from .export import EXPORT_BLOCK_SIZE, PADDING_SCORE, BlockEncoder, encode_block, user_blocks
+from .filters import FilterSpec, compile_filter
+from .metrics import cache_access, set_model_snapshot, stage
+from .topk_store import TopKStore, quantize_scores
+from .tracks import TrackTable
+from .user_index import UserIndex, load_or_build
+
+# Utilisateurs par appel à l'exécuteur pour /recommend/batch: un bloc occupe
+# un worker le temps d'un seul calcul matriciel, sans monopoliser le pool
+BATCH_BLOCK_SIZE = int(os.getenv("BATCH_BLOCK_SIZE", 256))
+
+
+def _combine(digests) -> str:
+    return hashlib.sha256(b"".join(d.digest() for d in digests)).hexdigest()[:12]
+
+
+def snapshot_version(model_bytes: bytes, matrix_bytes: bytes, mappings_bytes: Optional[bytes] = None) -> str:
+    """
+    Version du snapshot servi: modèle, matrice et mappings ensemble.
+
+    Changer un seul des fichiers (ex: nouvelle matrice avec le même modèle)
+    change la version: le cache de réponses est vidé et un store top-K
+    calculé sur l'ancien snapshot est ignoré.
+    """
+    parts = [model_bytes, matrix_bytes] + ([mappings_bytes] if mappings_bytes is not None else [])
+    return _combine(hashlib.sha256(part) for part in parts)
+
+
+def file_snapshot_version(model_path: Path, matrix_path: Path, mappings_path: Optional[Path] = None) -> str:
+    """snapshot_version de fichiers sur disque, lus par blocs (mappings ignorés s'ils sont absents)."""
+    paths = [model_path, matrix_path] + ([mappings_path] if mappings_path and mappings_path.exists() else [])
+    digests = []
+    for path in paths:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        digests.append(digest)
+    return _combine(digests)
+
 
 class RecommendationService:
     """Service singleton pour gérer les recommandations."""
 
     _instance: Optional["RecommendationService"] = None
 
-    def __init__(self):
+    def __init__(self, executor: Optional[ComputeExecutor] = None):
+        self.executor = executor or ComputeExecutor()
         self.model: Optional[ALSRecommender] = None
         self.user_item_matrix: Optional[sparse.csr_matrix] = None
-        self.user_name_to_id: dict = {}
+        self.users: Optional[UserIndex] = None
+        self.tracks: Optional[TrackTable] = None
+        self.topk: Optional[TopKStore] = None
+        self.snapshot_version: Optional[str] = None
         self.is_loaded: bool = False
+        self._stats: Optional[dict] = None
 
     @classmethod
     def get_instance(cls) -> "RecommendationService":
@@ -41,6 +90,7 @@ class RecommendationService:
         matrix_key: str = "processed/user_item_matrix.npz",
         mappings_key: str = "processed/mappings.json",
         region: str = "eu-north-1",
+        topk_key: Optional[str] = None,
     ):
         """Charge le modèle et les données directement depuis S3 (non-bloquant)."""
         print("Chargement depuis S3...")
@@ -54,16 +104,24 @@ class RecommendationService:
         print(f"  - Mappings: s3://{bucket}/{mappings_key}")
 
         # Désérialisation dans un thread (CPU-bound)
-        self.user_item_matrix, self.model, self.user_name_to_id = await asyncio.gather(
+        self.user_item_matrix, self.model, self.users = await asyncio.gather(
             asyncio.to_thread(lambda: sparse.load_npz(io.BytesIO(matrix_bytes))),
             asyncio.to_thread(lambda: ALSRecommender.load_from_bytes(model_bytes, None)),
-            asyncio.to_thread(lambda: json.loads(mappings_bytes).get("user_to_id", {})),
+            asyncio.to_thread(lambda: UserIndex.build(json.loads(mappings_bytes).get("user_to_id", {}))),
         )
         # Attacher la matrice au modèle
         self.model.user_item_matrix = self.user_item_matrix
         self.model.item_user_matrix = self.user_item_matrix.T.tocsr()
+        self.tracks = await asyncio.to_thread(
+            TrackTable.from_item_mapping, self.model.item_mapping, self.user_item_matrix.shape[1])
 
-        self.is_loaded = True
+        version = snapshot_version(model_bytes, matrix_bytes, mappings_bytes)
+        self.topk = None
+        if topk_key:
+            self.topk = await self._load_topk(
+                lambda: TopKStore.from_bytes(self._s3_read(bucket, topk_key, region)),
+                f"s3://{bucket}/{topk_key}", version)
+        self._loaded(version)
         print(f"Service chargé: {self.user_item_matrix.shape[0]:,} users, {self.user_item_matrix.shape[1]:,} items")
 
     async def load(
@@ -71,6 +129,7 @@ class RecommendationService:
         model_path: Path,
         matrix_path: Path,
         mappings_path: Optional[Path] = None,
+        topk_path: Optional[Path] = None,
     ):
         """Charge le modèle et les données depuis le disque (non-bloquant)."""
         print("Chargement du service de recommandation...")
@@ -79,17 +138,58 @@ class RecommendationService:
 
         self.user_item_matrix = await asyncio.to_thread(sparse.load_npz, str(matrix_path))
         self.model = await asyncio.to_thread(ALSRecommender.load, model_path, self.user_item_matrix)
+        version = await asyncio.to_thread(file_snapshot_version, model_path, matrix_path, mappings_path)
+        self.tracks = await asyncio.to_thread(
+            TrackTable.from_item_mapping, self.model.item_mapping, self.user_item_matrix.shape[1])
 
         if mappings_path and mappings_path.exists():
             print(f"  - Mappings: {mappings_path}")
-            def _read_mappings():
-                with open(mappings_path, "r", encoding="utf-8") as f:
-                    return json.load(f).get("user_to_id", {})
-            self.user_name_to_id = await asyncio.to_thread(_read_mappings)
+            self.users = await asyncio.to_thread(load_or_build, mappings_path)
+        else:
+            self.users = await asyncio.to_thread(
+                UserIndex.build, {name: uid for uid, name in self.model.user_mapping.items()})
 
-        self.is_loaded = True
+        self.topk = None
+        if topk_path and topk_path.exists():
+            self.topk = await self._load_topk(lambda: TopKStore.load(topk_path), str(topk_path), version)
+        self._loaded(version)
         print(f"Service chargé: {self.user_item_matrix.shape[0]:,} users, {self.user_item_matrix.shape[1]:,} items")
 
+    def _loaded(self, version: str):
+        """Fige les statistiques du snapshot chargé et publie sa version."""
+        # id → nom est servi par self.users: inutile de garder la copie du modèle
+        self.model.user_mapping = {}
+        n_users, n_items = self.user_item_matrix.shape
+        self._stats = {
+            "n_users": n_users,
+            "n_items": n_items,
+            "n_interactions": self.user_item_matrix.nnz,
+            "sparsity": 1 - (self.user_item_matrix.nnz / (n_users * n_items)),
+            "model_factors": self.model.factors,
+            "model_regularization": self.model.regularization,
+        }
+        # Parallélisme interne d'implicit (topk) borné comme les threads BLAS
+        if hasattr(self.model.model, "num_threads"):
+            self.model.model.num_threads = self.executor.blas_threads
+        self.snapshot_version = version
+        set_model_snapshot(version)
+        self.is_loaded = True
+        print(f"  - Snapshot: {version}")
+
+    @staticmethod
+    async def _load_topk(read, source: str, version: str) -> Optional[TopKStore]:
+        """Store top-K s'il correspond au snapshot chargé, sinon None (calcul à la volée)."""
+        try:
+            store = await asyncio.to_thread(read)
+        except Exception as e:
+            print(f"⚠️  Store top-K non chargé ({source}): {e}")
+            return None
+        if store.version != version:
+            print(f"⚠️  Store top-K ignoré: snapshot {store.version}, servi {version}")
+            return None
+        print(f"  - Top-K: {source} ({len(store):,} users, K={store.k})")
+        return store
+
     @staticmethod
     def _s3_read(bucket: str, key: str, region: str) -> bytes:
         s3 = boto3.client("s3", region_name=region)
@@ -111,71 +211,227 @@ class RecommendationService:
                 return uid
         except ValueError:
             pass
-        if user_identifier in self.user_name_to_id:
-            return self.user_name_to_id[user_identifier]
+        uid = self.users.get(user_identifier)
+        if uid is not None:
+            return uid
         raise ValueError(f"Utilisateur '{user_identifier}' non trouvé")
 
-    async def recommend(self, user_identifier: str | int, n: int = 10, filter_already_liked: bool = True) -> List[dict]:
+    def get_user_name(self, user_id: int) -> str:
         self._ensure_loaded()
-        user_id = self.get_user_id(user_identifier)
-        recommendations = await asyncio.to_thread(self.model.recommend, user_id, n, filter_already_liked)
-        return self._format_tracks(recommendations)
+        return self.users.name(user_id) or f"Unknown (ID: {user_id})"
 
-    async def similar_tracks(self, item_id: int, n: int = 10) -> List[dict]:
+    async def recommend_arrays(
+        self,
+        user_identifier: str | int,
+        n: int = 10,
+        filter_already_liked: bool = True,
+        filters: Optional[FilterSpec] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (item_ids, scores) recommandés: store top-K si possible, sinon calcul à la volée.
+        Avec des filtres, toujours calculé (masque appliqué avant la sélection du top-K).
+        """
         self._ensure_loaded()
-        similar = await asyncio.to_thread(self.model.similar_items, item_id, n)
-        return self._format_tracks(similar)
+        with stage("resolve_user").time():
+            user_id = self.get_user_id(user_identifier)
+        if filters is not None:
+            item_ids, scores = await self.executor.run(
+                "recommend_filtered", self._recommend_filtered, [user_id], n, filter_already_liked, filters, None)
+            kept = scores[0] > PADDING_SCORE
+            return item_ids[0][kept], self._store_precision(scores[0][kept])
+        store = self.topk
+        if store is not None and store.serves(n, filter_already_liked):
+            precomputed = store.get(user_id, n)
+            cache_access("topk", precomputed is not None)
+            if precomputed is not None:
+                return precomputed
+        item_ids, scores = await self.executor.run(
+            "recommend", self.model.recommend_arrays, [user_id], n, filter_already_liked)
+        kept = scores[0] > PADDING_SCORE
+        return item_ids[0][kept], self._store_precision(scores[0][kept])
 
-    async def get_user_history(self, user_identifier: str | int, n: int = 20) -> List[dict]:
+    def _store_precision(self, scores: np.ndarray) -> np.ndarray:
+        """
+        Scores calculés à la volée ramenés à la précision du store top-K quand
+        il est servi: un même utilisateur reçoit les mêmes scores, couvert ou non.
+        """
+        return scores if self.topk is None else quantize_scores(scores)
+
+    async def recommend_batch(
+        self,
+        user_identifiers: List[str],
+        n: int = 10,
+        filter_already_liked: bool = True,
+        filters: Optional[FilterSpec] = None,
+        user_excludes: Optional[Dict[str, List[int]]] = None
+    ) -> Tuple[List[Tuple[str, List[dict]]], List[str]]:
+        """
+        Recommandations de plusieurs utilisateurs, calculées par blocs.
+
+        Args:
+            filters: Filtres communs à tous les utilisateurs
+            user_excludes: Items exclus par identifiant (ex: titres likés)
+
+        Returns:
+            ([(identifiant, recommandations), ...], identifiants inconnus)
+        """
         self._ensure_loaded()
-        user_id = self.get_user_id(user_identifier)
+        resolved, not_found = [], []
+        with stage("resolve_user").time():
+            for identifier in user_identifiers:
+                try:
+                    resolved.append((identifier, self.get_user_id(identifier)))
+                except ValueError:
+                    not_found.append(identifier)
+
+        results = []
+        for start in range(0, len(resolved), BATCH_BLOCK_SIZE):
+            chunk = resolved[start:start + BATCH_BLOCK_SIZE]
+            user_ids = np.fromiter((uid for _, uid in chunk), dtype=np.int64, count=len(chunk))
+            if filters is None and not user_excludes:
+                item_ids, scores = await self._recommend_block(user_ids, n, filter_already_liked)
+            else:
+                excludes = [user_excludes.get(identifier, ()) for identifier, _ in chunk] if user_excludes else None
+                item_ids, scores = await self.executor.run(
+                    "recommend_filtered", self._recommend_filtered,
+                    user_ids, n, filter_already_liked, filters, excludes)
+            scores = self._store_precision(scores)
+            for (identifier, _), recommendations in zip(chunk, self._format_rows(item_ids, scores)):
+                results.append((identifier, recommendations))
+        return results, not_found
+
+    def _recommend_filtered(self, user_ids, n: int, filter_already_liked: bool,
+                            filters: Optional[FilterSpec], excludes: Optional[List]):
+        """Compile les filtres (postings de la table des tracks) puis calcule le bloc."""
+        compiled = compile_filter(filters, self.tracks, self.user_item_matrix.shape[1])
+        return self.model.recommend_filtered(
+            user_ids, n, filter_already_liked, compiled.allowed, excludes, compiled.groups, compiled.max_per_group)
+
+    async def _recommend_block(self, user_ids: np.ndarray, n: int, filter_already_liked: bool):
+        """Bloc (users × n): lignes du store top-K, calcul à la volée pour les autres."""
+        store = self.topk
+        if store is None or not store.serves(n, filter_already_liked):
+            return await self.executor.run(
+                "recommend_batch", self.model.recommend_arrays, user_ids, n, filter_already_liked)
+
+        rows = store.rows(user_ids)
+        covered = rows >= 0
+        n_covered = int(covered.sum())
+        cache_access("topk", True, n_covered)
+        cache_access("topk", False, len(user_ids) - n_covered)
+        item_ids = np.full((len(user_ids), n), -1, dtype=np.int32)
+        scores = np.full((len(user_ids), n), -np.inf, dtype=np.float32)
+        item_ids[covered] = store.items[rows[covered], :n]
+        scores[covered] = store.scores[rows[covered], :n]
+        if n_covered < len(user_ids):
+            live_items, live_scores = await self.executor.run(
+                "recommend_batch", self.model.recommend_arrays, user_ids[~covered], n, filter_already_liked)
+            item_ids[~covered, :live_items.shape[1]] = live_items
+            scores[~covered, :live_scores.shape[1]] = live_scores
+        return item_ids, scores
+
+    def export_stream(
+        self,
+        fmt: str = "ndjson",
+        n: int = 10,
+        block_size: int = EXPORT_BLOCK_SIZE,
+        filter_already_liked: bool = True
+    ) -> AsyncIterator[bytes]:
+        """
+        Flux d'export des recommandations de tous les utilisateurs.
+
+        Le snapshot courant est figé à l'appel: un /reload pendant l'export
+        n'en modifie pas le contenu. Chaque bloc est calculé et encodé dans
+        l'exécuteur; refusé par le contrôle d'admission, il est retenté après
+        Retry-After (l'export cède la place au trafic interactif).
+
+        Raises:
+            ValueError: si le format est inconnu
+        """
+        self._ensure_loaded()
+        model, n_users = self.model, self.user_item_matrix.shape[0]
+        encoder = BlockEncoder(fmt, self.users, self.tracks)
+        # Mêmes scores que /recommend: précision du store top-K s'il est servi
+        store_precision = self.topk is not None
+
+        async def _stream():
+            yield encoder.start()
+            for user_ids in user_blocks(n_users, block_size):
+                while True:
+                    try:
+                        chunk = await self.executor.run(
+                            "export_block", encode_block, encoder, model, user_ids, n,
+                            filter_already_liked, store_precision)
+                        break
+                    except Overloaded as e:
+                        await asyncio.sleep(e.retry_after)
+                yield chunk
+            yield encoder.finish()
+
+        return _stream()
+
+    async def similar_arrays(self, item_id: int, n: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """(item_ids, scores) des tracks similaires à item_id."""
+        self._ensure_loaded()
+        return await self.executor.run("similar", self.model.similar_items_arrays, item_id, n)
+
+    async def recommend_for_items_arrays(
+        self,
+        item_ids: List[int],
+        n: int = 10,
+        exclude: Optional[List[int]] = None,
+        mode: str = "centroid"
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (item_ids, scores) recommandés à partir de plusieurs items graines.
+        Les graines inconnues du modèle (catalogue plus récent) sont ignorées.
+
+        Raises:
+            ValueError: si aucune graine n'est connue du modèle, ou mode inconnu
+        """
+        self._ensure_loaded()
+        n_items = self.user_item_matrix.shape[1]
+        seeds = [item_id for item_id in item_ids if 0 <= item_id < n_items]
+        if not seeds:
+            raise ValueError("Aucun titre de la playlist n'est connu du modèle")
+        return await self.executor.run(
+            "recommend_for_items", self.model.recommend_for_items_arrays, seeds, n, exclude, mode)
+
+    async def history_arrays(self, user_identifier: str | int, n: int = 20) -> Tuple[np.ndarray, np.ndarray]:
+        """(item_ids, valeurs) des n items les plus écoutés par l'utilisateur."""
+        self._ensure_loaded()
+        with stage("resolve_user").time():
+            user_id = self.get_user_id(user_identifier)
 
         def _extract():
             row = self.user_item_matrix[user_id]
-            items = row.indices
-            values = row.data
-            sorted_idx = values.argsort()[::-1][:n]
-            return [(items[i], values[i]) for i in sorted_idx]
+            sorted_idx = row.data.argsort()[::-1][:n]
+            return row.indices[sorted_idx], row.data[sorted_idx]
 
-        pairs = await asyncio.to_thread(_extract)
-        results = []
-        for item_id, value in pairs:
-            track_info = self.model.get_track_name(item_id)
-            if " - " in track_info:
-                artist, track = track_info.split(" - ", 1)
-            else:
-                artist, track = "Unknown", track_info
-            results.append({
-                "track": track,
-                "artist": artist,
-                "confidence_score": round(float(value), 2),
-                "item_id": item_id,
-            })
-        return results
-
-    def _format_tracks(self, pairs: List[tuple]) -> List[dict]:
-        results = []
-        for item_id, score in pairs:
-            track_info = self.model.get_track_name(item_id)
-            if " - " in track_info:
-                artist, track = track_info.split(" - ", 1)
-            else:
-                artist, track = "Unknown", track_info
-            results.append({
-                "track": track,
-                "artist": artist,
-                "score": round(float(score), 4),
-                "item_id": item_id,
-            })
-        return results
+        return await self.executor.run("history", _extract)
+
+    def _format_rows(self, item_ids: np.ndarray, scores: np.ndarray) -> List[List[dict]]:
+        """Formate un bloc (users × n) avec un seul gather des noms; ignore le remplissage."""
+        with stage("format_tracks").time():
+            valid = scores > PADDING_SCORE
+            rows = item_ids[valid]
+            artists, titles = self.tracks.artist.take(rows), self.tracks.title.take(rows)
+            item_list, score_list = rows.tolist(), scores[valid].tolist()
+            formatted, position = [], 0
+            for count in valid.sum(axis=1).tolist():
+                formatted.append([
+                    {
+                        "track": titles[i],
+                        "artist": artists[i],
+                        "score": round(score_list[i], 4),
+                        "item_id": item_list[i],
+                    }
+                    for i in range(position, position + count)
+                ])
+                position += count
+            return formatted
 
     async def get_stats(self) -> dict:
+        """Statistiques calculées une fois au chargement du snapshot."""
         self._ensure_loaded()
-        return {
-            "n_users": self.user_item_matrix.shape[0],
-            "n_items": self.user_item_matrix.shape[1],
-            "n_interactions": self.user_item_matrix.nnz,
-            "sparsity": 1 - (self.user_item_matrix.nnz / (self.user_item_matrix.shape[0] * self.user_item_matrix.shape[1])),
-            "model_factors": self.model.factors,
-            "model_regularization": self.model.regularization,
-        }
+        return self._stats
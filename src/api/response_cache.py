@@ -0,0 +1,84 @@
+"""
+Cache LRU des réponses JSON déjà sérialisées (recommend, similar, history).
+
+Les réponses ne dépendent que du snapshot servi et des paramètres de la
+requête: les entrées sont stockées en octets, un succès évite le calcul, la
+validation pydantic et l'encodage JSON. Le cache est borné en octets et vidé
+automatiquement dès qu'une requête arrive pour une autre version du modèle.
+
+Utilisé uniquement depuis la boucle asyncio: pas de verrou.
+"""
+import os
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+from .metrics import CACHE_ENTRIES, CACHE_EVICTIONS, CACHE_SIZE, cache_access
+
+RESPONSE_CACHE_MB = float(os.getenv("RESPONSE_CACHE_MB", 64))
+
+# Surcoût approximatif d'une entrée (clé, nœud de l'OrderedDict, objet bytes)
+_ENTRY_OVERHEAD = 200
+
+
+class ResponseCache:
+    def __init__(self, max_bytes: int = int(RESPONSE_CACHE_MB * 1024 * 1024), name: str = "response"):
+        self.max_bytes = max_bytes
+        self.name = name
+        self.version: Optional[str] = None
+        self.size = 0
+        self._entries: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._size_gauge = CACHE_SIZE.labels(name)
+        self._entries_gauge = CACHE_ENTRIES.labels(name)
+        self._evictions = CACHE_EVICTIONS.labels(name)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _check_version(self, version: str):
+        if version != self.version:
+            self.clear()
+            self.version = version
+
+    def get(self, version: str, key: Hashable) -> Optional[bytes]:
+        """Réponse en cache pour `key` sur le snapshot `version`, None sinon."""
+        if not self.enabled:
+            return None
+        self._check_version(version)
+        body = self._entries.get(key)
+        cache_access(self.name, body is not None)
+        if body is not None:
+            self._entries.move_to_end(key)
+        return body
+
+    def put(self, version: str, key: Hashable, body: bytes):
+        """Ajoute une réponse, en évinçant les moins récemment utilisées au-delà du budget."""
+        # Réponse calculée pendant un /reload: le cache est déjà passé au nouveau snapshot
+        if version != self.version:
+            return
+        cost = len(body) + _ENTRY_OVERHEAD
+        # Une réponse plus grosse qu'un huitième du budget n'est pas mise en cache
+        if cost > self.max_bytes // 8:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous) + _ENTRY_OVERHEAD
+        self._entries[key] = body
+        self.size += cost
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted) + _ENTRY_OVERHEAD
+            self._evictions.inc()
+        self._publish()
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+        self._publish()
+
+    def _publish(self):
+        self._size_gauge.set(self.size)
+        self._entries_gauge.set(len(self._entries))
+
+    def __len__(self) -> int:
+        return len(self._entries)
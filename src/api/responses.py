@@ -0,0 +1,67 @@
+"""
+Encodage JSON direct des réponses chaudes (recommend, similar, history, batch, playlist).
+
+Les octets sont produits depuis les tableaux d'ids/scores et la table des
+tracks avec orjson, sans construire ni revalider de modèles pydantic. Le
+schéma OpenAPI reste celui des response_model déclarés sur les endpoints:
+les documents produits ici doivent garder les mêmes champs, dans le même
+ordre (TrackRecommendation, HistoryItem...).
+"""
+from typing import List, Tuple
+
+import numpy as np
+import orjson
+
+from .metrics import stage
+from .tracks import TrackTable
+
+
+def track_records(tracks: TrackTable, item_ids: np.ndarray, scores: np.ndarray,
+                  score_key: str = "score", decimals: int = 4) -> List[dict]:
+    """Dicts {track, artist, <score_key>, item_id} avec un seul gather des noms."""
+    artists, titles = tracks.artist.take(item_ids), tracks.title.take(item_ids)
+    # Arrondi vectorisé: pour des scores float32, x * 10**decimals est exact en
+    # float64, le résultat est donc identique à round(x, decimals) élément par élément
+    rounded = np.round(np.asarray(scores, dtype=np.float64), decimals).tolist()
+    return [
+        {"track": track, "artist": artist, score_key: score, "item_id": item_id}
+        for item_id, score, artist, track in zip(item_ids.tolist(), rounded, artists, titles)
+    ]
+
+
+def recommendation_json(user_id: str, tracks: TrackTable, item_ids: np.ndarray, scores: np.ndarray) -> bytes:
+    """Corps de RecommendationResponse."""
+    with stage("format_tracks").time():
+        return orjson.dumps({"user_id": user_id,
+                             "recommendations": track_records(tracks, item_ids, scores)})
+
+
+def similar_json(track_id: int, tracks: TrackTable, item_ids: np.ndarray, scores: np.ndarray) -> bytes:
+    """Corps de SimilarTracksResponse."""
+    with stage("format_tracks").time():
+        return orjson.dumps({"track_id": track_id,
+                             "similar_tracks": track_records(tracks, item_ids, scores)})
+
+
+def playlist_json(playlist_id: str, mode: str, tracks: TrackTable,
+                  item_ids: np.ndarray, scores: np.ndarray) -> bytes:
+    """Corps de PlaylistRecommendationResponse."""
+    with stage("format_tracks").time():
+        return orjson.dumps({"playlist_id": playlist_id, "mode": mode,
+                             "recommendations": track_records(tracks, item_ids, scores)})
+
+
+def history_json(user_id: str, tracks: TrackTable, item_ids: np.ndarray, values: np.ndarray) -> bytes:
+    """Corps de HistoryResponse."""
+    with stage("format_tracks").time():
+        return orjson.dumps({"user_id": user_id,
+                             "history": track_records(tracks, item_ids, values, "confidence_score", 2)})
+
+
+def batch_json(results: List[Tuple[str, List[dict]]], not_found: List[str]) -> bytes:
+    """Corps de BatchRecommendationResponse (recommandations déjà formatées par bloc)."""
+    return orjson.dumps({
+        "results": [{"user_id": user_id, "recommendations": recommendations}
+                    for user_id, recommendations in results],
+        "not_found": not_found,
+    })
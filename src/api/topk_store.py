@@ -0,0 +1,141 @@
+"""
+Top-K précalculé des utilisateurs les plus actifs (ou de tous), servi sans
+passer par le calcul ALS.
+
+Écrit par src/precompute_topk.py après l'entraînement, mappé en mémoire par
+le service. Le fichier porte la version du snapshot qui l'a produit (modèle,
+matrice et mappings): un store d'un autre snapshot est ignoré, et seules
+les requêtes compatibles (n ≤ K, même filtre des items déjà écoutés) sont
+servies par le store; les autres passent par le calcul à la volée. Tant qu'un store est servi, les scores
+calculés à la volée sont ramenés à sa précision (quantize_scores): une
+réponse ne dépend pas de la couverture de l'utilisateur par le store.
+
+Format (little-endian):
+  en-tête  MAGIC (8 octets), version (16 octets), k, n_users, n_rows, filter_liked (int64)
+  rows     int32[n_users]          ligne du store de l'utilisateur j (-1 si absent)
+  padding  jusqu'à un multiple de 8
+  items    int32[n_rows, k]        -1 en remplissage
+  scores   float16[n_rows, k]      -inf en remplissage
+"""
+import mmap
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+
+MAGIC = b"TOPK\x01\x00\x00\x00"
+HEADER = np.dtype([("magic", "S8"), ("version", "S16"), ("k", "<i8"), ("n_users", "<i8"),
+                   ("n_rows", "<i8"), ("filter_liked", "<i8")])
+
+
+def quantize_scores(scores: np.ndarray) -> np.ndarray:
+    """Scores ramenés à la précision du store (float16), en float32."""
+    return np.asarray(scores).astype(np.float16).astype(np.float32)
+
+
+def _layout(n_users: int, n_rows: int, k: int) -> Tuple[int, int, int]:
+    """Positions (items, scores, fin) des tableaux dans le fichier."""
+    pos = HEADER.itemsize + 4 * n_users
+    items = pos + (-pos % 8)
+    scores = items + 4 * n_rows * k
+    return items, scores, scores + 2 * n_rows * k
+
+
+class TopKStore:
+    def __init__(self, version: str, k: int, filter_liked: bool, rows_by_user: np.ndarray,
+                 items: np.ndarray, scores: np.ndarray, mapped: Optional[mmap.mmap] = None):
+        self.version = version
+        self.k = k
+        self.filter_liked = filter_liked
+        self.rows_by_user = rows_by_user
+        self.items = items
+        self.scores = scores
+        self._mmap = mapped
+
+    @classmethod
+    def create(cls, path: Path, version: str, k: int, filter_liked: bool,
+               user_ids: np.ndarray, n_users: int) -> "TopKStore":
+        """
+        Alloue un store vide sur disque pour `user_ids` (triés); les lignes
+        sont remplies bloc par bloc via fill() sans tout garder en mémoire.
+        """
+        rows_by_user = np.full(n_users, -1, dtype="<i4")
+        rows_by_user[user_ids] = np.arange(len(user_ids), dtype=np.int32)
+        header = np.zeros(1, dtype=HEADER)
+        header[0] = (MAGIC, version.encode("ascii"), k, n_users, len(user_ids), int(filter_liked))
+        items_at, scores_at, end = _layout(n_users, len(user_ids), k)
+        with open(path, "wb") as f:
+            f.write(header.tobytes())
+            f.write(rows_by_user.tobytes())
+            f.truncate(end)
+        shape = (len(user_ids), k)
+        items = np.memmap(path, dtype="<i4", mode="r+", offset=items_at, shape=shape)
+        scores = np.memmap(path, dtype="<f2", mode="r+", offset=scores_at, shape=shape)
+        return cls(version, k, filter_liked, rows_by_user, items, scores)
+
+    def fill(self, user_ids: np.ndarray, item_ids: np.ndarray, scores: np.ndarray, padding: float):
+        """Écrit les top-K d'un bloc; les colonnes de score ≤ padding sont marquées absentes."""
+        rows = self.rows_by_user[user_ids]
+        valid = scores > padding
+        self.items[rows] = np.where(valid, item_ids, -1)
+        self.scores[rows] = np.where(valid, scores, -np.inf).astype(np.float16)
+
+    def flush(self):
+        self.items.flush()
+        self.scores.flush()
+
+    @classmethod
+    def load(cls, path: Path) -> "TopKStore":
+        """Mappe un store en lecture seule (pages partagées entre workers)."""
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls._parse(mapped, str(path), mapped)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "TopKStore":
+        """Store lu en mémoire (ex: stream S3)."""
+        return cls._parse(data, "store S3")
+
+    @classmethod
+    def _parse(cls, buffer, source: str, mapped: Optional[mmap.mmap] = None) -> "TopKStore":
+        if len(buffer) < HEADER.itemsize or buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{source}: format de store top-K inconnu")
+        header = np.frombuffer(buffer, dtype=HEADER, count=1)[0]
+        k, n_users, n_rows = int(header["k"]), int(header["n_users"]), int(header["n_rows"])
+        items_at, scores_at, end = _layout(n_users, n_rows, k)
+        if len(buffer) < end:
+            raise ValueError(f"{source}: store top-K tronqué")
+        rows_by_user = np.frombuffer(buffer, dtype="<i4", count=n_users, offset=HEADER.itemsize)
+        items = np.frombuffer(buffer, dtype="<i4", count=n_rows * k, offset=items_at).reshape(n_rows, k)
+        scores = np.frombuffer(buffer, dtype="<f2", count=n_rows * k, offset=scores_at).reshape(n_rows, k)
+        return cls(header["version"].decode("ascii"), k, bool(header["filter_liked"]),
+                   rows_by_user, items, scores, mapped)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def serves(self, n: int, filter_liked: bool) -> bool:
+        """La requête (n, filtre) peut-elle être servie par ce store ?"""
+        return n <= self.k and filter_liked == self.filter_liked
+
+    def get(self, user_id: int, n: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """(item_ids, scores) des n premiers items de l'utilisateur, None s'il n'est pas couvert."""
+        if not 0 <= user_id < len(self.rows_by_user):
+            return None
+        row = int(self.rows_by_user[user_id])
+        if row < 0:
+            return None
+        items = self.items[row, :n]
+        kept = items >= 0
+        return items[kept], self.scores[row, :n][kept].astype(np.float32)
+
+    def rows(self, user_ids: np.ndarray) -> np.ndarray:
+        """Ligne du store de chaque utilisateur (-1 si non couvert)."""
+        rows = np.full(len(user_ids), -1, dtype=np.int32)
+        in_range = (user_ids >= 0) & (user_ids < len(self.rows_by_user))
+        rows[in_range] = self.rows_by_user[user_ids[in_range]]
+        return rows
+
+    @property
+    def nbytes(self) -> int:
+        return self.rows_by_user.nbytes + self.items.nbytes + self.scores.nbytes
@@ -0,0 +1,160 @@
+"""
+Table colonne des tracks, construite une fois par snapshot.
+
+Les noms (canonique, artiste, titre) sont stockés en chaînes UTF-8 concaténées
+indexées par offsets: le découpage "Artiste - Titre" est fait une seule fois
+au chargement, et la construction d'une réponse se réduit à un gather des
+offsets suivi du décodage des seules lignes demandées.
+"""
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+class StringColumn:
+    """Chaînes UTF-8 concaténées; la ligne i occupe data[offsets[i]:offsets[i + 1]]."""
+
+    def __init__(self, data: bytes, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings: Sequence[str]) -> "StringColumn":
+        encoded = [s.encode("utf-8") for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        return cls(b"".join(encoded), offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int) -> str:
+        return self.data[self.offsets[row]:self.offsets[row + 1]].decode("utf-8")
+
+    def take(self, rows: np.ndarray) -> List[str]:
+        """Chaînes des lignes demandées, dans l'ordre de `rows`."""
+        data = self.data
+        starts = self.offsets[rows].tolist()
+        ends = self.offsets[rows + 1].tolist()
+        return [data[s:e].decode("utf-8") for s, e in zip(starts, ends)]
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.data) + self.offsets.nbytes
+
+
+def split_track_name(name: str) -> tuple:
+    """'Artiste - Titre' → (artiste, titre); sans séparateur, l'artiste est 'Unknown'."""
+    if " - " in name:
+        artist, title = name.split(" - ", 1)
+        return artist.strip(), title.strip()
+    return "Unknown", name
+
+
+class TrackTable:
+    """
+    Colonnes canonical/artist/title et artist_id, indexées par ligne.
+
+    Pour le service de recommandation, ligne = item_id du modèle; pour le
+    catalogue, ligne = rang dans l'ordre d'affichage (voir CatalogService).
+    """
+
+    def __init__(self, canonical: StringColumn, artist: StringColumn, title: StringColumn,
+                 artist_id: np.ndarray, artist_names: StringColumn):
+        self.canonical = canonical
+        self.artist = artist
+        self.title = title
+        self.artist_id = artist_id
+        self.artist_names = artist_names
+        self._search_data: Optional[bytes] = None
+        self._search_starts: Optional[np.ndarray] = None
+        self._artist_lookup: Optional[Dict[str, List[int]]] = None
+        self._postings: Optional[np.ndarray] = None
+        self._postings_offsets: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_names(cls, names: Sequence[str]) -> "TrackTable":
+        parts = [split_track_name(name) for name in names]
+        artists = [artist for artist, _ in parts]
+        artist_names, artist_id = np.unique(np.asarray(artists, dtype=object), return_inverse=True) \
+            if artists else (np.empty(0, dtype=object), np.empty(0, dtype=np.int64))
+        return cls(
+            canonical=StringColumn.from_strings(names),
+            artist=StringColumn.from_strings(artists),
+            title=StringColumn.from_strings([title for _, title in parts]),
+            artist_id=artist_id.astype(np.int32),
+            artist_names=StringColumn.from_strings(artist_names.tolist()),
+        )
+
+    @classmethod
+    def from_item_mapping(cls, item_mapping: Dict[int, str], n_items: int) -> "TrackTable":
+        """Table indexée par item_id; les ids sans nom gardent le libellé de get_track_name."""
+        n_rows = max(n_items, max(item_mapping, default=-1) + 1)
+        names = [item_mapping.get(i, f"Unknown (ID: {i})") for i in range(n_rows)]
+        return cls.from_names(names)
+
+    def __len__(self) -> int:
+        return len(self.canonical)
+
+    @property
+    def nbytes(self) -> int:
+        return (self.canonical.nbytes + self.artist.nbytes + self.title.nbytes
+                + self.artist_id.nbytes + self.artist_names.nbytes)
+
+    def build_search_index(self):
+        """Buffer unique des noms canoniques en minuscules, séparés par NUL."""
+        lowered = [self.canonical[i].lower().encode("utf-8") for i in range(len(self))]
+        starts = np.zeros(len(lowered), dtype=np.int64)
+        if lowered:
+            np.cumsum([len(b) + 1 for b in lowered[:-1]], out=starts[1:])
+        self._search_data = b"\x00".join(lowered)
+        self._search_starts = starts
+
+    def search(self, query: str, limit: int) -> List[int]:
+        """
+        Premières lignes (dans l'ordre de la table) dont le nom canonique
+        contient `query`, sans tenir compte de la casse.
+
+        Un seul balayage (bytes.find) du buffer de build_search_index,
+        construit au premier appel s'il ne l'a pas été au chargement.
+        """
+        q = query.lower()
+        if not q or "\x00" in q:
+            return []
+        if self._search_data is None:
+            self.build_search_index()
+
+        needle = q.encode("utf-8")
+        data, starts = self._search_data, self._search_starts
+        found: List[int] = []
+        pos = data.find(needle)
+        while pos != -1 and len(found) < limit:
+            row = int(np.searchsorted(starts, pos, side="right")) - 1
+            found.append(row)
+            # Ligne suivante: une ligne n'est retournée qu'une fois
+            next_start = starts[row + 1] if row + 1 < len(starts) else len(data)
+            pos = data.find(needle, next_start)
+        return found
+
+    def artist_ids(self, names: Sequence[str]) -> List[int]:
+        """Ids des artistes nommés (sans tenir compte de la casse); les noms inconnus sont ignorés."""
+        if self._artist_lookup is None:
+            lookup: Dict[str, List[int]] = {}
+            for artist_id in range(len(self.artist_names)):
+                lookup.setdefault(self.artist_names[artist_id].lower(), []).append(artist_id)
+            self._artist_lookup = lookup
+        return [artist_id for name in names for artist_id in self._artist_lookup.get(name.strip().lower(), [])]
+
+    def artist_rows(self, artist_ids: Sequence[int]) -> np.ndarray:
+        """
+        Lignes des artistes demandés, via des listes de postings artiste → lignes
+        (construites au premier appel: un tri stable de artist_id).
+        """
+        if self._postings is None:
+            self._postings = np.argsort(self.artist_id, kind="stable")
+            offsets = np.zeros(len(self.artist_names) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.artist_id, minlength=len(self.artist_names)), out=offsets[1:])
+            self._postings_offsets = offsets
+        offsets = self._postings_offsets
+        parts = [self._postings[offsets[a]:offsets[a + 1]] for a in artist_ids]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
@@ -0,0 +1,151 @@
+"""
+Index compact et en lecture seule des noms d'utilisateurs.
+
+Remplace le dict {nom: id} de mappings.json (et la copie inverse
+ALSRecommender.user_mapping): les noms, triés par octets UTF-8, sont
+concaténés dans un seul buffer indexé par offsets.
+- nom → id: recherche dichotomique dans le buffer
+- id → nom: tableau rows_by_id vers la ligne triée
+
+Le fichier (user_index.bin) se mappe en mémoire: plusieurs workers partagent
+les mêmes pages au lieu d'avoir chacun leur dict.
+
+Format (little-endian):
+  en-tête  MAGIC (8 octets), n_names, n_ids, data_len (int64)
+  offsets  int64[n_names + 1]
+  ids      int32[n_names]      id de la ligne triée i
+  rows     int32[n_ids]        ligne triée de l'id j (-1 si absent)
+  padding  jusqu'à un multiple de 8
+  data     noms UTF-8 concaténés
+"""
+import json
+import mmap
+import os
+from bisect import bisect_left
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+MAGIC = b"UIDX\x01\x00\x00\x00"
+HEADER = np.dtype([("magic", "S8"), ("n_names", "<i8"), ("n_ids", "<i8"), ("data_len", "<i8")])
+
+
+class _SortedNames:
+    """Vue séquence des noms triés (en octets), pour bisect."""
+
+    def __init__(self, buffer, offsets: np.ndarray, base: int = 0):
+        self.buffer = buffer
+        # memoryview: l'indexation renvoie des int Python, sans scalaire numpy
+        self.offsets = memoryview(np.ascontiguousarray(offsets, dtype=np.int64)).cast("B").cast("q")
+        self.base = base
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int) -> bytes:
+        # bytes et mmap renvoient tous deux des bytes au découpage
+        return self.buffer[self.base + self.offsets[row]:self.base + self.offsets[row + 1]]
+
+
+class UserIndex:
+    def __init__(self, data, offsets: np.ndarray, ids: np.ndarray, rows_by_id: np.ndarray,
+                 mapped: Optional[mmap.mmap] = None, data_offset: int = 0):
+        self.data = data
+        self.offsets = offsets
+        self.ids = ids
+        self.rows_by_id = rows_by_id
+        self._names = _SortedNames(mapped if mapped is not None else data, offsets, data_offset)
+        self._mmap = mapped
+
+    @classmethod
+    def build(cls, user_to_id: Dict[str, int]) -> "UserIndex":
+        """Construit l'index en mémoire depuis {nom: id}."""
+        encoded = sorted((name.encode("utf-8"), uid) for name, uid in user_to_id.items())
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(name) for name, _ in encoded], out=offsets[1:])
+        ids = np.fromiter((uid for _, uid in encoded), dtype=np.int32, count=len(encoded))
+        rows_by_id = np.full(int(ids.max()) + 1 if len(ids) else 0, -1, dtype=np.int32)
+        rows_by_id[ids] = np.arange(len(ids), dtype=np.int32)
+        return cls(b"".join(name for name, _ in encoded), offsets, ids, rows_by_id)
+
+    def save(self, path: Path):
+        """Écrit l'index (fichier temporaire puis renommage)."""
+        header = np.zeros(1, dtype=HEADER)
+        header[0] = (MAGIC, len(self.ids), len(self.rows_by_id), len(self.data))
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(header.tobytes())
+            f.write(self.offsets.astype("<i8").tobytes())
+            f.write(self.ids.astype("<i4").tobytes())
+            f.write(self.rows_by_id.astype("<i4").tobytes())
+            f.write(b"\x00" * (-f.tell() % 8))
+            f.write(bytes(self.data))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "UserIndex":
+        """Mappe un index écrit par save() (lecture seule, pages partagées entre process)."""
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = np.frombuffer(mapped, dtype=HEADER, count=1)[0]
+        if mapped[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path}: format d'index utilisateurs inconnu")
+        n_names, n_ids = int(header["n_names"]), int(header["n_ids"])
+        pos = HEADER.itemsize
+        offsets = np.frombuffer(mapped, dtype="<i8", count=n_names + 1, offset=pos)
+        pos += offsets.nbytes
+        ids = np.frombuffer(mapped, dtype="<i4", count=n_names, offset=pos)
+        pos += ids.nbytes
+        rows_by_id = np.frombuffer(mapped, dtype="<i4", count=n_ids, offset=pos)
+        pos += rows_by_id.nbytes
+        pos += -pos % 8
+        data = memoryview(mapped)[pos:pos + int(header["data_len"])]
+        return cls(data, offsets, ids, rows_by_id, mapped, pos)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def get(self, name: str) -> Optional[int]:
+        """Id de l'utilisateur `name`, None s'il est inconnu."""
+        key = name.encode("utf-8")
+        row = bisect_left(self._names, key)
+        if row < len(self._names) and self._names[row] == key:
+            return int(self.ids[row])
+        return None
+
+    def __contains__(self, name: str) -> bool:
+        return self.get(name) is not None
+
+    def name(self, user_id: int) -> Optional[str]:
+        """Nom de l'utilisateur `user_id`, None s'il est inconnu."""
+        if not 0 <= user_id < len(self.rows_by_id):
+            return None
+        row = int(self.rows_by_id[user_id])
+        return self._names[row].decode("utf-8") if row >= 0 else None
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.data) + self.offsets.nbytes + self.ids.nbytes + self.rows_by_id.nbytes
+
+
+def load_or_build(mappings_path: Path, index_path: Optional[Path] = None) -> UserIndex:
+    """
+    Index de mappings.json: mappé depuis user_index.bin s'il est à jour,
+    sinon construit depuis le JSON puis écrit à côté (si le dossier est inscriptible).
+    """
+    index_path = index_path or mappings_path.with_name("user_index.bin")
+    if index_path.exists() and index_path.stat().st_mtime >= mappings_path.stat().st_mtime:
+        try:
+            return UserIndex.load(index_path)
+        except ValueError as e:
+            print(f"⚠️  {e}, reconstruction")
+
+    with open(mappings_path, "r", encoding="utf-8") as f:
+        index = UserIndex.build(json.load(f).get("user_to_id", {}))
+    try:
+        index.save(index_path)
+        return UserIndex.load(index_path)
+    except OSError as e:
+        print(f"⚠️  Index utilisateurs non écrit ({e}), conservé en mémoire")
+        return index
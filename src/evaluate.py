@@ -2,18 +2,29 @@
 """
 Script d'évaluation du modèle de recommandation.
 Calcule les métriques: Precision@K, Recall@K, NDCG@K, Coverage, Novelty.
+
+Deux protocoles:
+- split aléatoire (train_matrix.npz / test_matrix.npz de build_matrix.py)
+- split temporel (--temporal-split YYYY-MM): entraînement sur les mois
+  antérieurs, test sur les nouvelles interactions à partir de ce mois, lues
+  directement dans le dataset partitionné listens.parquet
 """
 import argparse
 import json
+import sys
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
+import pandas as pd
 from scipy import sparse
 from tqdm import tqdm
 
 from models.als_model import ALSRecommender
 
+SCRIPTS_DIR = Path(__file__).parent.parent / "scripts"
+sys.path.insert(0, str(SCRIPTS_DIR))
+
 # Configuration
 DATA_DIR = Path(__file__).parent.parent / "data" / "processed"
 MODELS_DIR = Path(__file__).parent.parent / "models"
@@ -82,6 +93,51 @@ def average_precision(recommended: List[int], relevant: set) -> float:
     return score / len(relevant) if relevant else 0.0
 
 
+def create_temporal_split(
+    listens_path: Path,
+    split_month: str,
+    shape: Tuple[int, int],
+    confidence_scaling: float = 40.0,
+    start_month: Optional[str] = None,
+    end_month: Optional[str] = None
+) -> Tuple[sparse.csr_matrix, sparse.csr_matrix]:
+    """
+    Split temporel: train = mois [start_month, split_month[, test = mois
+    [split_month, end_month]. Seules les partitions de chaque côté sont lues.
+
+    Le test ne garde que les paires (user, track) absentes du train: les
+    réécoutes sont filtrées par recommend(filter_already_liked=True) et ne
+    peuvent pas être retrouvées.
+
+    Args:
+        listens_path: Dataset listens.parquet (partitionné par mois)
+        split_month: Premier mois du test ('YYYY-MM')
+        shape: Dimensions des matrices (celles de la matrice complète)
+        confidence_scaling: Facteur alpha des confidences
+        start_month: Premier mois du train (None = depuis le début)
+        end_month: Dernier mois du test, inclus (None = jusqu'à la fin)
+
+    Returns:
+        (train_matrix, test_matrix)
+    """
+    from build_matrix import confidence_matrix, load_play_counts
+
+    last_train_month = (pd.Period(split_month, freq='M') - 1).strftime('%Y-%m')
+    print(f"\nSplit temporel: train {start_month or 'début'} → {last_train_month} | test {split_month} → {end_month or 'fin'}")
+
+    train = confidence_matrix(load_play_counts(listens_path, start_month, last_train_month),
+                              shape, confidence_scaling)
+    test = confidence_matrix(load_play_counts(listens_path, split_month, end_month),
+                             shape, confidence_scaling)
+
+    test = (test - test.multiply(train > 0)).tocsr()
+    test.eliminate_zeros()
+
+    print(f"Train: {train.nnz:,} interactions")
+    print(f"Test: {test.nnz:,} nouvelles interactions")
+    return train, test
+
+
 def evaluate_model(
     model: ALSRecommender,
     train_matrix: sparse.csr_matrix,
@@ -235,6 +291,12 @@ def main():
                        help="Nombre d'utilisateurs à évaluer")
     parser.add_argument("--output", type=Path,
                        help="Fichier JSON pour sauvegarder les résultats")
+    parser.add_argument("--temporal-split", metavar="YYYY-MM",
+                       help="Split temporel: test à partir de ce mois (au lieu de --train/--test)")
+    parser.add_argument("--listens", type=Path, default=DATA_DIR / "listens.parquet",
+                       help="Dataset des écoutes agrégées (split temporel)")
+    parser.add_argument("--alpha", type=float, default=40.0,
+                       help="Facteur de scaling des confidences (split temporel)")
 
     args = parser.parse_args()
 
@@ -243,10 +305,21 @@ def main():
     full_matrix = sparse.load_npz(args.full_matrix)
     model = ALSRecommender.load(args.model, user_item_matrix=full_matrix)
 
-    # Charger les matrices train/test
-    print(f"Chargement des matrices train/test...")
-    train_matrix = sparse.load_npz(args.train)
-    test_matrix = sparse.load_npz(args.test)
+    if args.temporal_split:
+        train_matrix, test_matrix = create_temporal_split(
+            args.listens, args.temporal_split, full_matrix.shape, args.alpha
+        )
+        # Le modèle chargé a vu le futur: réentraîné sur le train seul, mêmes hyperparamètres
+        model = ALSRecommender(
+            factors=model.factors,
+            regularization=model.regularization,
+            iterations=model.iterations
+        ).fit(train_matrix)
+    else:
+        # Charger les matrices train/test
+        print(f"Chargement des matrices train/test...")
+        train_matrix = sparse.load_npz(args.train)
+        test_matrix = sparse.load_npz(args.test)
 
     print(f"Train: {train_matrix.nnz:,} interactions")
     print(f"Test: {test_matrix.nnz:,} interactions")
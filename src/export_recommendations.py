@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Export hors ligne du top-N de tous les utilisateurs (NDJSON ou Arrow IPC).
+
+Les utilisateurs sont découpés en blocs répartis sur un pool de process:
+chaque worker charge le modèle une fois, calcule et encode ses blocs; le
+process principal écrit les blocs dans l'ordre dès qu'ils arrivent. Le
+nombre de blocs en vol est borné: la mémoire ne dépend pas du nombre
+d'utilisateurs. Le fichier est écrit en .tmp puis renommé.
+
+Si l'API sert un store top-K de ce snapshot (--topk), les scores sont
+ramenés à sa précision, comme dans les réponses de /recommend.
+"""
+import argparse
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from scipy import sparse
+from threadpoolctl import threadpool_limits
+from tqdm import tqdm
+
+from api.export import EXPORT_BLOCK_SIZE, EXPORT_FORMATS, BlockEncoder, recommend_block, user_blocks
+from api.recommender import file_snapshot_version
+from api.topk_store import TopKStore
+from api.tracks import TrackTable
+from api.user_index import UserIndex, load_or_build
+from models.als_model import ALSRecommender
+
+# Configuration par défaut
+DATA_DIR = Path(__file__).parent.parent / "data" / "processed"
+MODELS_DIR = Path(__file__).parent.parent / "models"
+
+DEFAULT_MODEL = MODELS_DIR / "als_model.pkl"
+DEFAULT_MATRIX = DATA_DIR / "user_item_matrix.npz"
+DEFAULT_MAPPINGS = DATA_DIR / "mappings.json"
+DEFAULT_TOPK = MODELS_DIR / "topk.bin"
+
+# État de chaque worker (initialisé une fois par process)
+_worker: dict = {}
+
+
+def _load_encoder(fmt: str, model: ALSRecommender, n_items: int, mappings_path: Optional[Path]) -> BlockEncoder:
+    if mappings_path and mappings_path.exists():
+        users = load_or_build(mappings_path)
+    else:
+        users = UserIndex.build({name: uid for uid, name in model.user_mapping.items()})
+    return BlockEncoder(fmt, users, TrackTable.from_item_mapping(model.item_mapping, n_items))
+
+
+def _serves_topk(topk_path: Optional[Path], model_path: Path, matrix_path: Path,
+                 mappings_path: Optional[Path]) -> bool:
+    """Le store top-K serait-il servi par l'API pour ce snapshot ?"""
+    if not topk_path or not topk_path.exists():
+        return False
+    return TopKStore.load(topk_path).version == file_snapshot_version(model_path, matrix_path, mappings_path)
+
+
+def _init_worker(model_path: Path, matrix_path: Path, mappings_path: Optional[Path],
+                 fmt: str, n: int, filter_already_liked: bool, store_precision: bool):
+    # Un thread BLAS/OpenMP par worker: le parallélisme vient du pool
+    threadpool_limits(limits=1)
+    matrix = sparse.load_npz(matrix_path)
+    model = ALSRecommender.load(model_path, matrix)
+    if hasattr(model.model, "num_threads"):
+        model.model.num_threads = 1
+    _worker.update(
+        model=model,
+        encoder=_load_encoder(fmt, model, matrix.shape[1], mappings_path),
+        n=n,
+        filter_already_liked=filter_already_liked,
+        store_precision=store_precision,
+    )
+
+
+def _export_block(user_ids: np.ndarray):
+    """NDJSON encodé, ou RecordBatch Arrow (le flux IPC est écrit par le process principal)."""
+    encoder = _worker["encoder"]
+    block = recommend_block(_worker["model"], user_ids, _worker["n"], _worker["filter_already_liked"],
+                            _worker["store_precision"])
+    return encoder.ndjson(block) if encoder.fmt == "ndjson" else encoder.record_batch(block)
+
+
+def export_recommendations(
+    output_path: Path,
+    fmt: Optional[str] = None,
+    model_path: Path = DEFAULT_MODEL,
+    matrix_path: Path = DEFAULT_MATRIX,
+    mappings_path: Optional[Path] = DEFAULT_MAPPINGS,
+    n: int = 10,
+    block_size: int = EXPORT_BLOCK_SIZE,
+    workers: int = os.cpu_count() or 1,
+    filter_already_liked: bool = True,
+    topk_path: Optional[Path] = DEFAULT_TOPK
+) -> int:
+    """
+    Exporte les recommandations de tous les utilisateurs.
+
+    Args:
+        output_path: Fichier de sortie
+        fmt: ndjson ou arrow (déduit de l'extension si None)
+        model_path: Modèle ALS (.pkl)
+        matrix_path: Matrice user-item (.npz)
+        mappings_path: mappings.json (noms d'utilisateurs), optionnel
+        n: Nombre de recommandations par utilisateur
+        block_size: Utilisateurs par bloc
+        workers: Nombre de process
+        filter_already_liked: Exclure les items déjà consommés
+        topk_path: Store top-K servi par l'API (précision des scores), optionnel
+
+    Returns:
+        Nombre d'utilisateurs exportés
+    """
+    fmt = fmt or ("arrow" if output_path.suffix in (".arrow", ".arrows") else "ndjson")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Format d'export inconnu: {fmt} (attendu: {', '.join(EXPORT_FORMATS)})")
+
+    print("=" * 60)
+    print("EXPORT DES RECOMMANDATIONS")
+    print("=" * 60)
+
+    # Le process principal n'a besoin que des noms et de la taille de la matrice
+    n_users, n_items = (int(x) for x in np.load(matrix_path)["shape"])
+    model = ALSRecommender.load(model_path)
+    encoder = _load_encoder(fmt, model, n_items, mappings_path)
+    del model
+
+    print(f"Utilisateurs: {n_users:,} | top-{n} | blocs de {block_size} | {workers} workers | format {fmt}")
+    print(f"Sortie: {output_path}")
+    store_precision = _serves_topk(topk_path, model_path, matrix_path, mappings_path)
+    if store_precision:
+        print(f"Scores à la précision du store top-K: {topk_path}")
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    max_in_flight = 2 * workers
+    start = time.time()
+
+    # spawn: pas de fork d'un process dont les pools OpenMP sont déjà initialisés
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(model_path, matrix_path, mappings_path, fmt, n, filter_already_liked, store_precision),
+    ) as pool, open(tmp_path, "wb") as f, tqdm(total=n_users, desc="Export", unit="user") as progress:
+        f.write(encoder.start())
+        in_flight = deque()
+
+        def _write_oldest():
+            # Écriture dans l'ordre des blocs: on attend le plus ancien
+            count, future = in_flight.popleft()
+            payload = future.result()
+            f.write(payload if isinstance(payload, bytes) else encoder.write_batch(payload))
+            progress.update(count)
+
+        for user_ids in user_blocks(n_users, block_size):
+            in_flight.append((len(user_ids), pool.submit(_export_block, user_ids)))
+            if len(in_flight) >= max_in_flight:
+                _write_oldest()
+        while in_flight:
+            _write_oldest()
+        f.write(encoder.finish())
+    os.replace(tmp_path, output_path)
+
+    elapsed = time.time() - start
+    size_mb = output_path.stat().st_size / 1024 / 1024
+    print(f"\n✅ {n_users:,} utilisateurs exportés en {elapsed:.1f}s "
+          f"({n_users / max(elapsed, 1e-9):,.0f} users/s, {size_mb:.1f} MB)")
+    return n_users
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporter le top-N de tous les utilisateurs")
+    parser.add_argument("output", type=Path,
+                       help="Fichier de sortie (.ndjson, .arrow)")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default=None,
+                       help="Format (déduit de l'extension par défaut)")
+    parser.add_argument("--model", type=Path, default=DEFAULT_MODEL,
+                       help="Modèle ALS (.pkl)")
+    parser.add_argument("--matrix", type=Path, default=DEFAULT_MATRIX,
+                       help="Matrice user-item (.npz)")
+    parser.add_argument("--mappings", type=Path, default=DEFAULT_MAPPINGS,
+                       help="Mappings (.json) pour les noms d'utilisateurs")
+    parser.add_argument("--n", type=int, default=10,
+                       help="Nombre de recommandations par utilisateur")
+    parser.add_argument("--block-size", type=int, default=EXPORT_BLOCK_SIZE,
+                       help="Utilisateurs par bloc")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                       help="Nombre de process")
+    parser.add_argument("--keep-liked", action="store_true",
+                       help="Ne pas exclure les items déjà écoutés")
+    parser.add_argument("--topk", type=Path, default=DEFAULT_TOPK,
+                       help="Store top-K servi par l'API (scores exportés à sa précision)")
+
+    args = parser.parse_args()
+
+    export_recommendations(
+        output_path=args.output,
+        fmt=args.format,
+        model_path=args.model,
+        matrix_path=args.matrix,
+        mappings_path=args.mappings,
+        n=args.n,
+        block_size=args.block_size,
+        workers=args.workers,
+        filter_already_liked=not args.keep_liked,
+        topk_path=args.topk
+    )
+
+
+if __name__ == "__main__":
+    main()
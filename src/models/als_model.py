@@ -12,6 +12,15 @@ from scipy import sparse
 from implicit.als import AlternatingLeastSquares
 from implicit.evaluation import precision_at_k, mean_average_precision_at_k
 
+# Agrégation des similarités de plusieurs items graines (recommend_for_items)
+SEED_AGGREGATIONS = ("centroid", "max", "sum")
+
+# Score de remplissage des recommandations (même convention qu'implicit)
+PADDING_SCORE = np.finfo(np.float32).min
+
+# Taille max (users × items) d'un bloc de scores de recommend_filtered (64 Mo en float32)
+_SCORE_BLOCK_CELLS = 1 << 24
+
 
 class ALSRecommender:
     """
@@ -61,6 +70,7 @@ class ALSRecommender:
         self.user_mapping: dict = {}
         self.item_mapping: dict = {}
         self.is_fitted: bool = False
+        self._item_norms: Optional[np.ndarray] = None
 
     def fit(self, user_item_matrix: sparse.csr_matrix, show_progress: bool = True) -> 'ALSRecommender':
         """
@@ -77,10 +87,11 @@ class ALSRecommender:
         print(f"Matrice: {user_item_matrix.shape[0]:,} users × {user_item_matrix.shape[1]:,} items")
 
         self.user_item_matrix = user_item_matrix
-        # implicit attend une matrice item-user pour fit()
         self.item_user_matrix = user_item_matrix.T.tocsr()
 
-        self.model.fit(self.item_user_matrix, show_progress=show_progress)
+        # implicit >= 0.5 attend une matrice user-item pour fit()
+        self.model.fit(self.user_item_matrix, show_progress=show_progress)
+        self._item_norms = None
         self.is_fitted = True
 
         print("Entraînement terminé!")
@@ -139,23 +150,113 @@ class ALSRecommender:
         Returns:
             Dict {user_id: [(item_id, score), ...]}
         """
-        if not self.is_fitted:
-            raise ValueError("Le modèle n'est pas entraîné. Appelez fit() d'abord.")
+        item_ids, scores = self.recommend_arrays(user_ids, n, filter_already_liked)
 
         results = {}
-        user_items = self.user_item_matrix[user_ids]
+        for i, user_id in enumerate(user_ids):
+            results[user_id] = list(zip(item_ids[i].tolist(), scores[i].tolist()))
 
-        item_ids, scores = self.model.recommend(
-            userid=np.array(user_ids),
-            user_items=user_items,
+        return results
+
+    def recommend_arrays(
+        self,
+        user_ids,
+        n: int = 10,
+        filter_already_liked: bool = True
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Recommandations d'un bloc d'utilisateurs, sous forme de tableaux.
+
+        Args:
+            user_ids: IDs utilisateurs (liste ou tableau)
+            n: Nombre de recommandations par utilisateur
+            filter_already_liked: Exclure les items déjà consommés
+
+        Returns:
+            (item_ids, scores) de forme (len(user_ids), n). Si un utilisateur a
+            moins de n items candidats, les dernières colonnes portent un
+            score de np.finfo(np.float32).min.
+        """
+        if not self.is_fitted:
+            raise ValueError("Le modèle n'est pas entraîné. Appelez fit() d'abord.")
+
+        user_ids = np.asarray(user_ids)
+        return self.model.recommend(
+            userid=user_ids,
+            user_items=self.user_item_matrix[user_ids],
             N=n,
             filter_already_liked_items=filter_already_liked
         )
 
-        for i, user_id in enumerate(user_ids):
-            results[user_id] = list(zip(item_ids[i].tolist(), scores[i].tolist()))
+    def recommend_filtered(
+        self,
+        user_ids,
+        n: int = 10,
+        filter_already_liked: bool = True,
+        allowed: Optional[np.ndarray] = None,
+        exclude: Optional[List] = None,
+        groups: Optional[np.ndarray] = None,
+        max_per_group: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Recommandations d'un bloc d'utilisateurs avec filtres appliqués aux
+        scores avant la sélection du top-K.
 
-        return results
+        Args:
+            user_ids: IDs utilisateurs (liste ou tableau)
+            n: Nombre de recommandations par utilisateur
+            filter_already_liked: Exclure les items déjà consommés
+            allowed: Masque booléen (n_items,) des items autorisés, None = tous
+            exclude: IDs d'items exclus, un tableau par utilisateur
+            groups: Groupe (artiste) de chaque item, pour max_per_group
+            max_per_group: Nombre max de recommandations par groupe
+
+        Returns:
+            (item_ids, scores) de forme (len(user_ids), n), comme recommend_arrays:
+            les colonnes sans candidat ont l'item -1 et le score PADDING_SCORE.
+        """
+        if not self.is_fitted:
+            raise ValueError("Le modèle n'est pas entraîné. Appelez fit() d'abord.")
+
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        item_factors = self.model.item_factors
+        n_items = item_factors.shape[0]
+        item_ids = np.full((len(user_ids), n), -1, dtype=np.int32)
+        scores = np.full((len(user_ids), n), PADDING_SCORE, dtype=np.float32)
+
+        block = max(1, _SCORE_BLOCK_CELLS // max(n_items, 1))
+        for start in range(0, len(user_ids), block):
+            users = user_ids[start:start + block]
+            block_scores = self.model.user_factors[users] @ item_factors.T
+            if allowed is not None:
+                block_scores[:, ~allowed] = -np.inf
+            if filter_already_liked:
+                liked = self.user_item_matrix[users]
+                block_scores[np.repeat(np.arange(len(users)), np.diff(liked.indptr)), liked.indices] = -np.inf
+            if exclude is not None:
+                excluded = [np.asarray(items, dtype=np.int64) for items in exclude[start:start + block]]
+                rows = np.repeat(np.arange(len(users)), [len(items) for items in excluded])
+                cols = np.concatenate(excluded) if excluded else np.empty(0, dtype=np.int64)
+                in_range = (cols >= 0) & (cols < n_items)
+                block_scores[rows[in_range], cols[in_range]] = -np.inf
+
+            if groups is None or not max_per_group:
+                k = min(n, n_items)
+                top = np.argpartition(-block_scores, k - 1, axis=1)[:, :k]
+                top_scores = np.take_along_axis(block_scores, top, axis=1)
+                order = np.argsort(-top_scores, axis=1, kind="stable")
+                top = np.take_along_axis(top, order, axis=1)
+                top_scores = np.take_along_axis(top_scores, order, axis=1)
+                valid = np.isfinite(top_scores)
+                item_ids[start:start + len(users), :k] = np.where(valid, top, -1)
+                scores[start:start + len(users), :k] = np.where(valid, top_scores, PADDING_SCORE)
+            else:
+                for row, row_scores in enumerate(block_scores):
+                    top = _top_k_per_group(row_scores, n, groups, max_per_group)
+                    item_ids[start + row, :len(top)] = top
+                    scores[start + row, :len(top)] = row_scores[top]
+
+        return item_ids, scores
 
     def similar_items(self, item_id: int, n: int = 10) -> List[Tuple[int, float]]:
         """
@@ -168,14 +269,90 @@ class ALSRecommender:
         Returns:
             Liste de (item_id, score)
         """
+        item_ids, scores = self.similar_items_arrays(item_id, n)
+        return list(zip(item_ids.tolist(), scores.tolist()))
+
+    def similar_items_arrays(self, item_id: int, n: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """Items similaires sous forme de tableaux (item_ids, scores), sans l'item lui-même."""
         if not self.is_fitted:
             raise ValueError("Le modèle n'est pas entraîné. Appelez fit() d'abord.")
 
         item_ids, scores = self.model.similar_items(item_id, N=n + 1)
 
         # Exclure l'item lui-même (premier résultat)
-        results = list(zip(item_ids[1:].tolist(), scores[1:].tolist()))
-        return results[:n]
+        return item_ids[1:n + 1], scores[1:n + 1]
+
+    def recommend_for_items(
+        self,
+        item_ids,
+        n: int = 10,
+        exclude=None,
+        mode: str = "centroid"
+    ) -> List[Tuple[int, float]]:
+        """
+        Recommande des items à partir de plusieurs items graines (playlist, "plus comme ceux-ci").
+
+        Args:
+            item_ids: IDs des items graines
+            n: Nombre de recommandations
+            exclude: IDs d'items à exclure en plus des graines (ex: titres déjà dans la playlist)
+            mode: Agrégation des similarités cosinus aux graines
+                - centroid: similarité au vecteur moyen des graines
+                - max: meilleure similarité à une graine
+                - sum: somme des similarités aux graines
+
+        Returns:
+            Liste de (item_id, score)
+        """
+        item_ids, scores = self.recommend_for_items_arrays(item_ids, n, exclude, mode)
+        return list(zip(item_ids.tolist(), scores.tolist()))
+
+    def recommend_for_items_arrays(
+        self,
+        item_ids,
+        n: int = 10,
+        exclude=None,
+        mode: str = "centroid"
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """recommend_for_items sous forme de tableaux (item_ids, scores)."""
+        if not self.is_fitted:
+            raise ValueError("Le modèle n'est pas entraîné. Appelez fit() d'abord.")
+        if mode not in SEED_AGGREGATIONS:
+            raise ValueError(f"Mode d'agrégation inconnu: {mode} (attendu: {', '.join(SEED_AGGREGATIONS)})")
+
+        factors = self.model.item_factors
+        n_items = factors.shape[0]
+        seeds = np.unique(np.asarray(item_ids, dtype=np.int64))
+        if len(seeds) == 0:
+            raise ValueError("Aucun item graine")
+        if seeds[0] < 0 or seeds[-1] >= n_items:
+            raise ValueError(f"item_id hors limites [0, {n_items})")
+
+        if self._item_norms is None:
+            self._item_norms = np.maximum(np.linalg.norm(factors, axis=1), 1e-10).astype(factors.dtype)
+        norms = self._item_norms
+
+        # Un seul produit matriciel pour toutes les graines
+        if mode == "centroid":
+            centroid = factors[seeds].mean(axis=0)
+            scores = (factors @ centroid) / (norms * max(float(np.linalg.norm(centroid)), 1e-10))
+        else:
+            similarities = (factors @ (factors[seeds] / norms[seeds, None]).T) / norms[:, None]
+            scores = similarities.max(axis=1) if mode == "max" else similarities.sum(axis=1)
+
+        excluded = np.zeros(n_items, dtype=bool)
+        excluded[seeds] = True
+        if exclude is not None:
+            exclude = np.asarray(exclude, dtype=np.int64)
+            excluded[exclude[(exclude >= 0) & (exclude < n_items)]] = True
+        scores[excluded] = -np.inf
+
+        n = min(n, n_items - int(excluded.sum()))
+        if n <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=scores.dtype)
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return top, scores[top]
 
     def similar_users(self, user_id: int, n: int = 10) -> List[Tuple[int, float]]:
         """
@@ -312,3 +489,30 @@ class ALSRecommender:
     def __repr__(self) -> str:
         status = "fitted" if self.is_fitted else "not fitted"
         return f"ALSRecommender(factors={self.factors}, reg={self.regularization}, {status})"
+
+
+def _top_k_per_group(scores: np.ndarray, n: int, groups: np.ndarray, max_per_group: int) -> np.ndarray:
+    """
+    Top-n des scores finis avec au plus max_per_group items par groupe.
+
+    Sélection gloutonne exacte par score décroissant: les candidats sont pris
+    par argpartition, et leur nombre doublé tant que le plafond en écarte trop.
+    """
+    n_valid = int(np.isfinite(scores).sum())
+    k = min(n_valid, n * 4)
+    while k > 0:
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        # Rang de chaque candidat dans son groupe, dans l'ordre des scores
+        candidate_groups = groups[top]
+        by_group = np.argsort(candidate_groups, kind="stable")
+        sorted_groups = candidate_groups[by_group]
+        starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+        rank = np.arange(k) - np.repeat(starts, np.diff(np.r_[starts, k]))
+        rank_in_group = np.empty(k, dtype=np.int64)
+        rank_in_group[by_group] = rank
+        kept = top[rank_in_group < max_per_group]
+        if len(kept) >= n or k == n_valid:
+            return kept[:n]
+        k = min(n_valid, k * 2)
+    return np.empty(0, dtype=np.int64)
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Pipeline complet de recommandation, des dumps bruts au modèle évalué.
+
+Enchaîne les étapes existantes via des fichiers Parquet/NPZ intermédiaires
+(aucun passage par du CSV):
+
+1. parse       scripts/parse_listens.py        → listens_raw.parquet
+2. dedup       scripts/deduplicate_tracks.py   → track_dedup_map.json
+3. aggregate   scripts/partitioned_aggregate.py → listens.parquet + mappings.json
+4. matrix      scripts/build_matrix.py         → user_item_matrix.npz + train/test
+5. train       src/train.py                    → als_model.pkl
+6. evaluate    src/evaluate.py                 → evaluation_results.json
+
+La même commande tourne sur EC2 (user-data de run_full_pipeline_ec2.py) et
+en local sur un échantillon.
+
+Les étapes à jour sont sautées: le manifest data/processed/pipeline_manifest.json
+garde les hashs de contenu des entrées/sorties et des paramètres de chaque
+étape. Changer --alpha ne relance que matrix (puis train/evaluate si la
+matrice change), pas le parsing ni l'agrégation.
+
+Usage:
+  python src/pipeline.py --input data/raw/listenbrainz/incrementals
+  python src/pipeline.py --input data/extracted/listenbrainz --max-files 3 --factors 32 --iterations 5
+  python src/pipeline.py --alpha 20 --explain
+  python src/pipeline.py --force train
+  python src/pipeline.py --start-month 2025-01 --temporal-split 2025-11
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from scipy import sparse
+
+SCRIPTS_DIR = Path(__file__).parent.parent / "scripts"
+sys.path.insert(0, str(SCRIPTS_DIR))
+
+from build_matrix import build_sparse_matrix, create_train_test_split
+from deduplicate_tracks import DEFAULT_MAX_BLOCK, DEFAULT_THRESHOLD, deduplicate_tracks
+from evaluate import create_temporal_split, evaluate_model, print_results
+from id_dictionary import ID_DICTS_DIR
+from listen_dataset import open_listens
+from models.als_model import ALSRecommender
+from parse_listens import EXTRACTED_DIR, parse_all_listens
+from partitioned_aggregate import DEFAULT_MEMORY_MB, aggregate_partitioned
+from stage_runner import MANIFEST_NAME, Stage, StageRunner
+from train import train_model
+
+# Configuration par défaut
+DATA_DIR = Path(__file__).parent.parent / "data" / "processed"
+MODELS_DIR = Path(__file__).parent.parent / "models"
+
+
+def distinct_track_keys(listens_file: Path, batch_size: int = 1_000_000) -> list[str]:
+    """
+    Clés 'Artiste - Titre' distinctes, triées par nombre d'écoutes décroissant
+    (la version la plus écoutée devient la clé canonique de la déduplication).
+    """
+    dataset = open_listens(listens_file)
+    counts = None
+    for batch in dataset.to_batches(columns=['artist_name', 'track_name'], batch_size=batch_size):
+        df = batch.to_pandas().dropna(subset=['track_name'])
+        keys = df['artist_name'].fillna('Unknown') + ' - ' + df['track_name']
+        batch_counts = keys.value_counts()
+        counts = batch_counts if counts is None else counts.add(batch_counts, fill_value=0)
+
+    if counts is None:
+        return []
+    return counts.sort_values(ascending=False, kind='stable').index.tolist()
+
+
+# ──────────────────────────────────────────────
+# Étapes
+# ──────────────────────────────────────────────
+
+def stage_parse(args):
+    """Parse les fichiers extraits ou archives .tar.zst → listens_raw.parquet."""
+    parse_all_listens(
+        extracted_dir=args.input,
+        output_dir=args.processed_dir,
+        batch_size=args.batch_size,
+        max_files=args.max_files,
+        dedup=args.dedup_listens,
+        expected_listens=args.expected_listens
+    )
+
+
+def stage_dedup(args):
+    """Calcule le mapping de déduplication des titres."""
+    track_keys = distinct_track_keys(args.processed_dir / "listens_raw.parquet")
+    deduplicate_tracks(
+        output_file=args.processed_dir / "track_dedup_map.json",
+        threshold=args.threshold,
+        max_block_size=args.max_block_size,
+        track_keys=track_keys,
+    )
+
+
+def stage_aggregate(args):
+    """Agrège les écoutes en mémoire bornée → listens.parquet + mappings.json."""
+    aggregate_partitioned(
+        input_path=args.processed_dir / "listens_raw.parquet",
+        output_file=args.processed_dir / "listens.parquet",
+        work_dir=args.processed_dir / "partitions",
+        processed_dir=args.processed_dir,
+        memory_mb=args.memory_mb,
+        workers=args.workers,
+        min_user_listens=args.min_user_listens,
+        min_track_listens=args.min_track_listens,
+        id_dicts_dir=args.id_dicts
+    )
+
+
+def stage_matrix(args):
+    """Construit la matrice user-item (fenêtre de mois optionnelle) et le split train/test."""
+    listens = args.processed_dir / "listens.parquet"
+    matrix = build_sparse_matrix(
+        input_file=listens,
+        output_matrix=args.processed_dir / "user_item_matrix.npz",
+        confidence_scaling=args.alpha,
+        id_dicts_dir=args.id_dicts,
+        start_month=args.start_month,
+        end_month=args.end_month
+    )
+
+    if args.temporal_split:
+        train, test = create_temporal_split(listens, args.temporal_split, matrix.shape,
+                                            confidence_scaling=args.alpha,
+                                            start_month=args.start_month,
+                                            end_month=args.end_month)
+    else:
+        train, test = create_train_test_split(matrix, test_ratio=args.test_ratio)
+    sparse.save_npz(args.processed_dir / "train_matrix.npz", train)
+    sparse.save_npz(args.processed_dir / "test_matrix.npz", test)
+
+
+def stage_train(args):
+    """Entraîne le modèle de production sur la matrice complète."""
+    train_model(
+        matrix_path=args.processed_dir / "user_item_matrix.npz",
+        user_mapping_path=args.processed_dir / "user_mapping.json",
+        item_mapping_path=args.processed_dir / "item_mapping.json",
+        output_path=args.models_dir / "als_model.pkl",
+        factors=args.factors,
+        regularization=args.regularization,
+        iterations=args.iterations
+    )
+
+
+def stage_evaluate(args):
+    """
+    Évalue les hyperparamètres sur le split: un modèle entraîné sur la matrice
+    train uniquement, pour que les items de test ne soient ni appris ni filtrés.
+    """
+    train = sparse.load_npz(args.processed_dir / "train_matrix.npz")
+    test = sparse.load_npz(args.processed_dir / "test_matrix.npz")
+
+    model = ALSRecommender(
+        factors=args.factors,
+        regularization=args.regularization,
+        iterations=args.iterations
+    )
+    model.fit(train, show_progress=True)
+
+    results = evaluate_model(
+        model=model,
+        train_matrix=train,
+        test_matrix=test,
+        n_users_sample=args.eval_sample
+    )
+    print_results(results)
+
+    output = args.models_dir / "evaluation_results.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nRésultats sauvegardés: {output}")
+
+
+def _p(args, name: str) -> Path:
+    return args.processed_dir / name
+
+
+STAGES = [
+    Stage(
+        name="parse",
+        func=stage_parse,
+        inputs=lambda a: [a.input],
+        outputs=lambda a: [_p(a, "listens_raw.parquet")],
+        params=lambda a: {"max_files": a.max_files, "dedup_listens": a.dedup_listens,
+                          "expected_listens": a.expected_listens}
+    ),
+    Stage(
+        name="dedup",
+        func=stage_dedup,
+        inputs=lambda a: [_p(a, "listens_raw.parquet")],
+        outputs=lambda a: [_p(a, "track_dedup_map.json")],
+        params=lambda a: {"threshold": a.threshold, "max_block_size": a.max_block_size}
+    ),
+    Stage(
+        name="aggregate",
+        func=stage_aggregate,
+        inputs=lambda a: [_p(a, "listens_raw.parquet"), _p(a, "track_dedup_map.json")],
+        outputs=lambda a: [_p(a, "listens.parquet"), _p(a, "mappings.json"), a.id_dicts],
+        params=lambda a: {"min_user_listens": a.min_user_listens,
+                          "min_track_listens": a.min_track_listens}
+    ),
+    Stage(
+        name="matrix",
+        func=stage_matrix,
+        inputs=lambda a: [_p(a, "listens.parquet"), _p(a, "mappings.json"), a.id_dicts],
+        outputs=lambda a: [_p(a, name) for name in (
+            "user_item_matrix.npz", "train_matrix.npz", "test_matrix.npz",
+            "user_mapping.json", "item_mapping.json")],
+        params=lambda a: {"alpha": a.alpha, "test_ratio": a.test_ratio,
+                          "start_month": a.start_month, "end_month": a.end_month,
+                          "temporal_split": a.temporal_split}
+    ),
+    Stage(
+        name="train",
+        func=stage_train,
+        inputs=lambda a: [_p(a, "user_item_matrix.npz"), _p(a, "user_mapping.json"),
+                          _p(a, "item_mapping.json")],
+        outputs=lambda a: [a.models_dir / "als_model.pkl"],
+        params=lambda a: {"factors": a.factors, "regularization": a.regularization,
+                          "iterations": a.iterations}
+    ),
+    Stage(
+        name="evaluate",
+        func=stage_evaluate,
+        inputs=lambda a: [_p(a, "train_matrix.npz"), _p(a, "test_matrix.npz")],
+        outputs=lambda a: [a.models_dir / "evaluation_results.json"],
+        params=lambda a: {"factors": a.factors, "regularization": a.regularization,
+                          "iterations": a.iterations, "eval_sample": a.eval_sample}
+    ),
+]
+
+
+def run_pipeline(args):
+    """
+    Exécute les étapes sélectionnées dans l'ordre, en sautant celles dont
+    les entrées, les paramètres et les sorties n'ont pas changé depuis le
+    dernier run (voir stage_runner.py).
+    """
+    stage_names = [stage.name for stage in STAGES]
+    selected = args.stages or stage_names
+    unknown = (set(selected) | set(args.force or [])) - set(stage_names)
+    if unknown:
+        raise ValueError(f"Étapes inconnues: {', '.join(sorted(unknown))}")
+    if args.skip_dedup:
+        selected = [s for s in selected if s != "dedup"]
+    if args.skip_eval:
+        selected = [s for s in selected if s != "evaluate"]
+
+    # --force seul: toutes les étapes sélectionnées
+    force = set(selected) if args.force == [] else set(args.force or [])
+
+    args.processed_dir.mkdir(parents=True, exist_ok=True)
+    args.models_dir.mkdir(parents=True, exist_ok=True)
+
+    runner = StageRunner(args.processed_dir / MANIFEST_NAME)
+    stages = [stage for stage in STAGES if stage.name in selected]
+    timings = runner.run(stages, args, force=force, explain=args.explain)
+    if args.explain:
+        return timings
+
+    print("\n" + "=" * 60)
+    print("PIPELINE TERMINÉ")
+    print("=" * 60)
+    for name, seconds in timings.items():
+        status = "à jour" if seconds is None else f"{seconds:8.1f}s"
+        print(f"  {name:10} {status:>9}")
+    return timings
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Pipeline complet de recommandation")
+    parser.add_argument("--input", type=Path, default=EXTRACTED_DIR,
+                        help="Dossier des fichiers extraits ou des archives .tar.zst")
+    parser.add_argument("--processed-dir", type=Path, default=DATA_DIR,
+                        help="Dossier des fichiers intermédiaires")
+    parser.add_argument("--models-dir", type=Path, default=MODELS_DIR,
+                        help="Dossier du modèle et des résultats")
+    parser.add_argument("--id-dicts", type=Path, default=ID_DICTS_DIR,
+                        help="Dossier des dictionnaires d'IDs persistants")
+    parser.add_argument("--stages", nargs='+',
+                        help="Étapes à exécuter (défaut: toutes)")
+    parser.add_argument("--skip-dedup", action="store_true",
+                        help="Réutiliser le track_dedup_map.json existant")
+    parser.add_argument("--skip-eval", action="store_true",
+                        help="Ne pas évaluer le modèle")
+    parser.add_argument("--force", nargs='*', metavar="STAGE",
+                        help="Relancer ces étapes même à jour (sans argument: toutes)")
+    parser.add_argument("--explain", action="store_true",
+                        help="Afficher pourquoi chaque étape tournerait ou non, sans rien exécuter")
+
+    # Parsing / agrégation
+    parser.add_argument("--max-files", type=int,
+                        help="Limite de fichiers à parser (échantillon)")
+    parser.add_argument("--batch-size", type=int, default=100_000,
+                        help="Taille des batches de parsing")
+    parser.add_argument("--dedup-listens", choices=['exact', 'bloom', 'none'], default='exact',
+                        help="Déduplication des écoutes entre dumps qui se chevauchent")
+    parser.add_argument("--expected-listens", type=int, default=0,
+                        help="Nombre d'écoutes attendu (dimensionne le filtre de Bloom)")
+    parser.add_argument("--memory-mb", type=int, default=DEFAULT_MEMORY_MB,
+                        help="Budget mémoire de l'agrégation (MB)")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Nombre de process (0 = nombre de cœurs)")
+    parser.add_argument("--min-user-listens", type=int, default=5,
+                        help="Minimum d'écoutes par utilisateur")
+    parser.add_argument("--min-track-listens", type=int, default=3,
+                        help="Minimum d'écoutes par track")
+
+    # Déduplication
+    parser.add_argument("--threshold", type=int, default=DEFAULT_THRESHOLD,
+                        help="Score de similarité minimum pour fusionner deux titres")
+    parser.add_argument("--max-block-size", type=int, default=DEFAULT_MAX_BLOCK,
+                        help="Taille max d'un bloc de déduplication")
+
+    # Matrice / modèle
+    parser.add_argument("--alpha", type=float, default=40.0,
+                        help="Facteur de scaling des confidences")
+    parser.add_argument("--test-ratio", type=float, default=0.2,
+                        help="Ratio pour le test set")
+    parser.add_argument("--start-month", help="Premier mois de la matrice (YYYY-MM)")
+    parser.add_argument("--end-month", help="Dernier mois de la matrice, inclus (YYYY-MM)")
+    parser.add_argument("--temporal-split", metavar="YYYY-MM",
+                        help="Split temporel: test à partir de ce mois (au lieu d'un split aléatoire)")
+    parser.add_argument("--factors", type=int, default=128,
+                        help="Nombre de facteurs latents")
+    parser.add_argument("--regularization", type=float, default=0.01,
+                        help="Terme de régularisation")
+    parser.add_argument("--iterations", type=int, default=15,
+                        help="Nombre d'itérations")
+    parser.add_argument("--eval-sample", type=int, default=1000,
+                        help="Nombre d'utilisateurs évalués")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    run_pipeline(args)
+
+
+if __name__ == "__main__":
+    main()
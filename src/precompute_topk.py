@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Précalcul du top-K des utilisateurs les plus actifs (ou de tous) pour l'API.
+
+À lancer après l'entraînement: les recommandations sont calculées par blocs
+(recommend_arrays, forme tableau de recommend_batch) et écrites directement
+dans le fichier mappé (int32 / float16), sans garder le résultat en mémoire.
+Le store porte la version du snapshot (modèle, matrice et mappings): l'API
+l'ignore s'il ne correspond pas exactement au snapshot servi.
+"""
+import argparse
+import os
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from scipy import sparse
+from tqdm import tqdm
+
+from api.export import PADDING_SCORE
+from api.recommender import file_snapshot_version
+from api.topk_store import TopKStore
+from models.als_model import ALSRecommender
+
+# Configuration par défaut
+DATA_DIR = Path(__file__).parent.parent / "data" / "processed"
+MODELS_DIR = Path(__file__).parent.parent / "models"
+
+DEFAULT_MODEL = MODELS_DIR / "als_model.pkl"
+DEFAULT_MATRIX = DATA_DIR / "user_item_matrix.npz"
+DEFAULT_MAPPINGS = DATA_DIR / "mappings.json"
+DEFAULT_OUTPUT = MODELS_DIR / "topk.bin"
+
+
+def select_active_users(user_item_matrix: sparse.csr_matrix, top_users: Optional[int]) -> np.ndarray:
+    """IDs (triés) des `top_users` utilisateurs ayant le plus d'items distincts; tous si None."""
+    n_users = user_item_matrix.shape[0]
+    if top_users is None or top_users >= n_users:
+        return np.arange(n_users, dtype=np.int64)
+    activity = np.diff(user_item_matrix.indptr)
+    return np.sort(np.argpartition(-activity, top_users - 1)[:top_users]).astype(np.int64)
+
+
+def precompute_topk(
+    model_path: Path = DEFAULT_MODEL,
+    matrix_path: Path = DEFAULT_MATRIX,
+    mappings_path: Optional[Path] = DEFAULT_MAPPINGS,
+    output_path: Path = DEFAULT_OUTPUT,
+    k: int = 200,
+    top_users: Optional[int] = 100_000,
+    block_size: int = 2048,
+    filter_already_liked: bool = True
+) -> TopKStore:
+    """
+    Calcule et écrit le store top-K.
+
+    Args:
+        model_path: Modèle ALS (.pkl)
+        matrix_path: Matrice user-item (.npz)
+        mappings_path: mappings.json servi par l'API (inclus dans la version s'il existe)
+        output_path: Fichier du store
+        k: Nombre d'items par utilisateur
+        top_users: Nombre d'utilisateurs les plus actifs (None = tous)
+        block_size: Utilisateurs par appel à recommend_arrays
+        filter_already_liked: Exclure les items déjà consommés
+
+    Returns:
+        Store écrit (mappé en lecture)
+    """
+    print("=" * 60)
+    print("PRÉCALCUL DU TOP-K")
+    print("=" * 60)
+
+    user_item_matrix = sparse.load_npz(matrix_path)
+    model = ALSRecommender.load(model_path, user_item_matrix)
+    version = file_snapshot_version(model_path, matrix_path, mappings_path)
+    user_ids = select_active_users(user_item_matrix, top_users)
+    k = min(k, user_item_matrix.shape[1])
+
+    print(f"Snapshot: {version}")
+    print(f"Utilisateurs: {len(user_ids):,} / {user_item_matrix.shape[0]:,} | K={k}")
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    store = TopKStore.create(tmp_path, version, k, filter_already_liked, user_ids, user_item_matrix.shape[0])
+
+    start = time.time()
+    for begin in tqdm(range(0, len(user_ids), block_size), desc="Top-K", unit="bloc"):
+        block = user_ids[begin:begin + block_size]
+        item_ids, scores = model.recommend_arrays(block, k, filter_already_liked)
+        store.fill(block, item_ids, scores, PADDING_SCORE)
+    store.flush()
+    del store
+    os.replace(tmp_path, output_path)
+
+    store = TopKStore.load(output_path)
+    elapsed = time.time() - start
+    print(f"\n✅ Store écrit: {output_path} ({store.nbytes / 1024 / 1024:.1f} MB, "
+          f"{len(user_ids) / max(elapsed, 1e-9):,.0f} users/s)")
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Précalculer le top-K des utilisateurs actifs")
+    parser.add_argument("--model", type=Path, default=DEFAULT_MODEL,
+                       help="Modèle ALS (.pkl)")
+    parser.add_argument("--matrix", type=Path, default=DEFAULT_MATRIX,
+                       help="Matrice user-item (.npz)")
+    parser.add_argument("--mappings", type=Path, default=DEFAULT_MAPPINGS,
+                       help="Mappings (.json) servis par l'API")
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT,
+                       help="Fichier du store top-K")
+    parser.add_argument("--k", type=int, default=200,
+                       help="Nombre d'items par utilisateur")
+    parser.add_argument("--top-users", type=int, default=100_000,
+                       help="Nombre d'utilisateurs les plus actifs")
+    parser.add_argument("--all-users", action="store_true",
+                       help="Précalculer tous les utilisateurs")
+    parser.add_argument("--block-size", type=int, default=2048,
+                       help="Utilisateurs par bloc")
+    parser.add_argument("--keep-liked", action="store_true",
+                       help="Ne pas exclure les items déjà écoutés")
+
+    args = parser.parse_args()
+
+    precompute_topk(
+        model_path=args.model,
+        matrix_path=args.matrix,
+        mappings_path=args.mappings,
+        output_path=args.output,
+        k=args.k,
+        top_users=None if args.all_users else args.top_users,
+        block_size=args.block_size,
+        filter_already_liked=not args.keep_liked
+    )
+
+
+if __name__ == "__main__":
+    main()
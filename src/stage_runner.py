@@ -0,0 +1,228 @@
+"""
+Exécution incrémentale des étapes du pipeline, par hash de contenu.
+
+Chaque étape déclare ses entrées, ses paramètres et ses sorties. Après chaque
+exécution, le manifest enregistre le hash du contenu de chaque entrée et de
+chaque sortie, ainsi que le hash des paramètres. Une étape n'est relancée que
+si quelque chose a changé depuis: entrée modifiée, paramètre modifié, sortie
+absente ou modifiée à la main.
+
+Les hashs de fichiers sont mis en cache dans le manifest par (taille, mtime):
+un fichier inchangé n'est pas relu.
+"""
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+MANIFEST_NAME = "pipeline_manifest.json"
+HASH_CHUNK_SIZE = 1 << 20
+
+
+@dataclass
+class Stage:
+    """
+    Étape du pipeline.
+
+    Attributs:
+        name: Nom de l'étape
+        func: Fonction exécutée, appelée avec les arguments CLI
+        inputs: Chemins lus par l'étape (fichiers ou dossiers)
+        outputs: Chemins écrits par l'étape
+        params: Paramètres qui influencent le résultat (pas workers, mémoire…)
+    """
+    name: str
+    func: Callable
+    inputs: Callable[[object], List[Path]]
+    outputs: Callable[[object], List[Path]]
+    params: Callable[[object], dict]
+
+
+def hash_params(params: dict) -> str:
+    """Hash stable d'un dictionnaire de paramètres."""
+    payload = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class StageRunner:
+    """
+    Exécute une liste d'étapes en sautant celles dont rien n'a changé.
+
+    Attributs:
+        manifest_path: Fichier JSON des hashs (étapes + cache des fichiers)
+    """
+
+    def __init__(self, manifest_path: Path):
+        self.manifest_path = Path(manifest_path)
+        self.manifest = {'stages': {}, 'files': {}}
+        if self.manifest_path.exists():
+            with open(self.manifest_path, encoding='utf-8') as f:
+                self.manifest = json.load(f)
+
+    def save(self):
+        """Écrit le manifest (écriture atomique)."""
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.manifest_path.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.manifest_path)
+
+    # ──────────────────────────────────────────
+    # Hashs de contenu
+    # ──────────────────────────────────────────
+
+    def hash_file(self, path: Path) -> str:
+        """Hash sha256 d'un fichier, réutilisé tant que taille et mtime sont inchangées."""
+        stat = path.stat()
+        key = str(path.resolve())
+        cached = self.manifest['files'].get(key)
+        if cached and cached['size'] == stat.st_size and cached['mtime_ns'] == stat.st_mtime_ns:
+            return cached['sha256']
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        value = digest.hexdigest()
+        self.manifest['files'][key] = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': value
+        }
+        return value
+
+    def hash_path(self, path: Path) -> Optional[str]:
+        """Hash d'un fichier ou d'un dossier (chemins relatifs + contenus). None si absent."""
+        path = Path(path)
+        if path.is_file():
+            return self.hash_file(path)
+        if not path.is_dir():
+            return None
+
+        digest = hashlib.sha256()
+        for file in sorted(p for p in path.rglob("*") if p.is_file()):
+            digest.update(str(file.relative_to(path)).encode('utf-8'))
+            digest.update(self.hash_file(file).encode('ascii'))
+        return digest.hexdigest()
+
+    def hash_paths(self, paths: List[Path]) -> Dict[str, Optional[str]]:
+        return {str(p): self.hash_path(p) for p in paths}
+
+    # ──────────────────────────────────────────
+    # Décision
+    # ──────────────────────────────────────────
+
+    def check(self, stage: Stage, args, upstream: set = frozenset()) -> Tuple[bool, List[str]]:
+        """
+        Indique si l'étape doit tourner, avec les raisons.
+
+        Args:
+            stage: Étape à examiner
+            args: Arguments CLI
+            upstream: Chemins qui seront réécrits par des étapes précédentes
+
+        Returns:
+            (à exécuter, raisons)
+        """
+        record = self.manifest['stages'].get(stage.name)
+        if record is None:
+            return True, ["jamais exécutée"]
+
+        reasons = []
+        params = stage.params(args)
+        if hash_params(params) != record['params_hash']:
+            old = record.get('params', {})
+            changed = sorted(k for k in set(params) | set(old) if params.get(k) != old.get(k))
+            for key in changed:
+                reasons.append(f"paramètre {key}: {old.get(key)!r} → {params.get(key)!r}")
+
+        for path in stage.inputs(args):
+            if str(path) in upstream:
+                reasons.append(f"entrée {path} sera régénérée par une étape précédente")
+            elif self.hash_path(path) != record['inputs'].get(str(path)):
+                reasons.append(f"entrée modifiée: {path}")
+
+        for path in stage.outputs(args):
+            current = self.hash_path(path)
+            if current is None:
+                reasons.append(f"sortie absente: {path}")
+            elif current != record['outputs'].get(str(path)):
+                reasons.append(f"sortie modifiée: {path}")
+
+        return bool(reasons), reasons
+
+    def record(self, stage: Stage, args, seconds: float):
+        """
+        Enregistre l'état après exécution. Les entrées sont hashées après coup:
+        une entrée mise à jour en place par l'étape (dictionnaires d'IDs)
+        ne la fera pas relancer au run suivant.
+        """
+        params = stage.params(args)
+        self.manifest['stages'][stage.name] = {
+            'params': json.loads(json.dumps(params, default=str)),
+            'params_hash': hash_params(params),
+            'inputs': self.hash_paths(stage.inputs(args)),
+            'outputs': self.hash_paths(stage.outputs(args)),
+            'seconds': round(seconds, 2),
+            'completed_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+        }
+        self.save()
+
+    # ──────────────────────────────────────────
+    # Exécution
+    # ──────────────────────────────────────────
+
+    def run(self, stages: List[Stage], args, force: set = frozenset(), explain: bool = False) -> dict:
+        """
+        Exécute les étapes dans l'ordre, en sautant celles à jour.
+
+        Une étape saute quand ses entrées ont le même contenu qu'au dernier run:
+        si une étape amont est relancée mais produit des fichiers identiques,
+        les étapes aval sont sautées elles aussi.
+
+        Args:
+            stages: Étapes sélectionnées, dans l'ordre
+            args: Arguments CLI
+            force: Noms des étapes à relancer quoi qu'il arrive
+            explain: Afficher les décisions sans rien exécuter
+
+        Returns:
+            Durée par étape exécutée (None si sautée)
+        """
+        timings = {}
+        upstream = set()
+
+        for stage in stages:
+            if stage.name in force:
+                should_run, reasons = True, ["forcée (--force)"]
+            else:
+                should_run, reasons = self.check(stage, args, upstream if explain else frozenset())
+
+            if explain:
+                status = "EXÉCUTER" if should_run else "À JOUR"
+                print(f"\n[{status}] {stage.name}")
+                for reason in reasons or ["entrées, paramètres et sorties inchangés"]:
+                    print(f"    - {reason}")
+                if should_run:
+                    upstream.update(str(p) for p in stage.outputs(args))
+                continue
+
+            if not should_run:
+                print(f"\n[À JOUR] {stage.name} — étape sautée")
+                timings[stage.name] = None
+                continue
+
+            print("\n" + "#" * 60)
+            print(f"# ÉTAPE: {stage.name}")
+            for reason in reasons:
+                print(f"#   {reason}")
+            print("#" * 60)
+            start = time.time()
+            stage.func(args)
+            timings[stage.name] = time.time() - start
+            self.record(stage, args, timings[stage.name])
+
+        return timings
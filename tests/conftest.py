@@ -0,0 +1,97 @@
+"""
+Fixtures partagées: serveur HTTP local servant des fichiers en mémoire.
+
+Le serveur gère (ou ignore) l'en-tête Range, répond aux requêtes HEAD et
+peut couper la connexion au milieu d'une réponse.
+"""
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "scripts"))
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    server: "FixtureServer"
+
+    def log_message(self, *args):
+        pass
+
+    def _send_headers(self):
+        """En-têtes de la réponse; retourne (corps, début) ou None si déjà répondu."""
+        server = self.server
+        range_header = self.headers.get("Range")
+        server.requests.append((self.command, self.path, range_header))
+        body = server.files.get(self.path.lstrip("/"))
+        if body is None:
+            self.send_error(404)
+            return None
+
+        start = 0
+        if range_header and server.support_range:
+            start = int(range_header.split("=")[1].split("-")[0])
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(body)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return None
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body) - start))
+        self.end_headers()
+        return body, start
+
+    def do_HEAD(self):
+        self._send_headers()
+
+    def do_GET(self):
+        sent = self._send_headers()
+        if sent is None:
+            return
+        body, start = sent
+        server = self.server
+        cut = server.disconnect_after
+        if cut is not None:
+            # Coupure au milieu du corps, une seule fois
+            server.disconnect_after = None
+            self.wfile.write(body[start:start + cut])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body[start:])
+
+
+class FixtureServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FixtureHandler)
+        self.files = {}
+        self.requests = []
+        self.support_range = True
+        self.disconnect_after = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/"
+
+    def gets(self):
+        """(chemin, en-tête Range) des requêtes GET reçues."""
+        return [(path, range_header) for command, path, range_header in self.requests if command == "GET"]
+
+
+@pytest.fixture
+def http_server():
+    httpd = FixtureServer()
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
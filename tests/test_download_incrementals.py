@@ -0,0 +1,134 @@
+"""
+Tests de stream_to_s3 (scripts/download_incrementals.py): serveur HTTP local
+(fixture http_server de conftest.py) et client S3 factice en mémoire.
+"""
+import pytest
+from botocore.exceptions import ClientError
+
+import download_incrementals as di
+
+PART_SIZE = 64 * 1024
+PAYLOAD = bytes(range(256)) * 1024  # 256 KiB = 4 parts exactement
+KEY = "raw/dump.tar.zst"
+
+
+class FakeS3:
+    """Sous-ensemble de l'API multipart de S3, avec ses refus."""
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self.uploaded_parts = []
+        self.aborted = []
+        self._next_id = 0
+
+    def create_multipart_upload(self, Bucket, Key):
+        self._next_id += 1
+        upload_id = f"upload-{self._next_id}"
+        self.uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, ContentLength):
+        data = Body.read()
+        assert len(data) == ContentLength
+        self.uploads[UploadId][PartNumber] = data
+        self.uploaded_parts.append(PartNumber)
+        return {"ETag": f'"etag-{PartNumber}"'}
+
+    def list_parts(self, Bucket, Key, UploadId, PartNumberMarker=0):
+        if UploadId not in self.uploads:
+            raise ClientError({"Error": {"Code": "NoSuchUpload"}}, "ListParts")
+        parts = [{"PartNumber": n, "ETag": f'"etag-{n}"'} for n in sorted(self.uploads[UploadId])]
+        return {"Parts": parts, "IsTruncated": False}
+
+    def complete_multipart_upload(self, Bucket, Key, MultipartUpload, UploadId):
+        parts = MultipartUpload["Parts"]
+        if not parts:
+            raise ClientError({"Error": {"Code": "MalformedXML"}}, "CompleteMultipartUpload")
+        numbers = [p["PartNumber"] for p in parts]
+        assert numbers == list(range(1, len(numbers) + 1))
+        uploaded = self.uploads.pop(UploadId)
+        self.objects[Key] = b"".join(uploaded[n] for n in numbers)
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId, None)
+        self.aborted.append(UploadId)
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Key] = Body
+
+
+@pytest.fixture
+def server(http_server):
+    http_server.files = {"dump.tar.zst": PAYLOAD, "empty.tar.zst": b""}
+    return http_server
+
+
+def stream(s3, server, name="dump.tar.zst", manifest=None):
+    di.stream_to_s3(s3, server.base_url + name, "bucket", KEY, name,
+                    manifest=manifest, upload_workers=2, part_size=PART_SIZE)
+
+
+def test_streams_all_parts(server):
+    s3 = FakeS3()
+    stream(s3, server)
+    assert s3.objects[KEY] == PAYLOAD
+    assert sorted(s3.uploaded_parts) == [1, 2, 3, 4]
+
+
+def test_resume_from_partial_upload(server, tmp_path):
+    s3 = FakeS3()
+    manifest = di.UploadManifest(tmp_path / "upload_manifest.json")
+    # Coupure au milieu de la 3e part: les parts 1 et 2 sont uploadées
+    server.disconnect_after = 2 * PART_SIZE + 1000
+
+    with pytest.raises(Exception):
+        stream(s3, server, manifest=manifest)
+    assert KEY not in s3.objects
+    assert sorted(s3.uploaded_parts) == [1, 2]
+    assert manifest.get(KEY) is not None
+
+    # Nouveau process: manifest relu depuis le disque
+    manifest = di.UploadManifest(tmp_path / "upload_manifest.json")
+    stream(s3, server, manifest=manifest)
+
+    assert s3.objects[KEY] == PAYLOAD
+    assert server.gets()[-1] == ("/dump.tar.zst", f"bytes={2 * PART_SIZE}-")
+    assert sorted(s3.uploaded_parts) == [1, 2, 3, 4]
+    assert manifest.get(KEY) is None
+
+
+def test_resume_when_server_ignores_range(server, tmp_path):
+    s3 = FakeS3()
+    manifest = di.UploadManifest(tmp_path / "upload_manifest.json")
+    server.disconnect_after = PART_SIZE + 10
+    with pytest.raises(Exception):
+        stream(s3, server, manifest=manifest)
+
+    server.support_range = False
+    stream(s3, server, manifest=manifest)
+    assert s3.objects[KEY] == PAYLOAD
+
+
+def test_empty_body_writes_empty_object(server):
+    s3 = FakeS3()
+    stream(s3, server, name="empty.tar.zst")
+    assert s3.objects[KEY] == b""
+    assert s3.aborted and not s3.uploads
+
+
+def test_fully_uploaded_resume_gets_416(server, tmp_path):
+    s3 = FakeS3()
+    manifest = di.UploadManifest(tmp_path / "upload_manifest.json")
+    url = server.base_url + "dump.tar.zst"
+    upload_id = s3.create_multipart_upload(Bucket="bucket", Key=KEY)["UploadId"]
+    manifest.start(KEY, upload_id, url, PART_SIZE)
+    for n in range(1, 5):
+        s3.uploads[upload_id][n] = PAYLOAD[(n - 1) * PART_SIZE:n * PART_SIZE]
+
+    stream(s3, server, manifest=manifest)
+
+    assert server.gets() == [("/dump.tar.zst", f"bytes={len(PAYLOAD)}-")]
+    assert s3.objects[KEY] == PAYLOAD
+    assert s3.uploaded_parts == []
+    assert manifest.get(KEY) is None
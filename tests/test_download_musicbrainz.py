@@ -0,0 +1,135 @@
+"""
+Tests de scripts/download_musicbrainz.py contre un serveur HTTP local
+(fixture http_server de conftest.py).
+"""
+import hashlib
+
+import pytest
+import requests
+
+import download_musicbrainz as dm
+
+PAYLOAD = bytes(range(256)) * 4096  # 1 MiB
+PAYLOAD_SHA256 = hashlib.sha256(PAYLOAD).hexdigest()
+
+
+@pytest.fixture
+def server(http_server):
+    http_server.files = {
+        "recording.tar.xz": PAYLOAD,
+        "SHA256SUMS": f"{PAYLOAD_SHA256}  recording.tar.xz\n".encode(),
+    }
+    return http_server
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(dm.time, "sleep", lambda seconds: None)
+    # Blocs plus petits que le fichier: une coupure laisse un préfixe dans le .part
+    monkeypatch.setattr(dm, "CHUNK_SIZE", 64 * 1024)
+
+
+def test_resume_part_after_disconnect(server, tmp_path):
+    output_path = tmp_path / "recording.tar.xz"
+    part_path = tmp_path / "recording.tar.xz.part"
+    url = server.base_url + "recording.tar.xz"
+    server.disconnect_after = 300_000
+
+    with requests.Session() as session:
+        with pytest.raises(requests.exceptions.ChunkedEncodingError):
+            dm.download_file(session, url, output_path, PAYLOAD_SHA256, max_retries=0)
+        received = part_path.stat().st_size
+        assert 0 < received <= 300_000
+        assert part_path.read_bytes() == PAYLOAD[:received]
+        assert not output_path.exists()
+
+        sha256 = dm.download_file(session, url, output_path, PAYLOAD_SHA256)
+
+    assert sha256 == PAYLOAD_SHA256
+    assert output_path.read_bytes() == PAYLOAD
+    assert not part_path.exists()
+    assert server.gets()[-1] == ("/recording.tar.xz", f"bytes={received}-")
+
+
+def test_retry_within_call_resumes_at_received_offset(server, tmp_path):
+    output_path = tmp_path / "recording.tar.xz"
+    server.disconnect_after = 200_000
+
+    with requests.Session() as session:
+        sha256 = dm.download_file(session, server.base_url + "recording.tar.xz", output_path, PAYLOAD_SHA256)
+
+    assert sha256 == PAYLOAD_SHA256
+    assert output_path.read_bytes() == PAYLOAD
+    ranges = [r for _, r in server.gets()]
+    assert ranges[0] is None
+    # Reprise à l'octet écrit, pas depuis le début
+    assert ranges[1].startswith("bytes=") and ranges[1] != "bytes=0-"
+
+
+def test_server_ignoring_range_restarts_from_zero(server, tmp_path):
+    output_path = tmp_path / "recording.tar.xz"
+    part_path = tmp_path / "recording.tar.xz.part"
+    # Préfixe qui ne correspond pas au fichier: doit être écrasé, pas complété
+    part_path.write_bytes(b"x" * 1000)
+    server.support_range = False
+
+    with requests.Session() as session:
+        sha256 = dm.download_file(session, server.base_url + "recording.tar.xz", output_path, PAYLOAD_SHA256)
+
+    assert sha256 == PAYLOAD_SHA256
+    assert output_path.read_bytes() == PAYLOAD
+    assert server.gets() == [("/recording.tar.xz", "bytes=1000-")]
+
+
+def test_checksum_mismatch_deletes_part(server, tmp_path):
+    output_path = tmp_path / "recording.tar.xz"
+
+    with requests.Session() as session:
+        with pytest.raises(ValueError, match="Checksum invalide"):
+            dm.download_file(session, server.base_url + "recording.tar.xz", output_path, "0" * 64)
+
+    assert not (tmp_path / "recording.tar.xz.part").exists()
+    assert not output_path.exists()
+
+
+def test_recorded_file_is_skipped(server, tmp_path):
+    state = dm.DownloadState(tmp_path / dm.STATE_FILE)
+    with requests.Session() as session:
+        checksums = dm.fetch_checksums(session, server.base_url)
+        first = dm.download_table(session, "recording", server.base_url, tmp_path, checksums, state)
+        downloads = len(server.gets())
+
+        # Nouvel état relu depuis .download_state.json
+        state = dm.DownloadState(tmp_path / dm.STATE_FILE)
+        second = dm.download_table(session, "recording", server.base_url, tmp_path, checksums, state)
+
+    assert first.startswith("✅")
+    assert "déjà vérifié" in second
+    assert len(server.gets()) == downloads
+
+
+def test_unrecorded_complete_file_is_verified_not_downloaded(server, tmp_path):
+    output_path = tmp_path / "recording.tar.xz"
+    output_path.write_bytes(PAYLOAD)
+    state = dm.DownloadState(tmp_path / dm.STATE_FILE)
+
+    with requests.Session() as session:
+        checksums = dm.fetch_checksums(session, server.base_url)
+        status = dm.download_table(session, "recording", server.base_url, tmp_path, checksums, state)
+
+    assert "déjà vérifié" in status
+    assert server.gets() == [("/SHA256SUMS", None)]
+    assert state.verified_hash(output_path) == PAYLOAD_SHA256
+
+
+def test_corrupt_unrecorded_file_is_downloaded_again(server, tmp_path):
+    output_path = tmp_path / "recording.tar.xz"
+    output_path.write_bytes(b"corrompu")
+    state = dm.DownloadState(tmp_path / dm.STATE_FILE)
+
+    with requests.Session() as session:
+        checksums = dm.fetch_checksums(session, server.base_url)
+        status = dm.download_table(session, "recording", server.base_url, tmp_path, checksums, state)
+
+    assert status.startswith("✅")
+    assert output_path.read_bytes() == PAYLOAD
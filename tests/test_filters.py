@@ -0,0 +1,129 @@
+"""
+Tests des filtres de recommandation (src/api/filters.py) appliqués par
+ALSRecommender.recommend_filtered.
+
+Facteurs fixés à la main: l'item i a le score N_ITEMS - i pour l'utilisateur
+0, l'ordre attendu se lit donc directement sur les item_ids.
+"""
+import numpy as np
+import pytest
+from scipy import sparse
+
+from api.filters import FilterSpec, compile_filter
+from api.tracks import TrackTable
+from models.als_model import PADDING_SCORE, ALSRecommender
+
+N_ITEMS = 20
+# Alpha occupe les 12 meilleurs scores; Beta et Gamma n'arrivent qu'ensuite
+ARTISTS = ["Alpha"] * 12 + ["Beta", "Gamma"] + ["Alpha"] * 6
+LIKED = [0]
+
+
+@pytest.fixture
+def tracks():
+    return TrackTable.from_names([f"{artist} - Titre {i}" for i, artist in enumerate(ARTISTS)])
+
+
+@pytest.fixture
+def model():
+    recommender = ALSRecommender(factors=2)
+    recommender.model.user_factors = np.array([[1.0, 0.0]], dtype=np.float32)
+    recommender.model.item_factors = np.stack(
+        [N_ITEMS - np.arange(N_ITEMS), np.zeros(N_ITEMS)], axis=1).astype(np.float32)
+    recommender.user_item_matrix = sparse.csr_matrix(
+        (np.ones(len(LIKED), dtype=np.float32), ([0] * len(LIKED), LIKED)), shape=(1, N_ITEMS))
+    recommender.is_fitted = True
+    return recommender
+
+
+def recommend(model, tracks, spec, n, filter_already_liked=False, exclude=None):
+    compiled = compile_filter(spec, tracks, N_ITEMS)
+    item_ids, scores = model.recommend_filtered(
+        [0], n, filter_already_liked, compiled.allowed, exclude, compiled.groups, compiled.max_per_group)
+    return item_ids[0], scores[0]
+
+
+def test_build_without_filter_returns_none():
+    assert FilterSpec.build() is None
+    assert FilterSpec.build(include_artists=["b", "a", "b"]).include_artists == ("a", "b")
+
+
+def test_include_artists(model, tracks):
+    spec = FilterSpec.build(include_artists=["gamma", " Beta "])
+    item_ids, scores = recommend(model, tracks, spec, n=3)
+
+    assert item_ids.tolist() == [12, 13, -1]
+    assert scores.tolist() == [N_ITEMS - 12, N_ITEMS - 13, PADDING_SCORE]
+
+
+def test_exclude_artists_and_items(model, tracks):
+    spec = FilterSpec.build(exclude_artists=["Alpha"], exclude_items=[12, -1, N_ITEMS + 5])
+    item_ids, _ = recommend(model, tracks, spec, n=3)
+
+    # Ids hors catalogue ignorés; seul Gamma reste
+    assert item_ids.tolist() == [13, -1, -1]
+
+
+def test_exclude_overrides_include(model, tracks):
+    spec = FilterSpec.build(include_artists=["Beta", "Gamma"], exclude_artists=["Beta"])
+    item_ids, _ = recommend(model, tracks, spec, n=2)
+
+    assert item_ids.tolist() == [13, -1]
+
+
+def test_per_user_exclude(model, tracks):
+    spec = FilterSpec.build(exclude_items=[1])
+    item_ids, _ = recommend(model, tracks, spec, n=3, exclude=[[0, 2]])
+
+    assert item_ids.tolist() == [3, 4, 5]
+
+
+def test_max_per_artist_reaches_into_tail(model, tracks):
+    # 4 × n candidats ne contiennent qu'Alpha: la fenêtre doit être élargie
+    spec = FilterSpec.build(max_per_artist=1)
+    item_ids, _ = recommend(model, tracks, spec, n=3)
+
+    assert item_ids.tolist() == [0, 12, 13]
+
+
+def test_max_per_artist_keeps_best_items_of_each_artist(model, tracks):
+    spec = FilterSpec.build(max_per_artist=2)
+    item_ids, scores = recommend(model, tracks, spec, n=5)
+
+    assert item_ids.tolist() == [0, 1, 12, 13, -1]
+    assert np.all(np.diff(scores[:4]) < 0)
+    assert scores[4] == PADDING_SCORE
+
+
+def test_max_per_artist_after_filter_liked(model, tracks):
+    # Un item déjà écouté est retiré avant le plafond: il ne consomme pas de place
+    spec = FilterSpec.build(max_per_artist=1)
+    item_ids, _ = recommend(model, tracks, spec, n=3, filter_already_liked=True)
+
+    assert item_ids.tolist() == [1, 12, 13]
+
+
+def test_max_per_artist_with_exclude_artists(model, tracks):
+    spec = FilterSpec.build(exclude_artists=["Beta"], max_per_artist=1)
+    item_ids, _ = recommend(model, tracks, spec, n=3)
+
+    assert item_ids.tolist() == [0, 13, -1]
+
+
+@pytest.mark.parametrize("max_per_artist", [None, 1])
+def test_no_eligible_items_returns_padding(model, tracks, max_per_artist):
+    spec = FilterSpec.build(include_artists=["Inconnu"], max_per_artist=max_per_artist)
+    item_ids, scores = recommend(model, tracks, spec, n=4)
+
+    assert item_ids.tolist() == [-1] * 4
+    assert np.all(scores == PADDING_SCORE)
+    # Ce que RecommendationService garde (scores > PADDING_SCORE): une liste vide
+    assert item_ids[scores > PADDING_SCORE].tolist() == []
+
+
+def test_no_eligible_items_after_filter_liked(model, tracks):
+    spec = FilterSpec.build(exclude_items=range(1, N_ITEMS))
+    item_ids, scores = recommend(model, tracks, spec, n=2, filter_already_liked=True)
+
+    assert item_ids.tolist() == [-1, -1]
+    assert np.all(scores == PADDING_SCORE)